@@ -2,8 +2,9 @@ import os
 import sys
 import requests
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 
 load_dotenv()
 
@@ -11,6 +12,13 @@ load_dotenv()
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, parent_dir)
 
+from rate_limiter import limit, carry_context
+from replay import replay
+from prompt_builder import PromptBuilder
+from http_client import http
+from cpu_pool import run_cpu_bound
+from data_processor import ijson, parse_clinical_trials_page, parse_clinical_trials_stream, rollup_trials
+
 try:
     from cache_manager import cache_manager
     from data_processor import summarize_clinical_trials
@@ -19,83 +27,181 @@ except ImportError:
     print("[Warning] Cache manager not found, running without cache")
     CACHE_ENABLED = False
 
-# LLM INITIALIZATION
-os.environ["GOOGLE_API_KEY"] = os.getenv("KANKAANNAA_GEMINI_API_KEY1")
+# ClinicalTrials.gov API v2 endpoint (point at a local stand-in for tests)
+CLINICALTRIALS_API_URL = os.getenv("CLINICALTRIALS_API_URL", "https://clinicaltrials.gov/api/v2/studies")
+
+# Studies per page (API maximum 1000) and the most trials fetched per molecule
+CLINICALTRIALS_PAGE_SIZE = int(os.getenv("CLINICALTRIALS_PAGE_SIZE", "1000"))
+CLINICALTRIALS_MAX_RECORDS = int(os.getenv("CLINICALTRIALS_MAX_RECORDS", "10000"))
+
+# Status queries paged at once when a molecule has many pages of studies
+CLINICALTRIALS_CONCURRENCY = int(os.getenv("CLINICALTRIALS_CONCURRENCY", "4"))
+
+# Pages left after the first up to which the query is simply paged on with the
+# first page's token; beyond this the rest is split into concurrent status queries
+CLINICALTRIALS_SEQUENTIAL_PAGES = int(os.getenv("CLINICALTRIALS_SEQUENTIAL_PAGES", "3"))
+
+# Only the fields study_to_trial reads, so pages stay small
+TRIAL_FIELDS = "NCTId,Phase,OverallStatus,StartDate,LeadSponsorName,EnrollmentCount,LocationCountry"
+
+# Every overall status, grouped so the rare ones share a query; together the
+# groups partition any query's results
+TRIAL_STATUS_GROUPS = [
+    "COMPLETED", "RECRUITING", "UNKNOWN", "TERMINATED", "ACTIVE_NOT_RECRUITING",
+    "NOT_YET_RECRUITING,ENROLLING_BY_INVITATION,WITHDRAWN",
+    "SUSPENDED,WITHHELD,AVAILABLE,NO_LONGER_AVAILABLE,TEMPORARILY_NOT_AVAILABLE,APPROVED_FOR_MARKETING",
+]
+
+# LLM INITIALIZATION (deferred until the first report needs it)
+_llm = None
+
+def get_llm():
+    """Build the Gemini client on first use so importing the agent stays cheap"""
+    global _llm
+    if _llm is None:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        _llm = ChatGoogleGenerativeAI(
+            model="gemini-2.5-flash",
+            temperature=0.3,
+            google_api_key=os.getenv("KANKAANNAA_GEMINI_API_KEY1"),
+        )
+    return _llm
+
+
+class _RecordBudget:
+    """Thread-safe count of records still wanted across concurrent queries"""
+
+    def __init__(self, limit):
+        self._remaining = limit
+        self._lock = threading.Lock()
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0.3,
-)
+    def remaining(self):
+        with self._lock:
+            return self._remaining
+
+    def take(self, wanted):
+        """Claim up to `wanted` records; returns how many were granted"""
+        with self._lock:
+            granted = max(0, min(wanted, self._remaining))
+            self._remaining -= granted
+            return granted
+
+
+def _fetch_page(params):
+    """
+    Fetch and parse one page of studies
+
+    Returns:
+        Tuple of (Trial records, nextPageToken or None, totalCount or None)
+    """
+    if ijson is not None:
+        with http.stream("GET", CLINICALTRIALS_API_URL, provider="clinicaltrials", params=params) as res:
+            res.raise_for_status()
+            # Studies are converted while the body is still downloading
+            return parse_clinical_trials_stream(res.raw)
+
+    res = http.get(CLINICALTRIALS_API_URL, provider="clinicaltrials", params=params)
+    res.raise_for_status()
+    # Without ijson, large bodies go to the process pool instead of holding the GIL here
+    return run_cpu_bound(parse_clinical_trials_page, res.content)
+
+
+def _fetch_query(params, budget, token=None, skip=frozenset()):
+    """
+    Follow nextPageToken for one query until it is exhausted or the budget is spent
 
+    Args:
+        params: Query parameters (without pageToken)
+        budget: _RecordBudget shared by every query of the same fetch
+        token: Page token to start from (None for the first page)
+        skip: NCT ids already collected; these studies are dropped, not counted again
+    """
+    trials = []
+    while budget.remaining() > 0:
+        page_params = dict(params, pageToken=token) if token else params
+        page, token, _ = _fetch_page(page_params)
+        if skip:
+            page = [trial for trial in page if trial.nct_id not in skip]
+        trials.extend(page[:budget.take(len(page))])
+        if not token:
+            break
+    return trials
+
+
+def _fetch_by_status(params, budget, skip):
+    """
+    Page every status group concurrently, skipping groups that fail
 
-def fetch_trials(molecule):
-    """Fetch trials using ClinicalTrials.gov API v2"""
-    url = "https://clinicaltrials.gov/api/v2/studies"
+    Returns:
+        Trial records in status group order
+    """
+    fetch = carry_context(_fetch_query)
+    trials = []
+    with ThreadPoolExecutor(max_workers=CLINICALTRIALS_CONCURRENCY,
+                            thread_name_prefix="clinicaltrials") as pool:
+        futures = [(status, pool.submit(fetch, dict(params, **{"filter.overallStatus": status}), budget, None, skip))
+                   for status in TRIAL_STATUS_GROUPS]
+        for status, future in futures:
+            try:
+                trials.extend(future.result())
+            except Exception as e:
+                print(f"[Clinical Trials] ✗ Skipping status {status}: {e}")
+    return trials
+
+
+def fetch_trials(molecule, max_records=None):
+    """
+    Fetch trials using ClinicalTrials.gov API v2, following every page
+
+    The first page is fetched on its own with countTotal, and its studies are
+    always kept. If only a few pages remain, the query is paged on from the
+    first page's token. With more, the query is split by overall status and
+    the statuses are paged concurrently (pages of a single query can only be
+    fetched one after another, since each needs the previous page's token);
+    studies already on the first page are dropped from the status results.
+    A status query that fails is skipped with a warning.
+
+    Args:
+        molecule: Search term
+        max_records: Stop after this many trials (default CLINICALTRIALS_MAX_RECORDS)
+
+    Returns:
+        List of Trial records
+    """
+    max_records = max_records or CLINICALTRIALS_MAX_RECORDS
     params = {
         "query.term": molecule,
-        "pageSize": 500,  # max 1000
+        "pageSize": min(CLINICALTRIALS_PAGE_SIZE, max_records),
+        "fields": TRIAL_FIELDS,
         "format": "json"
     }
 
     try:
         print(f"[Clinical Trials] Calling API v2 for '{molecule}'...")
-        res = requests.get(url, params=params, timeout=30)
-        res.raise_for_status()
-        
-        data = res.json()
-        
-        # New API structure
-        if "studies" not in data:
-            print(f"[Clinical Trials] ✗ Unexpected API response structure")
-            print(f"[Clinical Trials] Response keys: {data.keys()}")
-            return []
-        
-        # Convert new API format to match expected structure
-        trials = []
-        for study in data["studies"]:
-            protocol = study.get("protocolSection", {})
-            identification = protocol.get("identificationModule", {})
-            status = protocol.get("statusModule", {})
-            design = protocol.get("designModule", {})
-            sponsor = protocol.get("sponsorCollaboratorsModule", {})
-            locations = protocol.get("contactsLocationsModule", {})
-            
-            # Safely extract phases
-            phases = design.get("phases", [])
-            phase_value = phases[0] if phases else "Unknown"
-            
-            # Safely extract enrollment count
-            enrollment_info = design.get("enrollmentInfo", {})
-            enrollment_count = enrollment_info.get("count", 0)
-            
-            # Safely extract start date
-            start_date_struct = status.get("startDateStruct", {})
-            start_date = start_date_struct.get("date", "Unknown")
-            
-            trial = {
-                "Phase": [phase_value],
-                "OverallStatus": [status.get("overallStatus", "Unknown")],
-                "StartDate": [start_date],
-                "LeadSponsorName": [sponsor.get("leadSponsor", {}).get("name", "Unknown")],
-                "EnrollmentCount": [str(enrollment_count)],
-                "LocationCountry": []
-            }
-            
-            # Extract countries
-            if "locations" in locations:
-                countries = set()
-                for loc in locations["locations"]:
-                    if "country" in loc:
-                        countries.add(loc["country"])
-                trial["LocationCountry"] = list(countries)
-            
-            trials.append(trial)
-        
+        trials, next_token, total = _fetch_page(dict(params, countTotal="true"))
+        trials = trials[:max_records]
+        if next_token and len(trials) < max_records:
+            budget = _RecordBudget(max_records - len(trials))
+            wanted = min(total, max_records) if total else max_records
+            remaining_pages = -(-(wanted - len(trials)) // params["pageSize"])
+            if remaining_pages <= CLINICALTRIALS_SEQUENTIAL_PAGES:
+                print(f"[Clinical Trials] {total} studies; paging on for {remaining_pages} more pages")
+                try:
+                    trials += _fetch_query(params, budget, next_token)
+                except requests.exceptions.RequestException as e:
+                    print(f"[Clinical Trials] ⚠ Stopped paging after {len(trials)} studies: {e}")
+            else:
+                print(f"[Clinical Trials] {total} studies; fetching up to {max_records} by status, "
+                      f"{CLINICALTRIALS_CONCURRENCY} at a time")
+                trials += _fetch_by_status(params, budget, {trial.nct_id for trial in trials if trial.nct_id})
+            if total and len(trials) < wanted:
+                print(f"[Clinical Trials] ⚠ Returned {len(trials)} of {wanted} studies")
+
         print(f"[Clinical Trials] ✓ Found {len(trials)} trials")
         return trials
         
-    except requests.exceptions.Timeout:
-        print(f"[Clinical Trials] ✗ API timeout after 30 seconds")
+    except requests.exceptions.Timeout as e:
+        print(f"[Clinical Trials] ✗ API timeout: {e}")
         return []
     except requests.exceptions.RequestException as e:
         print(f"[Clinical Trials] ✗ API request failed: {e}")
@@ -109,84 +215,25 @@ def fetch_trials(molecule):
 
 
 def analyze_trials(trials):
-    phase_count = {}
-    status_count = {}
-    sponsor_count = {}
-    year_count = {}
-    country_count = {}
-    enrollment_total = 0
-
-    for t in trials:
-
-        # ----- Phase -----
-        phase = t.get("Phase", ["Unknown"])[0]
-        phase_count[phase] = phase_count.get(phase, 0) + 1
-
-        # ----- Status -----
-        status = t.get("OverallStatus", ["Unknown"])[0]
-        status_count[status] = status_count.get(status, 0) + 1
-
-        # ----- Sponsor -----
-        sponsor = t.get("LeadSponsorName", ["Unknown"])[0]
-        sponsor_count[sponsor] = sponsor_count.get(sponsor, 0) + 1
-
-        # ----- Start Date → Year -----
-        if "StartDate" in t and t["StartDate"]:
-            date_str = t["StartDate"][0]
-            year = date_str.split("-")[0]
-            year_count[year] = year_count.get(year, 0) + 1
-
-        # ----- Country -----
-        if "LocationCountry" in t:
-            for country in t["LocationCountry"]:
-                country_count[country] = country_count.get(country, 0) + 1
-
-        # ----- Enrollment -----
-        if "EnrollmentCount" in t:
-            if t["EnrollmentCount"]:
-                try:
-                    enrollment_total += int(t["EnrollmentCount"][0])
-                except:
-                    pass
-
-    return {
-        "phase_count": phase_count,
-        "status_count": status_count,
-        "sponsor_count": sponsor_count,
-        "year_count": year_count,
-        "country_count": country_count,
-        "enrollment_total": enrollment_total,
-        "total_trials": len(trials),
-    }
+    return rollup_trials(trials)
 
 
 def generate_clinical_report(molecule, data):
-    prompt = f"""
+    # Sections are trimmed to the agent's token budget, keeping the largest counts
+    prompt = PromptBuilder("clinical_trials")
+    prompt.text(f"""
 You are the Clinical Trials Intelligence Agent.
 
 Below is REAL clinical trial data for molecule: **{molecule}**
-
-=== TRIAL PHASE BREAKDOWN ===
-{data['phase_count']}
-
-=== TRIAL STATUS BREAKDOWN ===
-{data['status_count']}
-
-=== TOP SPONSORS ===
-{data['sponsor_count']}
-
-=== YEARWISE TREND (Start Dates) ===
-{data['year_count']}
-
-=== COUNTRY DISTRIBUTION ===
-{data['country_count']}
-
-=== TOTAL ENROLLMENT ===
-{data['enrollment_total']}
-
-=== TOTAL TRIALS ===
-{data['total_trials']}
-
+""")
+    prompt.section("TRIAL PHASE BREAKDOWN", data['phase_count'])
+    prompt.section("TRIAL STATUS BREAKDOWN", data['status_count'])
+    prompt.section("TOP SPONSORS", data['sponsor_count'], weight=2)
+    prompt.section("YEARWISE TREND (Start Dates)", data['year_count'], weight=2, chronological=True)
+    prompt.section("COUNTRY DISTRIBUTION", data['country_count'], weight=2)
+    prompt.section("TOTAL ENROLLMENT", data['enrollment_total'])
+    prompt.section("TOTAL TRIALS", data['total_trials'])
+    prompt.text("""
 Using the real data above, generate a structured, factual Clinical Trials Report including:
 
 1. Total trials
@@ -199,10 +246,11 @@ Using the real data above, generate a structured, factual Clinical Trials Report
 8. Clinical landscape summary (80–120 words)
 
 DO NOT hallucinate numbers beyond the provided dataset.
-"""
+""")
+    prompt = prompt.build()
 
-    response = llm.invoke(prompt)
-    return response.content
+    with limit("gemini", os.getenv("KANKAANNAA_GEMINI_API_KEY1")):
+        return replay.llm("gemini", prompt, lambda: get_llm().invoke(prompt).content)
 
 
 # Add RAG module to path
@@ -250,8 +298,9 @@ def run_clinical_trials_agent(molecule, query: str = ""):
     """
     
     try:
-        # Pass the specific agent key to rag_query
-        response = rag_query(rag_q, api_key=agent_key)
+        # Pass the specific agent key to rag_query (one embed + one generate call)
+        with limit("gemini", agent_key, cost=2):
+            response = replay.llm("rag", rag_q, lambda: rag_query(rag_q, api_key=agent_key))
         report = response.get("answer", "No answer generated.")
     except Exception as e:
         print(f"[Clinical Trials Agent] RAG Error: {e}")
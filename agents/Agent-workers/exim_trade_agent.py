@@ -1,54 +1,146 @@
 import os
 import sys
-import requests
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 
 load_dotenv()
 
-# Load Gemini API key (for LLM)
-os.environ["GOOGLE_API_KEY"] = os.getenv("KANKAANNAA_GEMINI_API_KEY2")
+# Add parent directory to import shared helpers
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+from rate_limiter import limit, carry_context
+from replay import replay
+from prompt_builder import PromptBuilder
+from http_client import http
+from data_processor import rollup_trade, trade_record
+
+try:
+    from cache_manager import cache_manager
+    CACHE_ENABLED = True
+except ImportError:
+    print("[Warning] Cache manager not found, running without cache")
+    CACHE_ENABLED = False
+
 # Load UN Comtrade public-v1 subscription key
 COMTRADE_KEY = os.getenv("COMTRADE_API_KEY")
+COMTRADE_API_URL = os.getenv("COMTRADE_API_URL", "https://comtrade.un.org/api/get")
+
+# (connect, read) timeouts in seconds, so one hung year cannot block the agent
+COMTRADE_TIMEOUT = (5, float(os.getenv("COMTRADE_TIMEOUT", "30")))
+
+# Retries per request on 429/5xx and network errors (backoff as in http_client)
+COMTRADE_RETRIES = int(os.getenv("COMTRADE_RETRIES", "4"))
+
+# (HS code, year) requests in flight at once (the comtrade rate limit still applies)
+COMTRADE_CONCURRENCY = int(os.getenv("COMTRADE_CONCURRENCY", "4"))
+
+_llm = None
+
+def get_llm():
+    """Build the Gemini client on first use so importing the agent stays cheap"""
+    global _llm
+    if _llm is None:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        _llm = ChatGoogleGenerativeAI(
+            model="gemini-2.5-flash",
+            temperature=0.3,
+            google_api_key=os.getenv("KANKAANNAA_GEMINI_API_KEY2"),
+        )
+    return _llm
+
+def _get_year(hs_code, year, reporter, partner):
+    """
+    One Comtrade request, retried by the shared HTTP client on 429/5xx and network errors
+
+    Returns:
+        List of trade records for the HS code and year
+
+    Raises:
+        requests.RequestException: Once COMTRADE_RETRIES retries are used up
+    """
+    params = {
+        "type": "C",
+        "freq": "A",
+        "px": "HS",
+        "ps": year,
+        "r": reporter,
+        "p": partner,
+        "rg": "1,2",       # 1 = Import, 2 = Export
+        "cc": hs_code,
+        "fmt": "json"
+    }
+    headers = {}
+    if COMTRADE_KEY:
+        headers["Ocp-Apim-Subscription-Key"] = COMTRADE_KEY
+
+    resp = http.get(COMTRADE_API_URL, provider="comtrade", params=params, headers=headers,
+                    timeout=COMTRADE_TIMEOUT, retries=COMTRADE_RETRIES)
+    resp.raise_for_status()
+    return resp.json().get("dataset", [])
+
+
+class _EmptyYear(Exception):
+    """Comtrade returned no records, so the response is not cached under the year's policy"""
+
+
+def _fetch_year(hs_code, year, reporter, partner):
+    """
+    Comtrade records for one HS code and year, from the response cache when possible
+
+    Empty responses (no data yet, or an error reported in the body) are only
+    remembered for the short ComtradeEmpty TTL, never the 30-90 days of a
+    real year.
+    """
+    if not CACHE_ENABLED:
+        return _get_year(hs_code, year, reporter, partner)
+    params = {"year": year, "reporter": reporter, "partner": partner}
+    if cache_manager.get("ComtradeEmpty", str(hs_code), **params) is not None:
+        return []
+
+    def load():
+        records = _get_year(hs_code, year, reporter, partner)
+        if not records:
+            raise _EmptyYear()
+        return records
+
+    # The current and previous year are still being revised; older years are final
+    policy = "ComtradeRecent" if int(year) >= datetime.now().year - 1 else "Comtrade"
+    try:
+        data, _ = cache_manager.fetch(policy, str(hs_code), load, **params)
+    except _EmptyYear:
+        cache_manager.set("ComtradeEmpty", str(hs_code), [], **params)
+        return []
+    return data
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0.3,
-)
 
 def fetch_trade_data(hs_code: str, years: list[int], reporter: str = "all", partner: str = "0"):
     """
-    hs_code: HS commodity code (string), e.g. "300490"
+    hs_code: HS commodity code (string), e.g. "300490", or several comma-separated
     years: list of years (e.g. [2020, 2021, 2022, 2023])
     reporter: reporter country code or "all"
     partner: partner country code or "0" for world
-    Returns list of trade data entries (dicts)
+    Returns list of TradeRow records
+
+    Each (HS code, year) is fetched concurrently (COMTRADE_CONCURRENCY at a time,
+    within the comtrade rate limit) and cached by (hs_code, year, reporter, partner).
+    A year that still fails after retries is skipped with a warning.
     """
-    all_data = []
-    headers = {}
-    if COMTRADE_KEY:
-        headers["Ocp-Apim-Subscription-Key"] = COMTRADE_KEY
+    codes = [c.strip() for c in (hs_code.split(",") if isinstance(hs_code, str) else hs_code) if str(c).strip()]
+    tasks = [(code, year) for code in codes for year in years]
+    if not tasks:
+        return []
 
-    for year in years:
-        url = "https://comtrade.un.org/api/get"
-        params = {
-            "type": "C",
-            "freq": "A",
-            "px": "HS",
-            "ps": year,
-            "r": reporter,
-            "p": partner,
-            "rg": "1,2",       # 1 = Import, 2 = Export
-            "cc": hs_code,
-            "fmt": "json"
-        }
-        try:
-            resp = requests.get(url, params=params, headers=headers)
-            resp.raise_for_status()
-            data = resp.json().get("dataset", [])
-            all_data.extend(data)
-        except Exception as e:
-            print(f"[WARN] Error fetching data for year {year}: {e}")
+    all_data = []
+    fetch = carry_context(_fetch_year)
+    with ThreadPoolExecutor(max_workers=min(COMTRADE_CONCURRENCY, len(tasks)), thread_name_prefix="comtrade") as pool:
+        futures = [pool.submit(fetch, code, year, reporter, partner) for code, year in tasks]
+        for (code, year), future in zip(tasks, futures):
+            try:
+                all_data.extend(map(trade_record, future.result()))
+            except Exception as e:
+                print(f"[WARN] Error fetching data for HS {code}, year {year}: {e}")
 
     return all_data
 
@@ -56,60 +148,33 @@ def fetch_trade_data(hs_code: str, years: list[int], reporter: str = "all", part
 # 2️⃣ Analyze trade data
 # ----------------------------------------
 def analyze_trade(trades):
-    yearly = {}
-    exporters = {}
-    importers = {}
-    total_value = 0.0
-
-    for d in trades:
-        year = d.get("yr")
-        trade_value = d.get("TradeValue", 0)
-        flow = d.get("rgDesc", "").lower()  # “Import” or “Export”
-        reporter = d.get("rtTitle", "Unknown")
-        # partner = d.get("ptTitle", "Unknown")  # not used currently
-
-        if year not in yearly:
-            yearly[year] = {"import": 0.0, "export": 0.0}
-
-        if flow == "import":
-            yearly[year]["import"] += trade_value
-            importers[reporter] = importers.get(reporter, 0.0) + trade_value
-        elif flow == "export":
-            yearly[year]["export"] += trade_value
-            exporters[reporter] = exporters.get(reporter, 0.0) + trade_value
-
-        total_value += trade_value
-
+    rollup = rollup_trade(trades)
     return {
-        "yearly_trade": yearly,
-        "top_exporters": exporters,
-        "top_importers": importers,
-        "total_trade_value": total_value
+        "yearly_trade": rollup["yearly_trade"],
+        "top_exporters": rollup["top_exporters"],
+        "top_importers": rollup["top_importers"],
+        "total_trade_value": rollup["total_trade_value"]
     }
 
 # ----------------------------------------
 # 3️⃣ Generate human-friendly trade report via LLM
 # ----------------------------------------
 def generate_trade_report(hs_code: str, molecule_name: str, trade_data):
-    prompt = f"""
+    # Sections are trimmed to the agent's token budget, keeping the largest values
+    prompt = PromptBuilder("trade")
+    prompt.text(f"""
 You are the EXIM Trade Intelligence Agent.
 
 Molecule / Drug (or class): **{molecule_name}**  
 HS Code used for query: **{hs_code}**
 
 Here is the real trade data fetched from UN Comtrade (import/export values in USD):
-
-Year-wise trade data (Import & Export):
-{trade_data['yearly_trade']}
-
-Top exporting countries:
-{trade_data['top_exporters']}
-
-Top importing countries:
-{trade_data['top_importers']}
-
-Total trade value across selected years: {trade_data['total_trade_value']}
-
+""")
+    prompt.section("Year-wise trade data (Import & Export)", trade_data['yearly_trade'], weight=2, chronological=True)
+    prompt.section("Top exporting countries", trade_data['top_exporters'])
+    prompt.section("Top importing countries", trade_data['top_importers'])
+    prompt.section("Total trade value across selected years", trade_data['total_trade_value'])
+    prompt.text("""
 Based on this data, provide:
 
 1. A summary of global demand and supply signals for this drug (or drug class).  
@@ -120,8 +185,10 @@ Based on this data, provide:
 6. Present results in clean markdown format.
 
 Do not hallucinate — only use the provided data.
-"""
-    return llm.invoke(prompt).content
+""")
+    prompt = prompt.build()
+    with limit("gemini", os.getenv("KANKAANNAA_GEMINI_API_KEY2")):
+        return replay.llm("gemini", prompt, lambda: get_llm().invoke(prompt).content)
 
 # ----------------------------------------
 # 4️⃣ Main function
@@ -155,7 +222,8 @@ def run_exim_agent(molecule: str, hs_code: str, years: list[int], query: str = "
     """
     
     try:
-        response = rag_query(rag_q, api_key=agent_key)
+        with limit("gemini", agent_key, cost=2):
+            response = replay.llm("rag", rag_q, lambda: rag_query(rag_q, api_key=agent_key))
         report = response.get("answer", "No answer.")
     except Exception as e:
         print(f"RAG Error: {e}")
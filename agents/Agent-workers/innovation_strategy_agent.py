@@ -1,15 +1,30 @@
 import os
+import sys
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 
 load_dotenv()
 
-os.environ["GOOGLE_API_KEY"] = os.getenv("ARIJIT_GEMINI_API_KEY2")
+# Add parent directory to import shared helpers
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0.3,
-)
+from rate_limiter import limit
+from replay import replay
+from prompt_builder import PromptBuilder
+
+_llm = None
+
+def get_llm():
+    """Build the Gemini client on first use so importing the agent stays cheap"""
+    global _llm
+    if _llm is None:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        _llm = ChatGoogleGenerativeAI(
+            model="gemini-2.5-flash",
+            temperature=0.3,
+            google_api_key=os.getenv("ARIJIT_GEMINI_API_KEY2"),
+        )
+    return _llm
 
 def run_innovation_strategy_agent(
     molecule: str,
@@ -24,29 +39,29 @@ def run_innovation_strategy_agent(
     Innovation Strategy Agent - synthesizes all data to generate strategic opportunities
     """
     
-    # Build context from all available data
-    context_parts = []
-    if market_data:
-        context_parts.append(f"**Market Insights:**\n{market_data[:500]}...")
-    if clinical_data:
-        context_parts.append(f"**Clinical Trials:**\n{clinical_data[:500]}...")
-    if patent_data:
-        context_parts.append(f"**Patent Landscape:**\n{patent_data[:500]}...")
-    if trade_data:
-        context_parts.append(f"**Trade Data:**\n{trade_data[:500]}...")
-    if web_data:
-        context_parts.append(f"**Web Intelligence:**\n{web_data[:500]}...")
-    if internal_data:
-        context_parts.append(f"**Internal Knowledge:**\n{internal_data[:500]}...")
-    
-    context = "\n\n".join(context_parts) if context_parts else "Limited data available"
-    
-    prompt = f"""
+    # Each agent report gets a share of the token budget; short reports pass
+    # their unused share on, and long ones keep their leading lines
+    prompt = PromptBuilder("innovation_strategy")
+    prompt.text(f"""
 You are the Innovation Strategy Agent. Based on comprehensive analysis of {molecule}, generate strategic innovation opportunities.
 
 Available Intelligence:
-{context}
+""")
+    reports = [
+        ("Market Insights", market_data),
+        ("Clinical Trials", clinical_data),
+        ("Patent Landscape", patent_data),
+        ("Trade Data", trade_data),
+        ("Web Intelligence", web_data),
+        ("Internal Knowledge", internal_data),
+    ]
+    for title, report in reports:
+        if report:
+            prompt.section(title, report)
+    if not any(report for _, report in reports):
+        prompt.text("Limited data available")
 
+    prompt.text("""
 Generate exactly 4-6 specific, actionable innovation opportunities. For EACH opportunity provide:
 - **Title**: A clear, compelling opportunity name (4-8 words)
 - **Description**: A concise 2-3 sentence explanation of the opportunity, backed by data insights
@@ -54,10 +69,10 @@ Generate exactly 4-6 specific, actionable innovation opportunities. For EACH opp
 Format your response as a JSON array of opportunities:
 ```json
 [
-  {{
+  {
     "title": "Market Opportunity Title",
     "description": "Detailed description with specific insights from the data..."
-  }},
+  },
   ...
 ]
 ```
@@ -71,11 +86,13 @@ Focus on:
 6. Strategic positioning recommendations
 
 Be specific, data-driven, and actionable. Only output the JSON array, nothing else.
-"""
+""")
+    prompt = prompt.build()
     
     try:
-        response = llm.invoke(prompt)
-        content = response.content.strip()
+        with limit("gemini", os.getenv("ARIJIT_GEMINI_API_KEY2")):
+            content = replay.llm("gemini", prompt, lambda: get_llm().invoke(prompt).content)
+        content = content.strip()
         
         # Extract JSON from markdown code blocks if present
         if "```json" in content:
@@ -1,17 +1,30 @@
 import os
 import sys
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 
 load_dotenv()
 
-# Set key specifically for running direct LLM if needed, though we use RAG mostly now.
-os.environ["GOOGLE_API_KEY"] = os.getenv("ARIJIT_GEMINI_API_KEY2")
+# Add parent directory to import shared helpers
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0.3,
-)
+from rate_limiter import limit
+from replay import replay
+
+# Direct LLM client, only built if the agent calls Gemini outside RAG
+_llm = None
+
+def get_llm():
+    """Build the Gemini client on first use so importing the agent stays cheap"""
+    global _llm
+    if _llm is None:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        _llm = ChatGoogleGenerativeAI(
+            model="gemini-2.5-flash",
+            temperature=0.3,
+            google_api_key=os.getenv("ARIJIT_GEMINI_API_KEY2"),
+        )
+    return _llm
 
 # Add RAG module to path
 rag_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "RAG")
@@ -45,7 +58,8 @@ def run_internal_knowledge_agent(molecule: str, query: str = ""):
     """
     
     try:
-        response = rag_query(rag_q, api_key=agent_key)
+        with limit("gemini", agent_key, cost=2):
+            response = replay.llm("rag", rag_q, lambda: rag_query(rag_q, api_key=agent_key))
         print(f"[Internal Knowledge Agent] ✓ Complete")
         return response.get("answer", "No answer.")
     except Exception as e:
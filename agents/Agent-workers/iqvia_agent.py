@@ -1,20 +1,31 @@
 import os
 import sys
 import requests
-import yfinance as yf
 from datetime import datetime
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 
 load_dotenv()
 
-# GEMINI API KEY
-os.environ["GOOGLE_API_KEY"] = os.getenv("BIKRAM_GEMINI_API_KEY1")
+# Add parent directory to import shared helpers
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0.3,
-)
+from rate_limiter import limit
+from replay import replay
+
+_llm = None
+
+def get_llm():
+    """Build the Gemini client on first use so importing the agent stays cheap"""
+    global _llm
+    if _llm is None:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        _llm = ChatGoogleGenerativeAI(
+            model="gemini-2.5-flash",
+            temperature=0.3,
+            google_api_key=os.getenv("BIKRAM_GEMINI_API_KEY1"),
+        )
+    return _llm
 
 # Helper functions for legacy/reference (optional, but keeping for safety if referenced elsewhere, though unlikely)
 def get_competitors(molecule):
@@ -63,7 +74,8 @@ def generate_final_report(molecule, query: str = ""):
     """
     
     try:
-        response = rag_query(rag_q, api_key=agent_key)
+        with limit("gemini", agent_key, cost=2):
+            response = replay.llm("rag", rag_q, lambda: rag_query(rag_q, api_key=agent_key))
         report = response.get("answer", "No answer.")
     except Exception as e:
         print(f"RAG Error: {e}")
@@ -1,115 +1,168 @@
 import os
 import sys
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 
 load_dotenv()
 
-# Gemini API Key
-os.environ["GOOGLE_API_KEY"] = os.getenv("BIKRAM_GEMINI_API_KEY2")
-
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0.3,
-)
-
-
-def fetch_patents(molecule):
-    url = "https://api.patentsview.org/patents/query"
+# Add parent directory to import shared helpers
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+from rate_limiter import limit, carry_context
+from replay import replay
+from prompt_builder import PromptBuilder
+from http_client import http
+from data_processor import PatentAggregate, patent_record, rollup_patents
+
+PATENTSVIEW_API_URL = os.getenv("PATENTSVIEW_API_URL", "https://api.patentsview.org/patents/query")
+
+# Patents per page and the most read per molecule
+PATENTSVIEW_PAGE_SIZE = int(os.getenv("PATENTSVIEW_PAGE_SIZE", "1000"))
+PATENTSVIEW_MAX_RECORDS = int(os.getenv("PATENTSVIEW_MAX_RECORDS", "10000"))
+
+# Pages fetched at once (the patentsview rate limit still applies)
+PATENTSVIEW_CONCURRENCY = int(os.getenv("PATENTSVIEW_CONCURRENCY", "3"))
+
+# Only the fields PatentAggregate reads
+PATENT_FIELDS = [
+    "patent_title",
+    "patent_date",
+    "cpcs.cpc_subsection_id",
+    "assignees.assignee_organization",
+    "assignees.assignee_country",
+]
+
+_llm = None
+
+def get_llm():
+    """Build the Gemini client on first use so importing the agent stays cheap"""
+    global _llm
+    if _llm is None:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        _llm = ChatGoogleGenerativeAI(
+            model="gemini-2.5-flash",
+            temperature=0.3,
+            google_api_key=os.getenv("BIKRAM_GEMINI_API_KEY2"),
+        )
+    return _llm
+
+
+def fetch_patent_page(molecule, page, per_page=PATENTSVIEW_PAGE_SIZE):
+    """
+    Fetch one page of patents whose title mentions the molecule
 
+    Returns:
+        Tuple of (Patent records, total matching patents)
+    """
     query = {
         "q": {
             "_text_any": {
                 "patent_title": molecule
             }
         },
-        "f": [
-            "patent_title",
-            "patent_date",
-            "cpcs.cpc_subsection_id",
-            "assignees.assignee_organization",
-            "assignees.assignee_country",
-            "inventors.inventor_country",
-            "patent_id"
-        ],
-        "o": {"per_page": 200}
+        "f": PATENT_FIELDS,
+        "o": {"page": page, "per_page": per_page}
     }
+    response = http.post(PATENTSVIEW_API_URL, provider="patentsview", json=query)
+    response.raise_for_status()
+    data = response.json()
+    patents = [patent_record(p) for p in data.get("patents") or []]
+    return patents, data.get("total_patent_count", len(patents))
 
-    try:
-        response = requests.post(url, json=query).json()
-        return response.get("patents", [])
-    except:
-        return []
 
+def _fetch_pages(molecule, add_page, max_records=None):
+    """
+    Fetch every page up to max_records, PATENTSVIEW_CONCURRENCY pages at a time
 
-def analyze_patents(patents):
-    assignee_count = {}
-    country_count = {}
-    cpc_count = {}
-    year_count = {}
-
-    titles = []
-
-    for p in patents:
-        # -------- Titles --------
-        if "patent_title" in p:
-            titles.append(p["patent_title"])
-
-        # -------- Filing Year --------
-        if "patent_date" in p:
-            year = p["patent_date"].split("-")[0]
-            year_count[year] = year_count.get(year, 0) + 1
-
-        # -------- Assignees --------
-        if "assignees" in p:
-            for a in p["assignees"]:
-                org = a.get("assignee_organization", "Unknown")
-                assignee_count[org] = assignee_count.get(org, 0) + 1
-
-                country = a.get("assignee_country", "Unknown")
-                country_count[country] = country_count.get(country, 0) + 1
-
-        # -------- CPC Codes --------
-        if "cpcs" in p:
-            for c in p["cpcs"]:
-                code = c.get("cpc_subsection_id", "Unknown")
-                cpc_count[code] = cpc_count.get(code, 0) + 1
-
-    return {
-        "total_patents": len(patents),
-        "assignee_count": assignee_count,
-        "country_count": country_count,
-        "cpc_count": cpc_count,
-        "year_count": year_count,
-        "titles": titles[:10],   # top 10 titles
-    }
+    Each page is passed to `add_page` on the calling thread as soon as it
+    arrives (in completion order) and is dropped afterwards, so only the pages
+    in flight are held in memory. A page that still fails after retries is
+    skipped with a warning.
 
+    Returns:
+        Number of pages read
+    """
+    max_records = max_records or PATENTSVIEW_MAX_RECORDS
+    per_page = min(PATENTSVIEW_PAGE_SIZE, max_records)
+    try:
+        patents, total = fetch_patent_page(molecule, 1, per_page)
+    except (requests.RequestException, ValueError) as e:
+        print(f"[Patent] ✗ Error fetching patents for '{molecule}': {e}")
+        return 0
+
+    wanted = min(total, max_records)
+    pages = -(-wanted // per_page)
+    print(f"[Patent] {total} patents for '{molecule}'; reading {wanted} in {pages} pages")
+    add_page(patents[:wanted])
+    del patents
+    read = 1
+    if pages <= 1:
+        return read
+
+    def fetch(page):
+        page_patents, _ = fetch_patent_page(molecule, page, per_page)
+        return page_patents[:wanted - (page - 1) * per_page]
+
+    fetch = carry_context(fetch)
+    with ThreadPoolExecutor(max_workers=PATENTSVIEW_CONCURRENCY, thread_name_prefix="patentsview") as pool:
+        futures = {pool.submit(fetch, page): page for page in range(2, pages + 1)}
+        for future in as_completed(futures):
+            try:
+                page_patents = future.result()
+            except Exception as e:
+                print(f"[Patent] ✗ Skipping page {futures[future]} for '{molecule}': {e}")
+                continue
+            add_page(page_patents)
+            read += 1
+    return read
+
+
+def aggregate_patents(molecule, max_records=None):
+    """
+    Patent landscape for a molecule, streamed page by page into a PatentAggregate
 
-def generate_patent_report(molecule, data):
-    prompt = f"""
-You are the Patent Intelligence Agent.
+    Every page is added to one running aggregate as it arrives, so only the
+    aggregate and the pages in flight are held in memory, and counts cover
+    the whole portfolio (up to max_records) at constant memory.
 
-Below is real patent data for molecule: {molecule}
+    Args:
+        molecule: Title search term
+        max_records: Stop after this many patents (default PATENTSVIEW_MAX_RECORDS)
+
+    Returns:
+        PatentAggregate (call .result() for the analyze_patents-style summary)
+    """
+    aggregate = PatentAggregate()
+    _fetch_pages(molecule, aggregate.add_page, max_records)
+    return aggregate
 
-=== TOTAL PATENTS ===
-{data['total_patents']}
 
-=== TOP ASSIGNEES ===
-{data['assignee_count']}
+def analyze_patents(patents):
+    return rollup_patents(patents)
 
-=== COUNTRY DISTRIBUTION ===
-{data['country_count']}
 
-=== CPC TECHNOLOGY CLASSES ===
-{data['cpc_count']}
+def analyze_patent_landscape(molecule, max_records=None):
+    """analyze_patents output for every page of a molecule's patents, without holding the records"""
+    return aggregate_patents(molecule, max_records).result()
 
-=== YEARWISE PATENT TREND ===
-{data['year_count']}
 
-=== SAMPLE TITLES ===
-{data['titles']}
+def generate_patent_report(molecule, data):
+    # Sections are trimmed to the agent's token budget, keeping the largest counts
+    prompt = PromptBuilder("patent")
+    prompt.text(f"""
+You are the Patent Intelligence Agent.
 
+Below is real patent data for molecule: {molecule}
+""")
+    prompt.section("TOTAL PATENTS", data['total_patents'])
+    prompt.section("TOP ASSIGNEES", data['assignee_count'], weight=2)
+    prompt.section("COUNTRY DISTRIBUTION", data['country_count'])
+    prompt.section("CPC TECHNOLOGY CLASSES", data['cpc_count'])
+    prompt.section("YEARWISE PATENT TREND", data['year_count'], weight=2, chronological=True)
+    prompt.section("SAMPLE TITLES", data['titles'])
+    prompt.text("""
 Generate a structured Patent Intelligence Report including:
 
 1. Total patent count
@@ -121,9 +174,11 @@ Generate a structured Patent Intelligence Report including:
 7. 80–120 word Patent Landscape Summary
 
 Use only the provided data. Do NOT hallucinate missing numbers.
-"""
+""")
+    prompt = prompt.build()
 
-    return llm.invoke(prompt).content
+    with limit("gemini", os.getenv("BIKRAM_GEMINI_API_KEY2")):
+        return replay.llm("gemini", prompt, lambda: get_llm().invoke(prompt).content)
 
 
 # Add RAG module to path
@@ -156,7 +211,8 @@ def run_patent_agent(molecule, query: str = ""):
     """
     
     try:
-        response = rag_query(rag_q, api_key=agent_key)
+        with limit("gemini", agent_key, cost=2):
+            response = replay.llm("rag", rag_q, lambda: rag_query(rag_q, api_key=agent_key))
         report = response.get("answer", "No answer.")
     except Exception as e:
         print(f"RAG Error: {e}")
@@ -1,24 +1,41 @@
 import os
 import sys
-import requests
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 
 load_dotenv()
 
-# Load keys
-os.environ["GOOGLE_API_KEY"] = os.getenv("KANKAANNAA_GEMINI_API_KEY3")
+# Add parent directory to import shared helpers
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+from rate_limiter import limit
+from replay import replay
+from http_client import http
+from news_store import news_store, article_id
+
 NEWS_API_KEY = os.getenv("NEWS_API_KEY") 
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0.3,
-)
+_llm = None
+
+def get_llm():
+    """Build the Gemini client on first use so importing the agent stays cheap"""
+    global _llm
+    if _llm is None:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        _llm = ChatGoogleGenerativeAI(
+            model="gemini-2.5-flash",
+            temperature=0.3,
+            google_api_key=os.getenv("KANKAANNAA_GEMINI_API_KEY3"),
+        )
+    return _llm
 
 # ----------------------------------------
 # 1️⃣ Fetch news articles via NewsAPI
 # ----------------------------------------
-def fetch_news_articles(query: str, page_size: int = 20, language: str = "en"):
+def _fetch_news_since(query: str, since=None, page_size: int = 20, language: str = "en"):
+    """Newest articles for a query, only those published at or after `since` when given (raises on error)"""
+    if not NEWS_API_KEY:
+        raise RuntimeError("NEWS_API_KEY is not set")
     url = "https://newsapi.org/v2/everything"
     params = {
         "q": query,
@@ -27,15 +44,39 @@ def fetch_news_articles(query: str, page_size: int = 20, language: str = "en"):
         "language": language,
         "apiKey": NEWS_API_KEY
     }
+    if since:
+        params["from"] = since
+    resp = http.get(url, provider="newsapi", params=params)
+    resp.raise_for_status()
+    data = resp.json()
+    return data.get("articles", [])
+
+def fetch_news_articles(query: str, page_size: int = 20, language: str = "en"):
     try:
-        resp = requests.get(url, params=params)
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("articles", [])
+        return _fetch_news_since(query, page_size=page_size, language=language)
     except Exception as e:
         print(f"[WARN] Error fetching news for query '{query}': {e}")
         return []
 
+def refresh_news(target: str, page_size: int = 20, force: bool = False):
+    """
+    Bring the target's news store up to date with one delta fetch
+
+    Only articles published since the newest stored one are requested, and
+    articles already stored under the same URL or title are dropped.
+
+    Returns:
+        Stored articles, newest first (the previous ones if the fetch fails)
+    """
+    try:
+        _, articles = news_store.update(
+            target, lambda since: _fetch_news_since(target, since, page_size), force=force
+        )
+        return articles
+    except Exception as e:
+        print(f"[WARN] Error refreshing news for '{target}': {e}")
+        return news_store.articles(target)
+
 # ----------------------------------------
 # 2️⃣ Generate report via LLM
 # ----------------------------------------
@@ -65,7 +106,8 @@ Please produce:
 
 Output everything in clean markdown.
 """
-    return llm.invoke(prompt).content
+    with limit("gemini", os.getenv("KANKAANNAA_GEMINI_API_KEY3")):
+        return replay.llm("gemini", prompt, lambda: get_llm().invoke(prompt).content)
 
 # ----------------------------------------
 # 3️⃣ Main function
@@ -76,15 +118,71 @@ sys.path.append(rag_path)
 
 try:
     from app.rag import rag_query
+    from app.ingest import ingest_documents
+    from app.utils.chunker import chunk_text
+    from app.utils.vectorstore import COLLECTION_NAME, NEWS_COLLECTION_NAME
+    # The knowledge base (including the newsAPI.json snapshot) plus incrementally ingested news
+    RAG_COLLECTIONS = (COLLECTION_NAME, NEWS_COLLECTION_NAME)
     # RAG module handles configuration per request
 except ImportError as e:
     print(f"[Error] Could not import RAG system: {e}")
 
+def _article_document(article: dict):
+    """Text embedded for one news article"""
+    source = (article.get("source") or {}).get("name")
+    lines = [
+        article.get("title"),
+        f"Source: {source}" if source else None,
+        f"Published: {article.get('publishedAt')}" if article.get("publishedAt") else None,
+        article.get("description"),
+        article.get("content"),
+        f"URL: {article.get('url')}" if article.get("url") else None,
+    ]
+    return "\n".join(line for line in lines if line)
+
+def ingest_new_articles(target: str, api_key: str = None):
+    """
+    Embed the target's stored articles that are not in the vector store yet
+
+    Articles go to the news collection under ids derived from their URL, so
+    a retried ingestion replaces chunks rather than duplicating them. Each
+    chunk is one embedding call, charged to the Gemini limiter. Articles
+    embedded before a failure stay marked as ingested.
+
+    Returns:
+        Number of articles ingested
+    """
+    if "ingest_documents" not in globals():
+        return 0
+    pending = news_store.pending_ingestion(target)
+    done, chunks = [], 0
+    try:
+        for article in pending:
+            document = _article_document(article)
+            with limit("gemini", api_key, cost=max(1, len(chunk_text(document)))):
+                chunks += ingest_documents(
+                    [document], [f"news-{article_id(article)}"], api_key=api_key,
+                    collection_name=NEWS_COLLECTION_NAME
+                )
+            done.append(article)
+    finally:
+        if done:
+            news_store.mark_ingested(target, done)
+            print(f"[News] {target}: ingested {len(done)} new articles ({chunks} chunks)")
+    return len(done)
+
 def run_web_intel_agent(target: str, page_size: int = 20, query: str = ""):
     print(f"Fetching web intelligence for: {target} using RAG...")
     
     agent_key = os.getenv("KANKAANNAA_GEMINI_API_KEY3")
     
+    # Fresh news costs one delta fetch and embeds only the new articles
+    refresh_news(target, page_size)
+    try:
+        ingest_new_articles(target, agent_key)
+    except Exception as e:
+        print(f"[WARN] Error ingesting news for '{target}': {e}")
+    
     rag_q = f"""
     Generate a Web Intelligence report for {target} using the knowledge base.
     
@@ -98,7 +196,10 @@ def run_web_intel_agent(target: str, page_size: int = 20, query: str = ""):
     """
     
     try:
-        response = rag_query(rag_q, api_key=agent_key)
+        with limit("gemini", agent_key, cost=2):
+            response = replay.llm(
+                "rag", rag_q, lambda: rag_query(rag_q, api_key=agent_key, collection_names=RAG_COLLECTIONS)
+            )
         report = response.get("answer", "No answer.")
     except Exception as e:
         print(f"RAG Error: {e}")
@@ -3,8 +3,17 @@ Wikipedia Agent - Fetches comprehensive molecule information from Wikipedia
 Uses LangChain's WikipediaAPIWrapper for reliable data retrieval
 """
 
+import os
+import sys
+
 from langchain_community.utilities import WikipediaAPIWrapper
 
+# Add parent directory to import shared helpers
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+from rate_limiter import limit
+
 def run_wikipedia_agent(molecule_name: str, query: str = "") -> str:
     """
     Fetch molecule information from Wikipedia using LangChain
@@ -27,7 +36,8 @@ def run_wikipedia_agent(molecule_name: str, query: str = "") -> str:
         
         # Search for the molecule
         try:
-            result = wikipedia.run(molecule_name)
+            with limit("wikipedia"):
+                result = wikipedia.run(molecule_name)
         except Exception as search_error:
             print(f"[Wikipedia Agent] Search error: {str(search_error)}")
             return format_no_data_response(molecule_name)
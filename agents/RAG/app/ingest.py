@@ -2,7 +2,7 @@ import uuid
 from app.utils.json_loader import extract_json_text
 from app.utils.chunker import chunk_text
 from app.utils.embeddings import embed_text
-from app.utils.vectorstore import add_to_vectorstore
+from app.utils.vectorstore import add_to_vectorstore, upsert_to_vectorstore, COLLECTION_NAME
 
 def ingest_json(file_path: str):
     """
@@ -45,3 +45,33 @@ def ingest_json(file_path: str):
         return len(embeddings)
     
     return 0
+
+def ingest_documents(documents: list[str], ids: list[str], api_key: str = None,
+                     collection_name: str = COLLECTION_NAME):
+    """
+    Embeds and stores individual documents (e.g. news articles) under stable ids.
+
+    Ingesting a document again replaces its chunks instead of adding duplicates,
+    so callers can add new documents incrementally without re-ingesting the rest.
+
+    Args:
+        documents: Document texts
+        ids: One stable id per document
+        api_key: specific gemini api key for the calling agent, used for these calls only
+        collection_name: ChromaDB collection to store the chunks in
+
+    Returns:
+        Number of chunks stored
+    """
+    chunks, embeddings, chunk_ids = [], [], []
+    for doc_id, document in zip(ids, documents):
+        for i, chunk in enumerate(chunk_text(document)):
+            chunks.append(chunk)
+            embeddings.append(embed_text(chunk, api_key=api_key))
+            chunk_ids.append(f"{doc_id}-{i}")
+
+    if embeddings:
+        upsert_to_vectorstore(documents=chunks, embeddings=embeddings, ids=chunk_ids,
+                              collection_name=collection_name)
+        print(f"Stored {len(embeddings)} chunks in ChromaDB.")
+    return len(embeddings)
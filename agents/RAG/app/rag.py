@@ -1,12 +1,12 @@
 import google.generativeai as genai
 from app.utils.embeddings import embed_query
-from app.utils.vectorstore import query_vectorstore
+from app.utils.vectorstore import query_collections, COLLECTION_NAME
 
 # Initialize specific model for generation
 # Global model removed to support per-request keys
 # model = genai.GenerativeModel('gemini-2.5-flash')
 
-def rag_query(query: str, api_key: str = None):
+def rag_query(query: str, api_key: str = None, collection_names=(COLLECTION_NAME,)):
     """
     Performs RAG:
     1. Embed query
@@ -16,6 +16,7 @@ def rag_query(query: str, api_key: str = None):
     Args:
         query: potentially complex user query
         api_key: specific gemini api key for this agent
+        collection_names: ChromaDB collections to retrieve from (closest chunks across all)
     """
     
     # Configure GENAI if key provided (Warning: Global effect in thread)
@@ -27,10 +28,7 @@ def rag_query(query: str, api_key: str = None):
     query_emb = embed_query(query)
     
     # 2. Retrieve top 5 chunks
-    results = query_vectorstore(query_emb, n_results=5)
-    
-    # Flatten results
-    retrieved_chunks = results['documents'][0] if (results and results['documents']) else []
+    retrieved_chunks = query_collections(query_emb, collection_names, n_results=5)
     
     if not retrieved_chunks:
         return {"answer": "I couldn't find any relevant information in the documents."}
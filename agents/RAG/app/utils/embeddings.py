@@ -1,7 +1,22 @@
 import google.generativeai as genai
 import time
 
-def embed_text(text: str) -> list[float]:
+_clients = {}
+
+def _client_for(api_key: str = None):
+    """
+    Embedding client bound to one API key, or None for the globally configured key.
+    Passing it per call keeps concurrent agents from swapping each other's key.
+    """
+    if not api_key:
+        return None
+    client = _clients.get(api_key)
+    if client is None:
+        from google.ai import generativelanguage as glm
+        client = _clients[api_key] = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+    return client
+
+def embed_text(text: str, api_key: str = None) -> list[float]:
     """
     Embeds text using Gemini 'models/text-embedding-004'.
     """
@@ -11,7 +26,8 @@ def embed_text(text: str) -> list[float]:
         result = genai.embed_content(
             model="models/text-embedding-004",
             content=text,
-            task_type="retrieval_document"
+            task_type="retrieval_document",
+            client=_client_for(api_key)
         )
         # Convert to standard list to avoid protobuf/repeated field issues with ChromaDB
         return list(result['embedding'])
@@ -1,17 +1,20 @@
-import chromadb
 from app.config import DB_DIR
 
 COLLECTION_NAME = "json_docs"
+# News articles ingested incrementally by the web agent, kept apart from the knowledge base
+NEWS_COLLECTION_NAME = "news_articles"
 _client = None
 
-def get_collection():
+def get_collection(name: str = COLLECTION_NAME):
     """
-    Get or create the ChromaDB collection.
+    Get or create a ChromaDB collection (the knowledge base by default).
     """
     global _client
     if _client is None:
+        # Imported here so loading an agent does not pay for chromadb until the first query
+        import chromadb
         _client = chromadb.PersistentClient(path=DB_DIR)
-    return _client.get_or_create_collection(name=COLLECTION_NAME)
+    return _client.get_or_create_collection(name=name)
 
 def add_to_vectorstore(documents: list[str], embeddings: list[list[float]], ids: list[str]):
     """
@@ -33,3 +36,30 @@ def query_vectorstore(query_embedding: list[float], n_results: int = 5):
         query_embeddings=[query_embedding],
         n_results=n_results
     )
+
+def query_collections(query_embedding: list[float], collection_names, n_results: int = 5) -> list[str]:
+    """
+    Top matching documents across several collections, closest first.
+    Empty collections (e.g. no news ingested yet) are skipped, so the others still answer.
+    """
+    matches = []
+    for name in collection_names:
+        collection = get_collection(name)
+        if collection.count() == 0:
+            continue
+        results = collection.query(query_embeddings=[query_embedding], n_results=n_results)
+        matches.extend(zip(results["distances"][0], results["documents"][0]))
+    matches.sort(key=lambda match: match[0])
+    return [document for _, document in matches[:n_results]]
+
+def upsert_to_vectorstore(documents: list[str], embeddings: list[list[float]], ids: list[str],
+                          collection_name: str = COLLECTION_NAME):
+    """
+    Add documents, replacing any already stored under the same ids.
+    """
+    collection = get_collection(collection_name)
+    collection.upsert(
+        documents=documents,
+        embeddings=embeddings,
+        ids=ids
+    )
@@ -0,0 +1,103 @@
+"""
+Agent Registry for MoleculeInsight
+Loads worker agent modules on first use (or during an explicit warm-up) instead of at import time
+"""
+
+import os
+import time
+import threading
+import importlib.util
+
+# name: (module name, file in Agent-workers, entry point function)
+AGENT_SPECS = {
+    "clinical_trials": ("clinical_trials_agent", "clinical_trials_agent.py", "run_clinical_trials_agent"),
+    "exim": ("exim_trade_agent", "exim_trade_agent.py", "run_exim_agent"),
+    "iqvia": ("iqvia_agent", "iqvia_agent.py", "generate_final_report"),
+    "patent": ("patent_agent", "patent_agent.py", "run_patent_agent"),
+    "web_intel": ("web_agent", "web_agent.py", "run_web_intel_agent"),
+    "internal_knowledge": ("internal_knowledge_agent", "internal_knowledge_agent.py", "run_internal_knowledge_agent"),
+    "innovation_strategy": ("innovation_strategy_agent", "innovation_strategy_agent.py", "run_innovation_strategy_agent"),
+    "wikipedia": ("wikipedia_agent", "wikipedia_agent.py", "run_wikipedia_agent"),
+}
+
+
+class AgentRegistry:
+    """Imports worker modules lazily and records how long each one took to load"""
+
+    def __init__(self, agents_dir, specs=AGENT_SPECS):
+        """
+        Initialize agent registry
+
+        Args:
+            agents_dir: Directory containing the worker modules (Agent-workers)
+            specs: Mapping of agent name to (module name, file name, function name)
+        """
+        self.agents_dir = agents_dir
+        self.specs = specs
+        self._modules = {}
+        self._load_times = {}
+        self._locks = {name: threading.Lock() for name in specs}
+
+    def _load_module(self, module_name, file_name):
+        file_path = os.path.join(self.agents_dir, file_name)
+        spec = importlib.util.spec_from_file_location(module_name, file_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    def module(self, name):
+        """Get the worker module for an agent, importing it on first use"""
+        if name in self._modules:
+            return self._modules[name]
+
+        # Per-agent lock so concurrent first calls import the module only once
+        with self._locks[name]:
+            if name not in self._modules:
+                module_name, file_name, _ = self.specs[name]
+                start = time.perf_counter()
+                self._modules[name] = self._load_module(module_name, file_name)
+                self._load_times[name] = time.perf_counter() - start
+                print(f"[Registry] Loaded {name} agent in {self._load_times[name]:.2f}s")
+        return self._modules[name]
+
+    def get(self, name):
+        """Get an agent's entry point function, importing its module on first use"""
+        return getattr(self.module(name), self.specs[name][2])
+
+    def lazy(self, name):
+        """Return a callable that resolves the agent only when it is first invoked"""
+        def run_agent(*args, **kwargs):
+            return self.get(name)(*args, **kwargs)
+        run_agent.__name__ = self.specs[name][2]
+        return run_agent
+
+    def warm_up(self, names=None):
+        """
+        Import agents ahead of traffic and build their LLM clients
+
+        Args:
+            names: Agents to warm up (defaults to all)
+
+        Returns:
+            Dict of agent name to error message for agents that failed to load
+        """
+        errors = {}
+        for name in names or self.specs:
+            try:
+                module = self.module(name)
+                if hasattr(module, "get_llm"):
+                    module.get_llm()
+            except Exception as e:
+                errors[name] = str(e)
+                print(f"[Registry] Failed to warm up {name}: {e}")
+        return errors
+
+    def report(self):
+        """Load status and import time (seconds) for every agent"""
+        return {
+            name: {
+                "loaded": name in self._modules,
+                "load_seconds": round(self._load_times[name], 3) if name in self._load_times else None
+            }
+            for name in self.specs
+        }
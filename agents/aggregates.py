@@ -0,0 +1,145 @@
+"""
+Aggregates for MoleculeInsight
+Mergeable counters, top-k summaries and date ranges that fold in records page by page
+
+Every type here is a running total: each page of records is added to the
+same instance as it arrives, so a summary is available at any point while
+data is still streaming in. merge() only combines partial results built
+separately, e.g. by parallel workers; pages of one fetch are never merged.
+"""
+
+import heapq
+from collections import Counter
+
+# Labels a TopK keeps before it starts trading exactness for bounded memory
+TOPK_CAPACITY = 10000
+
+
+class CountTable:
+    """Exact count (or summed value) per label, in first-appearance order"""
+
+    __slots__ = ("counts",)
+
+    def __init__(self, counts=None):
+        self.counts = Counter(counts or {})
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, labels):
+        """
+        Count each label in an iterable once
+
+        Feed it a C-level iterator (map, itertools.chain) over the records so
+        the per-record work stays out of the Python loop.
+        """
+        self.counts.update(labels)
+        return self
+
+    def add_totals(self, totals):
+        """Add a mapping of label -> count or value (e.g. per-page sums built in a plain dict)"""
+        self.counts.update(totals)
+        return self
+
+    def merge(self, other):
+        return self.add_totals(other.counts)
+
+    def top(self, k=None):
+        """Largest labels first (ties in first-appearance order), all of them if k is None"""
+        return dict(self.counts.most_common(k))
+
+    def to_dict(self):
+        """All labels in first-appearance order"""
+        return dict(self.counts)
+
+
+class TopK(CountTable):
+    """
+    Heavy-hitters summary holding at most `capacity` labels (Misra-Gries)
+
+    Exact while a field has no more than `capacity` distinct labels. Beyond
+    that each kept count may be low by at most `error`, and any label with a
+    true count above `error` is guaranteed to be kept. Merging two summaries
+    keeps the same guarantee, so partial results from workers can be combined.
+    """
+
+    __slots__ = ("capacity", "error")
+
+    def __init__(self, capacity=TOPK_CAPACITY, counts=None):
+        super().__init__(counts)
+        self.capacity = capacity
+        self.error = 0
+
+    def add(self, labels):
+        super().add(labels)
+        self._prune()
+        return self
+
+    def add_totals(self, totals):
+        super().add_totals(totals)
+        self._prune()
+        return self
+
+    def merge(self, other):
+        super().add_totals(other.counts)
+        self.error += other.error
+        self._prune()
+        return self
+
+    def _prune(self):
+        excess = len(self.counts) - self.capacity
+        if excess <= 0:
+            return
+        # Subtract the (capacity + 1)-th largest count from every label and drop those left at zero
+        cutoff = heapq.nsmallest(excess, self.counts.values())[-1]
+        self.counts = Counter({label: value - cutoff for label, value in self.counts.items() if value > cutoff})
+        self.error += cutoff
+
+
+class DateRange:
+    """Earliest and latest value seen (ISO date strings compare correctly as text)"""
+
+    __slots__ = ("first", "last")
+
+    def __init__(self, first=None, last=None):
+        self.first = first
+        self.last = last
+
+    def add(self, values):
+        values = list(filter(None, values))
+        if values:
+            low, high = min(values), max(values)
+            self.first = low if self.first is None else min(self.first, low)
+            self.last = high if self.last is None else max(self.last, high)
+        return self
+
+    def merge(self, other):
+        return self.add([other.first, other.last])
+
+    def to_dict(self):
+        if self.first is None:
+            return None
+        return {"first": self.first, "last": self.last}
+
+
+class Aggregate:
+    """
+    Base for per-source rollups built from the types above
+
+    Subclasses list their state in __slots__: numbers are added, lists are
+    concatenated and everything else is merged with its own merge().
+    """
+
+    __slots__ = ()
+
+    def merge(self, other):
+        for name in self.__slots__:
+            mine, theirs = getattr(self, name), getattr(other, name)
+            if isinstance(mine, (int, float)):
+                setattr(self, name, mine + theirs)
+            elif isinstance(mine, list):
+                mine.extend(theirs)
+            else:
+                mine.merge(theirs)
+        return self
+
@@ -0,0 +1,146 @@
+"""
+Offline agent benchmark
+Runs the upstream fetchers and the clinical trials, patent, EXIM and web
+intelligence agents with every HTTP and LLM call answered by the replay layer,
+then fans the agents out on a thread pool the way /analyze does, so
+orchestration overhead and regressions can be measured without network access
+
+Replayed calls answer in fixed time, so real token buckets would turn every
+run into limiter backlog (all unset API keys share one Gemini bucket). By
+default the buckets are lifted and only the in-flight caps stay; with
+--limits real they stay in force and are reset before every timed run, and
+the time callers spent queued in a limiter is reported in its own column.
+
+Record fixtures once on a connected machine, then replay them anywhere:
+    python benchmarks/agents_offline.py --mode record --repeat 1
+    python benchmarks/agents_offline.py --mode replay --latency-scale 1.0
+
+Usage:
+    python benchmarks/agents_offline.py [--mode synthesize] [--molecule Atorvastatin]
+        [--latency-ms 200] [--latency-scale 1.0] [--synth-repeat 1] [--repeat 3] [--limits off]
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+agents_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, agents_dir)
+
+# Report caching would turn every repetition after the first into a cache hit
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+from replay import replay, MODES
+from cache_manager import cache_manager
+from rate_limiter import PROVIDER_LIMITS, reset_limiters, total_wait_seconds
+from agent_registry import AgentRegistry
+
+HS_CODE = "300490"
+YEARS = [2020, 2021, 2022, 2023]
+
+
+def agent_calls(registry, molecule, query):
+    """The agent invocations /analyze makes, as (name, callable) pairs"""
+    return [
+        ("clinical_trials", lambda: registry.get("clinical_trials")(molecule, query)),
+        ("patent", lambda: registry.get("patent")(molecule, query)),
+        ("exim", lambda: registry.get("exim")(molecule, HS_CODE, YEARS, query)),
+        ("web_intel", lambda: registry.get("web_intel")(molecule, 20, query)),
+    ]
+
+
+def fetcher_calls(registry, molecule):
+    """The paginated upstream fetchers, as (name, callable) pairs"""
+    return [
+        ("fetch_trials", lambda: registry.module("clinical_trials").fetch_trials(molecule)),
+        ("aggregate_patents", lambda: registry.module("patent").aggregate_patents(molecule)),
+        ("fetch_trade_data", lambda: registry.module("exim").fetch_trade_data(HS_CODE, YEARS)),
+        ("fetch_news", lambda: registry.module("web_intel").fetch_news_articles(molecule)),
+    ]
+
+
+def lift_rate_limits():
+    """Unlimited token buckets for every provider; in-flight caps stay"""
+    for provider in PROVIDER_LIMITS:
+        os.environ[f"RATE_LIMIT_{provider.upper()}_REQUESTS_PER_MINUTE"] = "1e9"
+        os.environ[f"RATE_LIMIT_{provider.upper()}_BURST"] = "1000000"
+    reset_limiters()
+
+
+def timed(func, repeat):
+    """
+    Median wall time of func() and median time queued in rate limiters, in milliseconds
+
+    Caches and limiters are reset before every run, so no run inherits the
+    previous one's entries or limiter backlog.
+    """
+    samples, waits = [], []
+    for _ in range(repeat):
+        cache_manager.clear_all()
+        reset_limiters()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+        waits.append(total_wait_seconds() * 1000)
+    return statistics.median(samples), statistics.median(waits)
+
+
+def fan_out(calls, workers):
+    """Run every call at once on a fresh pool and wait for all of them"""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(call) for _, call in calls]:
+            future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=[m for m in MODES if m != "off"], default="synthesize",
+                        help="replay mode (record needs network access and API keys)")
+    parser.add_argument("--molecule", default="Atorvastatin", help="molecule to analyze")
+    parser.add_argument("--query", default="", help="user query passed to the agents")
+    parser.add_argument("--latency-ms", type=float, default=None, help="fixed delay per replayed call")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier on recorded latencies")
+    parser.add_argument("--synth-repeat", type=int, default=1, help="times each sample record is repeated")
+    parser.add_argument("--repeat", type=int, default=3, help="timing repetitions (median reported)")
+    parser.add_argument("--limits", choices=["off", "real"], default="off",
+                        help="off lifts the rate limiters' token buckets; real keeps the configured limits")
+    args = parser.parse_args()
+
+    if args.limits == "off":
+        lift_rate_limits()
+    replay.configure(mode=args.mode, latency_ms=args.latency_ms, latency_scale=args.latency_scale,
+                     synth_repeat=args.synth_repeat)
+    registry = AgentRegistry(os.path.join(agents_dir, "Agent-workers"))
+    agents = agent_calls(registry, args.molecule, args.query)
+    fetchers = fetcher_calls(registry, args.molecule)
+
+    # Imports are paid here, not inside the first timed call
+    for name, _ in agents:
+        registry.module(name)
+
+    rows = [(name, *timed(call, args.repeat)) for name, call in fetchers + agents]
+    agent_ms = {name: ms for name, ms, _ in rows[len(fetchers):]}
+    agent_wait_ms = sum(wait for _, _, wait in rows[len(fetchers):])
+    concurrent_ms, concurrent_wait_ms = timed(lambda: fan_out(agents, len(agents)), args.repeat)
+    slowest_ms = max(agent_ms.values())
+
+    print(f"Mode: {args.mode}, molecule: {args.molecule}, rate limits: {args.limits}, latency: "
+          + (f"{args.latency_ms:.0f} ms per call" if args.latency_ms is not None
+             else f"recorded x {args.latency_scale}"))
+    print(f"{'call':<22}{'median ms':>12}{'limiter wait ms':>17}")
+    for name, ms, wait in rows:
+        print(f"{name:<22}{ms:>12.1f}{wait:>17.1f}")
+    print(f"{'agents sequential':<22}{sum(agent_ms.values()):>12.1f}{agent_wait_ms:>17.1f}")
+    print(f"{'agents concurrent':<22}{concurrent_ms:>12.1f}{concurrent_wait_ms:>17.1f}")
+    print(f"{'orchestration overhead':<22}{concurrent_ms - slowest_ms:>12.1f}  (concurrent - slowest agent"
+          + (", includes limiter wait)" if args.limits == "real" else ")"))
+    print("limiter wait is summed over threads, so concurrent runs can exceed wall time")
+    for source, calls in replay.report().items():
+        print(f"{source}: " + ", ".join(f"{name}={count}" for name, count in calls.items()))
+
+
+if __name__ == "__main__":
+    main()
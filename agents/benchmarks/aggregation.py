@@ -0,0 +1,144 @@
+"""
+Aggregation benchmark
+Compares the per-record dict counting the agents used to do against the
+aggregate rollups in data_processor, on synthetic trial and trade records,
+both in one call and added page by page to one running aggregate as
+paginated fetchers do
+
+Usage:
+    python benchmarks/aggregation.py [--records 300000] [--page-size 1000] [--repeat 3]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+agents_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, agents_dir)
+
+from data_processor import TrialAggregate, TradeAggregate, rollup_trials, rollup_trade
+from records import Trial, TradeRow
+
+PHASES = ["PHASE1", "PHASE2", "PHASE3", "PHASE4", "NA"]
+STATUSES = ["COMPLETED", "RECRUITING", "TERMINATED", "WITHDRAWN", "UNKNOWN"]
+
+
+def synthetic_trials(n, rng):
+    sponsors = [f"Sponsor {i}" for i in range(max(1, n // 100))]
+    countries = [f"Country {i}" for i in range(150)]
+    return [
+        Trial(
+            phase=rng.choice(PHASES),
+            status=rng.choice(STATUSES),
+            start_date=f"{rng.randint(1995, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            sponsor=rng.choice(sponsors),
+            enrollment=rng.randint(10, 5000),
+            countries=rng.sample(countries, rng.randint(1, 4)),
+        )
+        for _ in range(n)
+    ]
+
+
+def synthetic_trade(n, rng):
+    reporters = [f"Country {i}" for i in range(200)]
+    return [
+        TradeRow(
+            year=rng.randint(2015, 2024),
+            value=rng.randint(1_000, 50_000_000),
+            flow=rng.choice(["import", "export", "re-export"]),
+            reporter=rng.choice(reporters),
+        )
+        for _ in range(n)
+    ]
+
+
+def dict_trials(trials):
+    """The per-record loop analyze_trials used before the aggregate rollups"""
+    phase_count, status_count, sponsor_count, year_count, country_count = {}, {}, {}, {}, {}
+    enrollment_total = 0
+    for t in trials:
+        phase_count[t.phase] = phase_count.get(t.phase, 0) + 1
+        status_count[t.status] = status_count.get(t.status, 0) + 1
+        sponsor_count[t.sponsor] = sponsor_count.get(t.sponsor, 0) + 1
+        if t.start_date:
+            year = t.start_date.split("-")[0]
+            year_count[year] = year_count.get(year, 0) + 1
+        for country in t.countries:
+            country_count[country] = country_count.get(country, 0) + 1
+        enrollment_total += t.enrollment
+    top_sponsors = dict(sorted(sponsor_count.items(), key=lambda x: x[1], reverse=True)[:10])
+    top_countries = dict(sorted(country_count.items(), key=lambda x: x[1], reverse=True)[:20])
+    return phase_count, status_count, top_sponsors, year_count, top_countries, enrollment_total
+
+
+def dict_trade(trades):
+    """The per-record loop analyze_trade used before the aggregate rollups"""
+    yearly, exporters, importers = {}, {}, {}
+    total_value = 0.0
+    for d in trades:
+        year, value, flow, reporter = d.year, d.value, d.flow, d.reporter
+        yearly.setdefault(year, {"import": 0.0, "export": 0.0})
+        if flow == "import":
+            yearly[year]["import"] += value
+            importers[reporter] = importers.get(reporter, 0.0) + value
+        elif flow == "export":
+            yearly[year]["export"] += value
+            exporters[reporter] = exporters.get(reporter, 0.0) + value
+        total_value += value
+    top_exporters = dict(sorted(exporters.items(), key=lambda x: x[1], reverse=True)[:10])
+    top_importers = dict(sorted(importers.items(), key=lambda x: x[1], reverse=True)[:10])
+    return yearly, top_exporters, top_importers, total_value
+
+
+def paged_rollup(aggregate_type, records, page_size):
+    """Every page added to one running aggregate, as it arrives"""
+    aggregate = aggregate_type()
+    for i in range(0, len(records), page_size):
+        aggregate.add_page(records[i:i + page_size])
+    return aggregate
+
+
+def timed(func, repeat):
+    """Median wall time of func() in milliseconds, plus its last result"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=300_000, help="synthetic records per dataset")
+    parser.add_argument("--page-size", type=int, default=1000, help="records per page for the paged rollups")
+    parser.add_argument("--repeat", type=int, default=3, help="timing repetitions (median reported)")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    trials = synthetic_trials(args.records, rng)
+    trades = synthetic_trade(args.records, rng)
+
+    dict_trials_ms, expected = timed(lambda: dict_trials(trials), args.repeat)
+    rollup_trials_ms, rollup = timed(lambda: rollup_trials(trials, top_sponsors=10, top_countries=20), args.repeat)
+    assert rollup["sponsor_count"] == expected[2] and rollup["enrollment_total"] == expected[5]
+    paged_trials_ms, paged = timed(lambda: paged_rollup(TrialAggregate, trials, args.page_size), args.repeat)
+    assert paged.result(top_sponsors=10, top_countries=20) == rollup
+
+    dict_trade_ms, expected = timed(lambda: dict_trade(trades), args.repeat)
+    rollup_trade_ms, rollup = timed(lambda: rollup_trade(trades, top=10), args.repeat)
+    assert rollup["yearly_trade"] == expected[0] and rollup["top_importers"] == expected[2]
+    paged_trade_ms, paged = timed(lambda: paged_rollup(TradeAggregate, trades, args.page_size), args.repeat)
+    assert paged.result(top=10) == rollup
+
+    print(f"Records: {args.records:,} per dataset")
+    print(f"{'rollup':<10}{'dict loop ms':>15}{'rollup ms':>15}{'paged ms':>15}")
+    print(f"{'trials':<10}{dict_trials_ms:>15.1f}{rollup_trials_ms:>15.1f}{paged_trials_ms:>15.1f}")
+    print(f"{'trade':<10}{dict_trade_ms:>15.1f}{rollup_trade_ms:>15.1f}{paged_trade_ms:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Cache format benchmark
+Compares bytes on disk and get/set latency of the legacy indented-JSON cache
+files against the compressed format written by CacheManager
+
+Usage:
+    python benchmarks/cache_format.py [--entries 200] [--repeat 5]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+agents_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, agents_dir)
+
+from cache_manager import CacheManager, decode_entry, zstandard
+
+
+def load_sample_payloads():
+    """Real agent responses from the checked-in cache, used as benchmark payloads"""
+    payloads = []
+    for cache_file in Path(agents_dir, "cache").glob("*.json"):
+        with open(cache_file, "r", encoding="utf-8") as f:
+            payloads.append(json.load(f)["data"])
+    if not payloads:
+        payloads.append("## Sample report\n\n" + "Clinical landscape summary. " * 400)
+    return payloads
+
+
+def write_legacy(cache_dir, index, payload):
+    """Write an entry the way CacheManager did before compression"""
+    cache_data = {
+        "timestamp": "2025-12-14T10:30:00",
+        "agent": "Benchmark",
+        "molecule": f"molecule-{index}",
+        "params": {"query": ""},
+        "data": payload,
+    }
+    path = Path(cache_dir) / f"legacy-{index}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(cache_data, f, indent=2)
+    return path
+
+
+def timed(func, repeat):
+    """Median wall time of func() in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=200, help="cache entries to write")
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions (median reported)")
+    args = parser.parse_args()
+
+    payloads = load_sample_payloads()
+    entries = [payloads[i % len(payloads)] for i in range(args.entries)]
+    work_dir = tempfile.mkdtemp(prefix="cache-bench-")
+
+    try:
+        # Legacy format: indented JSON
+        legacy_dir = os.path.join(work_dir, "legacy")
+        os.makedirs(legacy_dir)
+        legacy_set_ms = timed(lambda: [write_legacy(legacy_dir, i, p) for i, p in enumerate(entries)], args.repeat)
+        legacy_paths = list(Path(legacy_dir).glob("*.json"))
+        legacy_bytes = sum(p.stat().st_size for p in legacy_paths)
+
+        def read_legacy():
+            for path in legacy_paths:
+                with open(path, "r", encoding="utf-8") as f:
+                    json.load(f)
+
+        legacy_get_ms = timed(read_legacy, args.repeat)
+
+        # Current format, memory tier disabled so every get reads from disk
+        manager = CacheManager(cache_dir=os.path.join(work_dir, "current"), memory_max_entries=0)
+        sink = open(os.devnull, "w")
+        stdout, sys.stdout = sys.stdout, sink  # CacheManager logs every get/set
+        try:
+            current_set_ms = timed(
+                lambda: [manager.set("Benchmark", f"molecule-{i}", p, query="") for i, p in enumerate(entries)],
+                args.repeat
+            )
+            current_get_ms = timed(
+                lambda: [manager.get("Benchmark", f"molecule-{i}", query="") for i in range(len(entries))],
+                args.repeat
+            )
+        finally:
+            sys.stdout = stdout
+            sink.close()
+        current_paths = list(Path(manager.backend.cache_dir).glob("*.cache"))
+        current_bytes = sum(p.stat().st_size for p in current_paths)
+
+        # Sanity check: compressed entries round-trip
+        decode_entry(current_paths[0].read_bytes())
+
+        codec = "zstd" if zstandard is not None else "zlib"
+        n = len(entries)
+        print(f"Entries: {n} (from {len(payloads)} sample payloads), codec: {codec}")
+        print(f"{'format':<22}{'bytes on disk':>15}{'set ms/entry':>15}{'get ms/entry':>15}")
+        print(f"{'legacy json (indent=2)':<22}{legacy_bytes:>15,}{legacy_set_ms / n:>15.3f}{legacy_get_ms / n:>15.3f}")
+        print(f"{'compressed (' + codec + ')':<22}{current_bytes:>15,}{current_set_ms / n:>15.3f}{current_get_ms / n:>15.3f}")
+        print(f"Disk reduction: {(1 - current_bytes / legacy_bytes) * 100:.1f}%")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Record memory benchmark
+Compares the memory held per fetched record by the dict records the fetchers
+used to build (every trial field wrapped in a one-item list, patents kept as
+raw API dicts) against the compact record types in records.py, on payloads
+built from the KnowledgeBase sample responses
+
+Usage:
+    python benchmarks/records_memory.py [--records 10000]
+"""
+
+import os
+import sys
+import gc
+import json
+import pickle
+import argparse
+import tracemalloc
+
+agents_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, agents_dir)
+
+from data_processor import study_to_trial, patent_record, rollup_trials, rollup_patents
+
+KNOWLEDGE_BASE_DIR = os.path.join(agents_dir, "RAG", "KnowledgeBase")
+
+
+def legacy_study_to_trial(study):
+    """The dict record study_to_trial built before records.Trial"""
+    protocol = study.get("protocolSection", {})
+    status = protocol.get("statusModule", {})
+    design = protocol.get("designModule", {})
+    sponsor = protocol.get("sponsorCollaboratorsModule", {})
+    locations = protocol.get("contactsLocationsModule", {})
+    phases = design.get("phases", [])
+    return {
+        "Phase": [phases[0] if phases else "Unknown"],
+        "OverallStatus": [status.get("overallStatus", "Unknown")],
+        "StartDate": [status.get("startDateStruct", {}).get("date", "Unknown")],
+        "LeadSponsorName": [sponsor.get("leadSponsor", {}).get("name", "Unknown")],
+        "EnrollmentCount": [str(design.get("enrollmentInfo", {}).get("count", 0))],
+        "LocationCountry": list({loc["country"] for loc in locations.get("locations", []) if "country" in loc}),
+    }
+
+
+def legacy_patent(patent):
+    """The raw PatentsView record fetch_patent_page returned, limited to the requested fields"""
+    return {
+        "patent_title": patent.get("patent_title"),
+        "patent_date": patent.get("patent_date"),
+        "assignees": [{"assignee_organization": a.get("assignee_organization"),
+                       "assignee_country": a.get("assignee_country")} for a in patent.get("assignees") or []],
+        "cpcs": [{"cpc_subsection_id": c.get("cpc_class_id")} for c in patent.get("cpc_current") or []],
+    }
+
+
+def payload(file_name, key, records):
+    """A JSON response body holding `records` items, repeating the sample's items"""
+    with open(os.path.join(KNOWLEDGE_BASE_DIR, file_name), "r", encoding="utf-8") as f:
+        items = json.load(f)[key]
+    repeated = (items * (records // len(items) + 1))[:records]
+    return json.dumps({key: repeated}).encode("utf-8")
+
+
+def measure(body, key, convert):
+    """
+    Decode a response body, convert every item and drop the decoded JSON
+
+    Returns:
+        Tuple of (records, bytes still allocated for them)
+    """
+    gc.collect()
+    tracemalloc.start()
+    items = json.loads(body)[key]
+    records = [convert(item) for item in items]
+    del items
+    gc.collect()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return records, held
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=10_000, help="records per payload")
+    args = parser.parse_args()
+
+    trials_body = payload("clinicaltrials.json", "studies", args.records)
+    patents_body = payload("PatentSearchResponse.json", "patents", args.records)
+    print(f"Records: {args.records:,} per payload")
+    print(f"{'records':<18}{'bytes/record':>14}{'pickled/record':>16}")
+
+    for name, body, key, legacy, compact in [
+        ("trials", trials_body, "studies", legacy_study_to_trial, study_to_trial),
+        ("patents", patents_body, "patents", legacy_patent, lambda p: patent_record(legacy_patent(p))),
+    ]:
+        sizes = {}
+        for label, convert in (("dict", legacy), ("compact", compact)):
+            records, held = measure(body, key, convert)
+            pickled = len(pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL))
+            sizes[label] = held
+            print(f"{name + ' ' + label:<18}{held / len(records):>14.0f}{pickled / len(records):>16.0f}")
+            if label == "compact":
+                summary = rollup_trials(records) if name == "trials" else rollup_patents(records)
+                assert summary.get("total_trials", summary.get("total_patents")) == len(records)
+        print(f"{name + ' saving':<18}{1 - sizes['compact'] / sizes['dict']:>14.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1079 @@
+"""
+Cache Backends for MoleculeInsight
+Storage for CacheManager entries: a local file store, or a shared Redis store for multi-replica deployments
+"""
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from cancellation import check_cancelled
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    import zstandard
+except ImportError:  # Optional: falls back to zlib
+    zstandard = None
+
+try:
+    import redis
+except ImportError:  # Optional: only needed for CACHE_BACKEND=redis
+    redis = None
+
+# Longest a process waits for another process's in-progress fill before doing it itself (seconds)
+FILL_LOCK_TIMEOUT = 600
+FILL_LOCK_POLL_INTERVAL = 0.1
+
+def _try_lock(lock_file):
+    """Take an exclusive non-blocking lock on an open file; True if acquired"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+def _unlock(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _is_current(lock_file, lock_path):
+    """True if `lock_path` still names the open lock file (it was not unlinked and recreated)"""
+    try:
+        return os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino
+    except FileNotFoundError:
+        return False
+
+# Seconds between a Redis backend's sweeps for metadata of entries the server
+# expired or evicted itself, and how many least recently used entries each sweep checks
+REDIS_PRUNE_INTERVAL = 300
+REDIS_PRUNE_BATCH = 200
+
+# Days of request history kept for warm-up (popular molecules)
+REQUEST_LOG_DAYS = 30
+
+# Entry format: 3-byte magic, 1-byte codec id, then compressed compact JSON.
+# Legacy entries are plain indented JSON in <key>.json and are still readable.
+CACHE_MAGIC = b"MIC"
+CODEC_ZLIB = b"z"
+CODEC_ZSTD = b"s"
+
+def encode_entry(cache_data):
+    """
+    Serialize a cache entry for storage
+
+    Returns:
+        Tuple of (bytes to write, length of the uncompressed JSON)
+    """
+    raw = json.dumps(cache_data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if zstandard is not None:
+        return CACHE_MAGIC + CODEC_ZSTD + zstandard.ZstdCompressor(level=3).compress(raw), len(raw)
+    return CACHE_MAGIC + CODEC_ZLIB + zlib.compress(raw, 6), len(raw)
+
+def decode_entry(blob):
+    """
+    Deserialize a cache entry written by encode_entry, or a legacy JSON file
+
+    Returns:
+        Tuple of (cache entry dict, length of the uncompressed JSON)
+    """
+    if blob[:3] == CACHE_MAGIC:
+        codec, payload = blob[3:4], blob[4:]
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise ValueError("Cache entry is zstd-compressed but zstandard is not installed")
+            raw = zstandard.ZstdDecompressor().decompress(payload)
+        elif codec == CODEC_ZLIB:
+            raw = zlib.decompress(payload)
+        else:
+            raise ValueError(f"Unknown cache codec {codec!r}")
+    else:
+        raw = blob
+    return json.loads(raw), len(raw)
+
+class CacheBackend:
+    """
+    Storage interface used by CacheManager
+
+    Backends store encoded entry blobs plus enough metadata (agent, molecule,
+    size, created/expiry/access times) to answer admin queries without
+    decoding entries. Freshness, the memory tier and stale-while-revalidate
+    stay in CacheManager, so every backend behaves the same to callers.
+    """
+
+    def initialize(self, expiry_for_agent):
+        """Called once by CacheManager with expiry_for_agent(agent) -> seconds"""
+
+    def read(self, key):
+        """Encoded entry for `key`, or None"""
+        raise NotImplementedError
+
+    def write(self, key, blob, agent, molecule, created, expires):
+        """
+        Store an encoded entry
+
+        Returns:
+            List of keys evicted to make room (to drop from the memory tier)
+        """
+        raise NotImplementedError
+
+    def delete(self, keys):
+        raise NotImplementedError
+
+    def touch(self, key, accessed, hits=1):
+        """Record `hits` reads of an entry, the latest at `accessed`"""
+        raise NotImplementedError
+
+    @contextmanager
+    def fill_lock(self, key, blocking=True):
+        """
+        Lock held while an entry is being filled, shared by every process using the backend
+
+        Yields:
+            True if the lock is held, False if it could not be taken
+        """
+        raise NotImplementedError
+        yield
+
+    def expired_keys(self, now):
+        """Keys of entries whose expiry (epoch seconds) is before `now`"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove every entry; returns the number removed"""
+        raise NotImplementedError
+
+    def stats(self, now):
+        """Dict of entry count, total bytes and count of entries expired as of `now`"""
+        raise NotImplementedError
+
+    def recent(self, limit):
+        """Most recently created entries as (agent, molecule, size, created, last_accessed, expires) rows"""
+        raise NotImplementedError
+
+    def record_request(self, molecule, query, geography, at):
+        """Count one analysis request; the log survives cache clears (see warmup.py)"""
+
+    def popular_requests(self, since, limit):
+        """Most frequent (molecule, query, geography, count) requests since `since`, most first"""
+        return []
+
+    def load_document(self, name):
+        """Blob last saved under `name` with save_document, or None"""
+        raise NotImplementedError
+
+    def save_document(self, name, blob):
+        """Store a blob that never expires, is never evicted and survives clear()"""
+        raise NotImplementedError
+
+    def describe(self):
+        """One-line description for startup logs"""
+        return type(self).__name__
+
+class CacheManifest:
+    """SQLite index of cache entries so admin queries never open the cache files"""
+
+    def __init__(self, db_path):
+        """
+        Initialize manifest
+
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                agent TEXT,
+                molecule TEXT,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_accessed REAL NOT NULL,
+                expires REAL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+        if "expires" not in columns:
+            # Manifests written before per-agent TTLs; NULL expiry is backfilled on startup
+            self._conn.execute("ALTER TABLE entries ADD COLUMN expires REAL")
+        if "hits" not in columns:
+            self._conn.execute("ALTER TABLE entries ADD COLUMN hits INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_created ON entries (created)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_expires ON entries (expires)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (last_accessed)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_hits ON entries (hits, last_accessed)")
+
+        # Running totals kept by triggers, so quota checks never scan the table
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS totals (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                entries INTEGER NOT NULL,
+                bytes INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "INSERT OR IGNORE INTO totals (id, entries, bytes) "
+            "SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        )
+        self._conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+                UPDATE totals SET entries = entries + 1, bytes = bytes + NEW.size WHERE id = 0;
+            END
+        """)
+        self._conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+                UPDATE totals SET entries = entries - 1, bytes = bytes - OLD.size WHERE id = 0;
+            END
+        """)
+        self._conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS entries_resize AFTER UPDATE OF size ON entries BEGIN
+                UPDATE totals SET bytes = bytes - OLD.size + NEW.size WHERE id = 0;
+            END
+        """)
+
+        # Daily request counts, kept across cache clears for warm-up
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS requests (
+                molecule TEXT NOT NULL,
+                query TEXT NOT NULL,
+                geography TEXT NOT NULL,
+                day INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (molecule, query, geography, day)
+            )
+        """)
+
+        # Long-lived state kept outside the entries (see CacheManager.save_document)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                name TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def record(self, key, agent, molecule, size, created, expires):
+        """Insert or update the manifest row for a cache entry"""
+        # Upsert rather than INSERT OR REPLACE: REPLACE deletes without firing the totals triggers
+        self._execute(
+            "INSERT INTO entries (key, agent, molecule, size, created, last_accessed, expires) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET agent = excluded.agent, molecule = excluded.molecule, "
+            "size = excluded.size, created = excluded.created, "
+            "last_accessed = excluded.last_accessed, expires = excluded.expires",
+            (key, agent, molecule, size, created, created, expires)
+        )
+
+    def backfill_expiry(self, expiry_for_agent):
+        """Fill in missing expiry times using expiry_for_agent(agent) -> seconds"""
+        rows = self._execute("SELECT DISTINCT agent FROM entries WHERE expires IS NULL")
+        for (agent,) in rows:
+            self._execute("UPDATE entries SET expires = created + ? WHERE expires IS NULL AND agent IS ?",
+                          (expiry_for_agent(agent), agent))
+
+    def touch(self, key, accessed=None, hits=1):
+        """Record `hits` reads of a cache entry, the latest at `accessed`"""
+        self._execute("UPDATE entries SET last_accessed = ?, hits = hits + ? WHERE key = ?",
+                      (accessed or time.time(), hits, key))
+
+    def remove(self, keys):
+        with self._lock:
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in keys])
+
+    def clear(self):
+        self._execute("DELETE FROM entries")
+
+    def is_empty(self):
+        return not self._execute("SELECT 1 FROM entries LIMIT 1")
+
+    def expired_keys(self, now):
+        """Keys of entries whose expiry (epoch seconds) is before `now`"""
+        return [row[0] for row in self._execute("SELECT key FROM entries WHERE expires < ?", (now,))]
+
+    def totals(self):
+        """(entry count, total bytes) from the trigger-maintained totals"""
+        return self._execute("SELECT entries, bytes FROM totals WHERE id = 0")[0]
+
+    def eviction_candidates(self, policy, limit, exclude=None):
+        """
+        Keys and sizes of the entries to evict first
+
+        Args:
+            policy: 'lru' (least recently accessed) or 'lfu' (fewest hits, then oldest access)
+            limit: Maximum number of candidates
+            exclude: Key never to return (e.g. the entry just written)
+        """
+        order = "hits ASC, last_accessed ASC" if policy == "lfu" else "last_accessed ASC"
+        return self._execute(
+            f"SELECT key, size FROM entries WHERE key IS NOT ? ORDER BY {order} LIMIT ?",
+            (exclude, limit)
+        )
+
+    def stats(self, now):
+        """Entry count, total bytes and count of entries expired as of `now`"""
+        count, total_bytes = self.totals()
+        expired = self._execute("SELECT COUNT(*) FROM entries WHERE expires < ?", (now,))[0][0]
+        return {"count": count, "total_bytes": total_bytes, "expired": expired}
+
+    def recent(self, limit):
+        """Most recently created entries as (agent, molecule, size, created, last_accessed, expires) rows"""
+        return self._execute(
+            "SELECT agent, molecule, size, created, last_accessed, expires FROM entries "
+            "ORDER BY created DESC LIMIT ?",
+            (limit,)
+        )
+
+    def record_request(self, molecule, query, geography, at):
+        day = int(at // 86400)
+        self._execute(
+            "INSERT INTO requests (molecule, query, geography, day, count) VALUES (?, ?, ?, ?, 1) "
+            "ON CONFLICT(molecule, query, geography, day) DO UPDATE SET count = count + 1",
+            (molecule, query, geography, day)
+        )
+
+    def popular_requests(self, since, limit):
+        # Pruned here rather than on every request: reads are rare (warm-up runs)
+        self._execute("DELETE FROM requests WHERE day < ?", (int(time.time() // 86400) - REQUEST_LOG_DAYS,))
+        return self._execute(
+            "SELECT molecule, query, geography, SUM(count) AS total FROM requests WHERE day >= ? "
+            "GROUP BY molecule, query, geography ORDER BY total DESC LIMIT ?",
+            (int(since // 86400), limit)
+        )
+
+    def load_document(self, name):
+        rows = self._execute("SELECT data FROM documents WHERE name = ?", (name,))
+        return rows[0][0] if rows else None
+
+    def save_document(self, name, blob):
+        self._execute(
+            "INSERT INTO documents (name, data, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET data = excluded.data, updated = excluded.updated",
+            (name, blob, time.time())
+        )
+
+class FileCacheBackend(CacheBackend):
+    """Entries as compressed files in a local directory, indexed by a SQLite manifest"""
+
+    def __init__(self, cache_dir="cache", max_disk_bytes=None, eviction_policy="lru"):
+        """
+        Initialize file backend
+
+        Args:
+            cache_dir: Directory to store cache files
+            max_disk_bytes: Disk quota for cache entries (None for unbounded)
+            eviction_policy: 'lru' or 'lfu', used when the quota is exceeded
+        """
+        if eviction_policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy: {eviction_policy}")
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(exist_ok=True)
+        self.lock_dir = self.cache_dir / "locks"
+        self.lock_dir.mkdir(exist_ok=True)
+        self._local = threading.local()
+        # key -> [threading.Lock, users]; dropped when the last user leaves
+        self._key_locks = {}
+        self._key_locks_guard = threading.Lock()
+        self.max_disk_bytes = max_disk_bytes
+        self.eviction_policy = eviction_policy
+        self.manifest = CacheManifest(self.cache_dir / "manifest.sqlite3")
+
+    def initialize(self, expiry_for_agent):
+        if self.manifest.is_empty():
+            self._rebuild_manifest(expiry_for_agent)
+        self.manifest.backfill_expiry(expiry_for_agent)
+        # Lock files are recreated on demand; drop those of fills that never wrote an entry
+        for lock_path in self.lock_dir.glob("*.lock"):
+            self._remove_lock_file(lock_path)
+
+    def _cache_files(self):
+        """All entry files on disk, current and legacy format"""
+        yield from self.cache_dir.glob("*.cache")
+        yield from self.cache_dir.glob("*.json")
+
+    def _rebuild_manifest(self, expiry_for_agent):
+        """Index existing cache files (first run, or after the manifest was deleted)"""
+        count = 0
+        for cache_file in self._cache_files():
+            try:
+                cache_data, _ = decode_entry(cache_file.read_bytes())
+                created = datetime.fromisoformat(cache_data['timestamp']).timestamp()
+                agent = cache_data.get('agent')
+                self.manifest.record(cache_file.stem, agent, cache_data.get('molecule'),
+                                     cache_file.stat().st_size, created,
+                                     created + expiry_for_agent(agent))
+                count += 1
+            except Exception:
+                pass
+        if count:
+            print(f"[Cache] Indexed {count} existing cache files")
+
+    def _get_cache_path(self, cache_key):
+        """Get full path to cache file"""
+        return self.cache_dir / f"{cache_key}.cache"
+
+    def _get_legacy_cache_path(self, cache_key):
+        """Path used by entries written before compression (plain JSON)"""
+        return self.cache_dir / f"{cache_key}.json"
+
+    def read(self, key):
+        for cache_path in (self._get_cache_path(key), self._get_legacy_cache_path(key)):
+            try:
+                return cache_path.read_bytes()
+            except FileNotFoundError:
+                continue
+        return None
+
+    def write(self, key, blob, agent, molecule, created, expires):
+        tmp_path = self.cache_dir / f".{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # Write to a temp file and rename so readers never see a partial file
+            with open(tmp_path, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp_path, self._get_cache_path(key))
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        # A rewritten entry supersedes any legacy JSON copy
+        self._get_legacy_cache_path(key).unlink(missing_ok=True)
+        self.manifest.record(key, agent, molecule, len(blob), created, expires)
+        return self._enforce_quota(keep=key)
+
+    def delete(self, keys):
+        for cache_key in keys:
+            self._get_cache_path(cache_key).unlink(missing_ok=True)
+            self._get_legacy_cache_path(cache_key).unlink(missing_ok=True)
+            self._remove_lock_file(self._lock_path(cache_key))
+        self.manifest.remove(keys)
+
+    def touch(self, key, accessed, hits=1):
+        self.manifest.touch(key, accessed, hits)
+
+    def _lock_path(self, key):
+        return self.lock_dir / f"{key}.lock"
+
+    def _remove_lock_file(self, lock_path):
+        """Unlink a lock file unless a fill holds it (fill_lock re-opens unlinked files)"""
+        try:
+            with open(lock_path, "r+") as lock_file:
+                if _try_lock(lock_file):
+                    try:
+                        lock_path.unlink(missing_ok=True)
+                    except OSError:
+                        pass  # Windows cannot unlink an open file; it is reused instead
+                    finally:
+                        _unlock(lock_file)
+        except FileNotFoundError:
+            pass
+
+    def _key_lock(self, key):
+        """In-process lock for `key`, shared by this backend's threads while any of them uses it"""
+        with self._key_locks_guard:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+            return entry[0]
+
+    def _release_key_lock(self, key):
+        with self._key_locks_guard:
+            entry = self._key_locks[key]
+            entry[1] -= 1
+            if not entry[1]:
+                del self._key_locks[key]
+
+    def _lock_file(self, key, blocking, deadline):
+        """
+        Open and lock the key's lock file
+
+        Returns:
+            The open, locked file, or None if it could not be taken
+        """
+        lock_path = self._lock_path(key)
+        while True:
+            lock_file = open(lock_path, "a+")
+            try:
+                acquired = _try_lock(lock_file)
+                while blocking and not acquired and time.monotonic() < deadline:
+                    check_cancelled()
+                    time.sleep(FILL_LOCK_POLL_INTERVAL)
+                    acquired = _try_lock(lock_file)
+            except BaseException:
+                lock_file.close()
+                raise
+            if acquired and _is_current(lock_file, lock_path):
+                return lock_file
+            # Not taken, or unlinked by delete() while we waited: retry on the new file
+            if acquired:
+                _unlock(lock_file)
+            lock_file.close()
+            if not acquired:
+                return None
+
+    @contextmanager
+    def fill_lock(self, key, blocking=True):
+        held = self._local.__dict__.setdefault("keys", set())
+        if key in held:
+            # Nested fill of a key this thread already holds (locking again would wait on itself)
+            yield True
+            return
+        # Threads of this process queue on a per-key lock; the lock file excludes other processes
+        thread_lock = self._key_lock(key)
+        try:
+            deadline = time.monotonic() + FILL_LOCK_TIMEOUT
+            acquired = thread_lock.acquire(blocking=False)
+            while blocking and not acquired and time.monotonic() < deadline:
+                check_cancelled()
+                acquired = thread_lock.acquire(timeout=FILL_LOCK_POLL_INTERVAL)
+            lock_file = None
+            if acquired:
+                try:
+                    lock_file = self._lock_file(key, blocking, deadline)
+                finally:
+                    if lock_file is None:
+                        thread_lock.release()
+                acquired = lock_file is not None
+            if blocking and not acquired:
+                print(f"[Cache] Timed out waiting for fill lock {key}, filling anyway")
+            if acquired:
+                held.add(key)
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    held.discard(key)
+                    _unlock(lock_file)
+                    lock_file.close()
+                    thread_lock.release()
+        finally:
+            self._release_key_lock(key)
+
+    def _enforce_quota(self, keep=None, batch_size=32):
+        """
+        Evict entries until the cache fits its disk quota
+
+        Expired entries go first, then entries chosen by the eviction policy.
+        Runs on every write, so each call only has to remove what that write added.
+
+        Returns:
+            List of evicted keys
+        """
+        if self.max_disk_bytes is None:
+            return []
+        _, total_bytes = self.manifest.totals()
+        if total_bytes <= self.max_disk_bytes:
+            return []
+
+        evicted = self.manifest.expired_keys(time.time())
+        self.delete(evicted)
+        _, total_bytes = self.manifest.totals()
+
+        while total_bytes > self.max_disk_bytes:
+            candidates = self.manifest.eviction_candidates(self.eviction_policy, batch_size, exclude=keep)
+            if not candidates:
+                break
+            batch = []
+            for cache_key, size in candidates:
+                batch.append(cache_key)
+                total_bytes -= size
+                if total_bytes <= self.max_disk_bytes:
+                    break
+            self.delete(batch)
+            evicted.extend(batch)
+            _, total_bytes = self.manifest.totals()
+
+        print(f"[Cache] Evicted {len(evicted)} entries to stay within {self.max_disk_bytes} bytes")
+        return evicted
+
+    def expired_keys(self, now):
+        return self.manifest.expired_keys(now)
+
+    def clear(self):
+        count = 0
+        self.manifest.clear()
+        for cache_file in list(self._cache_files()):
+            cache_file.unlink()
+            count += 1
+        for lock_path in self.lock_dir.glob("*.lock"):
+            self._remove_lock_file(lock_path)
+        return count
+
+    def stats(self, now):
+        return self.manifest.stats(now)
+
+    def recent(self, limit):
+        return self.manifest.recent(limit)
+
+    def record_request(self, molecule, query, geography, at):
+        self.manifest.record_request(molecule, query, geography, at)
+
+    def popular_requests(self, since, limit):
+        return self.manifest.popular_requests(since, limit)
+
+    def load_document(self, name):
+        return self.manifest.load_document(name)
+
+    def save_document(self, name, blob):
+        self.manifest.save_document(name, blob)
+
+    def describe(self):
+        quota = f"{self.max_disk_bytes} bytes, {self.eviction_policy}" if self.max_disk_bytes else "unbounded"
+        return f"file ({self.cache_dir}, {quota})"
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Entries in a Redis-protocol server shared by every API replica
+
+    Each entry is a string key expiring at the entry's hard expiry, so the
+    server drops dead entries itself. Metadata lives in one hash plus sorted
+    sets by created/expires/last-access time, and entry count and bytes are
+    running totals kept with HINCRBY, so stats() is constant time. Size limits
+    are left to the server's maxmemory-policy (allkeys-lru or allkeys-lfu);
+    metadata of entries the server expired or evicted is swept on writes.
+    """
+
+    def __init__(self, client, prefix="moleculeinsight:cache:"):
+        """
+        Initialize Redis backend
+
+        Args:
+            client: redis.Redis (decode_responses=False) or InProcessRedis
+            prefix: Namespace for every key this backend writes
+        """
+        self.client = client
+        self.prefix = prefix
+        self._meta = f"{prefix}meta"
+        self._created = f"{prefix}created"
+        self._expires = f"{prefix}expires"
+        self._accessed = f"{prefix}accessed"
+        self._hits = f"{prefix}hits"
+        self._totals = f"{prefix}totals"
+        self._pruned_at = 0.0
+
+    def _entry_key(self, key):
+        return f"{self.prefix}entry:{key}"
+
+    def initialize(self, expiry_for_agent):
+        if self.client.hget(self._totals, "count") is None:
+            # Store written before running totals: count it once
+            sizes = [json.loads(meta)["size"] for meta in self.client.hvals(self._meta)]
+            pipe = self.client.pipeline()
+            pipe.hset(self._totals, "count", len(sizes))
+            pipe.hset(self._totals, "bytes", sum(sizes))
+            pipe.execute()
+
+    def read(self, key):
+        return self.client.get(self._entry_key(key))
+
+    def write(self, key, blob, agent, molecule, created, expires):
+        meta = json.dumps({"agent": agent, "molecule": molecule, "size": len(blob),
+                           "created": created, "expires": expires})
+        previous = self.client.hget(self._meta, key)
+        previous_size = json.loads(previous)["size"] if previous else 0
+        ttl_ms = max(1, int((expires - time.time()) * 1000))
+        pipe = self.client.pipeline()
+        pipe.hset(self._meta, key, meta)
+        pipe.set(self._entry_key(key), blob, px=ttl_ms)
+        pipe.zadd(self._created, {key: created})
+        pipe.zadd(self._expires, {key: expires})
+        pipe.zadd(self._accessed, {key: created})
+        pipe.hdel(self._hits, key)
+        pipe.hincrby(self._totals, "bytes", len(blob) - previous_size)
+        added = pipe.execute()[0]
+        if added:
+            # HSET reports a new field once, however many replicas race to write it
+            self.client.hincrby(self._totals, "count", added)
+
+        now = time.time()
+        if now - self._pruned_at < REDIS_PRUNE_INTERVAL:
+            return []
+        self._pruned_at = now
+        return self._prune(now)
+
+    def _prune(self, now):
+        """
+        Drop the metadata of entries the server removed on its own
+
+        Expired entries come from the expiry index; evicted ones are looked for
+        among the least recently accessed entries, which maxmemory eviction
+        takes first.
+
+        Returns:
+            Keys whose metadata was dropped
+        """
+        expired = [key.decode() for key in self.client.zrangebyscore(self._expires, "-inf", now)]
+        oldest = [key.decode() for key in self.client.zrange(self._accessed, 0, REDIS_PRUNE_BATCH - 1)]
+        pipe = self.client.pipeline()
+        for key in oldest:
+            pipe.exists(self._entry_key(key))
+        evicted = [key for key, exists in zip(oldest, pipe.execute()) if not exists]
+        gone = list(dict.fromkeys(expired + evicted))
+        if gone:
+            self.delete(gone)
+            print(f"[Cache] Dropped metadata of {len(gone)} entries removed by the server")
+        return gone
+
+    def delete(self, keys):
+        if not keys:
+            return
+        metas = self.client.hmget(self._meta, keys)
+        pipe = self.client.pipeline()
+        for key in keys:
+            pipe.hdel(self._meta, key)
+        pipe.delete(*[self._entry_key(key) for key in keys])
+        pipe.hdel(self._hits, *keys)
+        for index in (self._created, self._expires, self._accessed):
+            pipe.zrem(index, *keys)
+        removed = pipe.execute()[:len(keys)]
+        # Only the caller whose HDEL removed a key takes it off the totals
+        sizes = [json.loads(meta)["size"] for meta, gone in zip(metas, removed) if gone and meta]
+        if sizes:
+            pipe = self.client.pipeline()
+            pipe.hincrby(self._totals, "count", -len(sizes))
+            pipe.hincrby(self._totals, "bytes", -sum(sizes))
+            pipe.execute()
+
+    def touch(self, key, accessed, hits=1):
+        pipe = self.client.pipeline()
+        pipe.zadd(self._accessed, {key: accessed}, xx=True)
+        pipe.hincrby(self._hits, key, hits)
+        pipe.execute()
+
+    @contextmanager
+    def fill_lock(self, key, blocking=True):
+        # Lock expires on its own if the replica holding it dies mid-fill
+        lock = self.client.lock(f"{self.prefix}lock:{key}", timeout=FILL_LOCK_TIMEOUT)
+        deadline = time.monotonic() + FILL_LOCK_TIMEOUT
+        acquired = lock.acquire(blocking=False)
+        while blocking and not acquired and time.monotonic() < deadline:
+            check_cancelled()
+            time.sleep(FILL_LOCK_POLL_INTERVAL)
+            acquired = lock.acquire(blocking=False)
+        if blocking and not acquired:
+            print(f"[Cache] Timed out waiting for fill lock {key}, filling anyway")
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except Exception as e:  # Lock already expired and possibly re-taken
+                    print(f"[Cache] Could not release fill lock {key}: {e}")
+
+    def expired_keys(self, now):
+        return [key.decode() for key in self.client.zrangebyscore(self._expires, "-inf", now)]
+
+    def clear(self):
+        keys = [key.decode() for key in self.client.hkeys(self._meta)]
+        self.delete(keys)
+        return len(keys)
+
+    def stats(self, now):
+        count, total_bytes = self.client.hmget(self._totals, ["count", "bytes"])
+        return {
+            "count": int(count or 0),
+            "total_bytes": int(total_bytes or 0),
+            "expired": self.client.zcount(self._expires, "-inf", now)
+        }
+
+    def recent(self, limit):
+        keys = self.client.zrevrange(self._created, 0, limit - 1)
+        if not keys:
+            return []
+        pipe = self.client.pipeline()
+        pipe.hmget(self._meta, keys)
+        for key in keys:
+            pipe.zscore(self._accessed, key)
+        metas, *accessed = pipe.execute()
+        rows = []
+        for meta, last_accessed in zip(metas, accessed):
+            if meta is None:
+                continue
+            meta = json.loads(meta)
+            rows.append((meta["agent"], meta["molecule"], meta["size"], meta["created"],
+                         last_accessed or meta["created"], meta["expires"]))
+        return rows
+
+    def record_request(self, molecule, query, geography, at):
+        # One hash per day of JSON [molecule, query, geography] -> count
+        day_key = f"{self.prefix}requests:{int(at // 86400)}"
+        pipe = self.client.pipeline()
+        pipe.hincrby(day_key, json.dumps([molecule, query, geography]), 1)
+        pipe.expire(day_key, REQUEST_LOG_DAYS * 86400)
+        pipe.execute()
+
+    def popular_requests(self, since, limit):
+        days = range(int(since // 86400), int(time.time() // 86400) + 1)
+        pipe = self.client.pipeline()
+        for day in days:
+            pipe.hgetall(f"{self.prefix}requests:{day}")
+        totals = {}
+        for counts in pipe.execute():
+            for request, count in counts.items():
+                totals[request] = totals.get(request, 0) + int(count)
+        ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(*json.loads(request), count) for request, count in ranked]
+
+    def load_document(self, name):
+        return self.client.hget(f"{self.prefix}documents", name)
+
+    def save_document(self, name, blob):
+        # One hash without a TTL, outside the entries that clear() removes
+        self.client.hset(f"{self.prefix}documents", name, blob)
+
+    def describe(self):
+        return f"redis ({self.client!r}, prefix {self.prefix})"
+
+class InProcessRedis:
+    """
+    In-process stand-in for the subset of redis.Redis used by RedisCacheBackend
+
+    Lets the shared-cache code path run without a server (CACHE_BACKEND=memory,
+    local development and tests). State is per process, so it is not shared
+    between replicas.
+    """
+
+    def __init__(self):
+        self._strings = {}  # key -> (value, expires_at or None)
+        self._hashes = {}
+        self._zsets = {}
+        self._hash_expiry = {}  # hash name -> expires_at (EXPIRE on hashes)
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return "InProcessRedis()"
+
+    @staticmethod
+    def _bytes(value):
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._strings.get(name)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._strings[name]
+                return None
+            return value
+
+    def set(self, name, value, px=None, nx=False):
+        with self._lock:
+            if nx and self.get(name) is not None:
+                return None
+            expires_at = time.time() + px / 1000 if px else None
+            self._strings[name] = (self._bytes(value), expires_at)
+            return True
+
+    def exists(self, *names):
+        with self._lock:
+            return sum(self.get(name) is not None or name in self._hashes or name in self._zsets
+                       for name in names)
+
+    def delete(self, *names):
+        with self._lock:
+            removed = 0
+            for name in names:
+                self._hash_expiry.pop(name, None)
+                for store in (self._strings, self._hashes, self._zsets):
+                    if store.pop(name, None) is not None:
+                        removed += 1
+            return removed
+
+    def _hash(self, name, create=False):
+        expires_at = self._hash_expiry.get(name)
+        if expires_at is not None and expires_at <= time.time():
+            self._hashes.pop(name, None)
+            del self._hash_expiry[name]
+        return self._hashes.setdefault(name, {}) if create else self._hashes.get(name, {})
+
+    def expire(self, name, seconds):
+        with self._lock:
+            if name in self._strings:
+                self._strings[name] = (self._strings[name][0], time.time() + seconds)
+            elif name in self._hashes:
+                self._hash_expiry[name] = time.time() + seconds
+            else:
+                return False
+            return True
+
+    def hset(self, name, key, value):
+        with self._lock:
+            fields = self._hash(name, create=True)
+            added = self._bytes(key) not in fields
+            fields[self._bytes(key)] = self._bytes(value)
+            return int(added)
+
+    def hget(self, name, key):
+        with self._lock:
+            return self._hash(name).get(self._bytes(key))
+
+    def hmget(self, name, keys):
+        with self._lock:
+            fields = self._hash(name)
+            return [fields.get(self._bytes(key)) for key in keys]
+
+    def hdel(self, name, *keys):
+        with self._lock:
+            fields = self._hash(name)
+            return sum(fields.pop(self._bytes(key), None) is not None for key in keys)
+
+    def hincrby(self, name, key, amount=1):
+        with self._lock:
+            fields = self._hash(name, create=True)
+            value = int(fields.get(self._bytes(key), b"0")) + amount
+            fields[self._bytes(key)] = self._bytes(value)
+            return value
+
+    def hkeys(self, name):
+        with self._lock:
+            return list(self._hash(name))
+
+    def hvals(self, name):
+        with self._lock:
+            return list(self._hash(name).values())
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self._hash(name))
+
+    def zadd(self, name, mapping, xx=False):
+        with self._lock:
+            members = self._zsets.setdefault(name, {})
+            added = 0
+            for member, score in mapping.items():
+                member = self._bytes(member)
+                if xx and member not in members:
+                    continue
+                added += member not in members
+                members[member] = float(score)
+            return added
+
+    def zrem(self, name, *members):
+        with self._lock:
+            scores = self._zsets.get(name, {})
+            return sum(scores.pop(self._bytes(member), None) is not None for member in members)
+
+    def zscore(self, name, member):
+        with self._lock:
+            return self._zsets.get(name, {}).get(self._bytes(member))
+
+    def zrangebyscore(self, name, min, max):
+        with self._lock:
+            low, high = float(min), float(max)
+            items = sorted(self._zsets.get(name, {}).items(), key=lambda item: (item[1], item[0]))
+            return [member for member, score in items if low <= score <= high]
+
+    def zrange(self, name, start, end):
+        with self._lock:
+            items = sorted(self._zsets.get(name, {}).items(), key=lambda item: (item[1], item[0]))
+            return [member for member, _ in items[start:None if end == -1 else end + 1]]
+
+    def zcount(self, name, min, max):
+        return len(self.zrangebyscore(name, min, max))
+
+    def zrevrange(self, name, start, end):
+        with self._lock:
+            items = sorted(self._zsets.get(name, {}).items(), key=lambda item: (item[1], item[0]), reverse=True)
+            return [member for member, _ in items[start:None if end == -1 else end + 1]]
+
+    def pipeline(self, transaction=True):
+        return _InProcessPipeline(self)
+
+    def lock(self, name, timeout=None):
+        return _InProcessLock(self, name, timeout)
+
+class _InProcessPipeline:
+    """Queues commands and runs them atomically under the client's lock"""
+
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, command):
+        def queue(*args, **kwargs):
+            self._commands.append((getattr(self._client, command), args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self._client._lock:
+            results = [func(*args, **kwargs) for func, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+class _InProcessLock:
+    """Expiring lock with the same acquire/release semantics as redis-py's Lock"""
+
+    def __init__(self, client, name, timeout):
+        self._client = client
+        self._name = name
+        self._timeout = timeout
+        self._token = os.urandom(16)
+
+    def acquire(self, blocking=True, blocking_timeout=None):
+        px = int(self._timeout * 1000) if self._timeout else None
+        deadline = time.monotonic() + (blocking_timeout if blocking_timeout is not None else float("inf"))
+        while True:
+            if self._client.set(self._name, self._token, px=px, nx=True):
+                return True
+            if not blocking or time.monotonic() >= deadline:
+                return False
+            time.sleep(FILL_LOCK_POLL_INTERVAL)
+
+    def release(self):
+        with self._client._lock:
+            if self._client.get(self._name) != self._token:
+                raise RuntimeError(f"Cannot release a lock that is no longer owned: {self._name}")
+            self._client.delete(self._name)
+
+def backend_from_env(cache_dir, max_disk_bytes=None, eviction_policy="lru"):
+    """
+    Build the cache backend selected by CACHE_BACKEND
+
+    - file (default): local directory, bounded by max_disk_bytes
+    - redis: shared server at CACHE_REDIS_URL (requires redis-py)
+    - memory: InProcessRedis stand-in, for development without a server
+
+    Args:
+        cache_dir: Directory for the file backend
+        max_disk_bytes: Disk quota for the file backend
+        eviction_policy: Eviction policy for the file backend
+    """
+    kind = os.getenv("CACHE_BACKEND", "file").lower()
+    prefix = os.getenv("CACHE_KEY_PREFIX", "moleculeinsight:cache:")
+    if kind == "file":
+        return FileCacheBackend(cache_dir, max_disk_bytes=max_disk_bytes, eviction_policy=eviction_policy)
+    if kind == "redis":
+        if redis is None:
+            raise ImportError("CACHE_BACKEND=redis requires the redis package (pip install redis)")
+        url = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+        return RedisCacheBackend(redis.Redis.from_url(url), prefix=prefix)
+    if kind == "memory":
+        return RedisCacheBackend(InProcessRedis(), prefix=prefix)
+    raise ValueError(f"Unknown CACHE_BACKEND: {kind}")
@@ -4,71 +4,337 @@ Handles caching of API responses to reduce redundant calls and API quota usage
 """
 
 import os
-import json
+import time
 import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from pathlib import Path
+
+from cache_backends import (
+    FileCacheBackend,
+    backend_from_env,
+    encode_entry,
+    decode_entry,
+    zstandard,
+)
+from molecule_names import molecule_key, normalize_name
+import metrics
+
+# Per-agent freshness: entries are fresh for ttl_hours, then may be served stale
+# for stale_hours more while one background refresh replaces them.
+# Agents not listed use the manager's default expiry with no stale window.
+AGENT_TTL_POLICIES = {
+    "WebIntelligence": {"ttl_hours": 6, "stale_hours": 24},
+    "IQVIA": {"ttl_hours": 72, "stale_hours": 168},
+    "ClinicalTrials": {"ttl_hours": 72, "stale_hours": 168},
+    "clinical_trials": {"ttl_hours": 72, "stale_hours": 168},
+    "InternalKnowledge": {"ttl_hours": 168, "stale_hours": 336},
+    "InnovationStrategy": {"ttl_hours": 168, "stale_hours": 168},
+    "EXIM": {"ttl_hours": 336, "stale_hours": 720},
+    # Raw UN Comtrade responses per (HS code, year): closed years rarely change
+    "Comtrade": {"ttl_hours": 720, "stale_hours": 2160},
+    "ComtradeRecent": {"ttl_hours": 24, "stale_hours": 168},
+    # Comtrade years that came back empty: retried soon, in case of an error or late data
+    "ComtradeEmpty": {"ttl_hours": 1, "stale_hours": 0},
+    "Patent": {"ttl_hours": 336, "stale_hours": 720},
+    "Wikipedia": {"ttl_hours": 720, "stale_hours": 720},
+}
+
+# Seconds an entry is served from a process's memory tier before the backend is
+# read again, so a clear or rewrite by another worker sharing the backend shows
+# up everywhere within this bound
+MEMORY_MAX_AGE_SECONDS = float(os.getenv("CACHE_MEMORY_MAX_AGE_SECONDS", "120"))
+
+class MemoryCache:
+    """Bounded in-process LRU tier kept in front of the cache backend"""
+    
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, max_age=MEMORY_MAX_AGE_SECONDS):
+        """
+        Initialize memory tier
+        
+        Args:
+            max_entries: Maximum number of entries held
+            max_bytes: Maximum total serialized size of held entries
+            max_age: Seconds an entry is held before it must be re-read from the backend
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._entries = OrderedDict()  # cache_key -> (cached_time, data, size, loaded_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    def get(self, cache_key):
+        """Return (cached_time, data) and mark the entry most recently used, or None"""
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[3] > self.max_age:
+                self._pop(cache_key)
+                return None
+            self._entries.move_to_end(cache_key)
+            return entry[0], entry[1]
+    
+    def set(self, cache_key, cached_time, data, size):
+        """
+        Store an entry, evicting least recently used entries to stay within bounds
+        
+        Returns:
+            Keys evicted to make room
+        """
+        evicted = []
+        with self._lock:
+            self._pop(cache_key)
+            if size > self.max_bytes:
+                return evicted
+            self._entries[cache_key] = (cached_time, data, size, time.monotonic())
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                evicted_key, (_, _, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                evicted.append(evicted_key)
+        return evicted
+    
+    def delete(self, cache_key):
+        with self._lock:
+            self._pop(cache_key)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def _pop(self, cache_key):
+        entry = self._entries.pop(cache_key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
 
 class CacheManager:
     """Manages caching of API responses with expiry"""
     
-    def __init__(self, cache_dir="cache", default_expiry_hours=24):
+    def __init__(self, cache_dir="cache", default_expiry_hours=24,
+                 memory_max_entries=256, memory_max_bytes=64 * 1024 * 1024,
+                 memory_max_age_seconds=MEMORY_MAX_AGE_SECONDS, ttl_policies=None, max_disk_bytes=None, eviction_policy="lru", backend=None):
         """
         Initialize cache manager
         
         Args:
-            cache_dir: Directory to store cache files
+            cache_dir: Directory to store cache files (default file backend only)
             default_expiry_hours: Default cache expiry time in hours
+            ttl_policies: Per-agent {"ttl_hours", "stale_hours"} overrides
+                          (defaults to AGENT_TTL_POLICIES)
+            max_disk_bytes: Disk quota for cache entries (default file backend only)
+            eviction_policy: 'lru' or 'lfu' (default file backend only)
+            memory_max_entries: Entry limit for the in-memory LRU tier
+            memory_max_bytes: Size limit (serialized bytes) for the in-memory LRU tier
+            memory_max_age_seconds: How long the memory tier serves an entry before re-reading the backend
+            backend: CacheBackend to store entries in (defaults to a FileCacheBackend in cache_dir)
         """
-        self.cache_dir = Path(cache_dir)
-        self.cache_dir.mkdir(exist_ok=True)
+        if backend is None:
+            backend = FileCacheBackend(cache_dir, max_disk_bytes=max_disk_bytes, eviction_policy=eviction_policy)
+        self.backend = backend
         self.default_expiry = timedelta(hours=default_expiry_hours)
+        self.ttl_policies = AGENT_TTL_POLICIES if ttl_policies is None else ttl_policies
+        self.memory = MemoryCache(memory_max_entries, memory_max_bytes, memory_max_age_seconds)
+        # Memory hits update last_accessed at most this often per key (seconds)
+        self.touch_interval = 60
+        self._last_touched = {}
+        self._pending_hits = {}
+        self._touch_lock = threading.Lock()
+        # Stale-while-revalidate: one background refresh per key at a time
+        self._refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        self.backend.initialize(lambda agent: self._hard_expiry(agent).total_seconds())
+    
+    def ttl_for(self, agent_name):
+        """How long an agent's entries stay fresh"""
+        policy = self.ttl_policies.get(agent_name)
+        return timedelta(hours=policy["ttl_hours"]) if policy else self.default_expiry
+    
+    def stale_window_for(self, agent_name):
+        """How long past its TTL an agent's entry may still be served while refreshing"""
+        policy = self.ttl_policies.get(agent_name)
+        return timedelta(hours=policy.get("stale_hours", 0)) if policy else timedelta(0)
+    
+    def _hard_expiry(self, agent_name):
+        return self.ttl_for(agent_name) + self.stale_window_for(agent_name)
+    
+    def _freshness(self, agent_name, cached_time):
+        """Classify an entry as 'fresh', 'stale' (servable while refreshing) or 'expired'"""
+        age = datetime.now() - cached_time
+        if age <= self.ttl_for(agent_name):
+            return "fresh"
+        if age <= self._hard_expiry(agent_name):
+            return "stale"
+        return "expired"
+    
+    def _touch(self, cache_key):
+        """Record an access in the backend, throttled per key for memory hits"""
+        now = time.time()
+        with self._touch_lock:
+            hits = self._pending_hits.pop(cache_key, 0) + 1
+            if now - self._last_touched.get(cache_key, 0) < self.touch_interval:
+                self._pending_hits[cache_key] = hits
+                return
+            self._last_touched[cache_key] = now
+        self.backend.touch(cache_key, now, hits)
+    
+    def _forget_touches(self, cache_keys):
+        """Drop access bookkeeping for keys no longer held by this process"""
+        with self._touch_lock:
+            for cache_key in cache_keys:
+                self._last_touched.pop(cache_key, None)
+                self._pending_hits.pop(cache_key, None)
+    
+    def _remember(self, cache_key, cached_time, data, size):
+        """Put an entry in the memory tier, forgetting entries it evicts"""
+        evicted = self.memory.set(cache_key, cached_time, data, size)
+        if evicted:
+            self._forget_touches(evicted)
     
     def _get_cache_key(self, agent_name, molecule, **params):
         """Generate unique cache key based on parameters"""
-        # Create a string from all parameters
-        param_str = f"{agent_name}_{molecule}_" + "_".join(f"{k}={v}" for k, v in sorted(params.items()))
+        # Create a string from all parameters. Molecules are resolved to their
+        # canonical name and values compared case/whitespace-insensitively, so
+        # "Lipitor", "atorvastatin " and "Atorvastatin" share one entry.
+        param_str = f"{agent_name}_{molecule_key(molecule)}_" + "_".join(
+            f"{k}={normalize_name(str(v))}" for k, v in sorted(params.items())
+        )
         # Hash it for consistent filename
         return hashlib.md5(param_str.encode()).hexdigest()
     
-    def _get_cache_path(self, cache_key):
-        """Get full path to cache file"""
-        return self.cache_dir / f"{cache_key}.json"
+    def _lookup(self, cache_key, agent_name, molecule, record=True):
+        """
+        Find an entry in the memory tier or the backend
+        
+        Args:
+            record: Count the lookup in metrics (False for re-checks under the fill lock)
+        
+        Returns:
+            Tuple of (data, freshness) where freshness is 'fresh', 'stale' or 'miss'
+        """
+        start = time.perf_counter()
+        data, freshness = self._read_entry(cache_key, agent_name, molecule)
+        if record:
+            metrics.cache_get_seconds.observe(time.perf_counter() - start, agent=agent_name)
+            metrics.cache_lookups.inc(agent=agent_name, result=freshness)
+        return data, freshness
+    
+    def _read_entry(self, cache_key, agent_name, molecule):
+        # Memory tier first: hot entries never touch the backend
+        entry = self.memory.get(cache_key)
+        if entry is not None:
+            metrics.cache_memory_hits.inc(agent=agent_name)
+        else:
+            try:
+                blob = self.backend.read(cache_key)
+                if blob is None:
+                    self._forget_touches([cache_key])
+                    return None, "miss"
+                metrics.cache_bytes_read.inc(len(blob), agent=agent_name)
+                cache_data, raw_size = decode_entry(blob)
+                cached_time = datetime.fromisoformat(cache_data['timestamp'])
+            except Exception as e:
+                print(f"[Cache] Error reading cache: {e}")
+                return None, "miss"
+            
+            entry = (cached_time, cache_data['data'])
+            if self._freshness(agent_name, cached_time) != "expired":
+                # Read-through: promote to the memory tier with its original timestamp
+                self._remember(cache_key, cached_time, cache_data['data'], raw_size)
+        
+        cached_time, data = entry
+        freshness = self._freshness(agent_name, cached_time)
+        if freshness == "expired":
+            print(f"[Cache] Expired cache for {agent_name} - {molecule}")
+            metrics.cache_expired.inc(agent=agent_name)
+            self.memory.delete(cache_key)
+            return None, "miss"
+        
+        self._touch(cache_key)
+        return data, freshness
     
     def get(self, agent_name, molecule, **params):
         """
-        Get cached data if available and not expired
+        Get cached data if available and fresh
         
         Args:
             agent_name: Name of the agent
             molecule: Molecule name
             **params: Additional parameters for cache key
-            
+        
         Returns:
             Cached data or None if not found/expired
         """
         cache_key = self._get_cache_key(agent_name, molecule, **params)
-        cache_path = self._get_cache_path(cache_key)
-        
-        if not cache_path.exists():
+        data, freshness = self._lookup(cache_key, agent_name, molecule)
+        if freshness != "fresh":
             return None
+        print(f"[Cache] Hit for {agent_name} - {molecule}")
+        return data
+    
+    def fetch(self, agent_name, molecule, loader, **params):
+        """
+        Get cached data, running `loader` to fill the cache on a miss
         
-        try:
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
-            
-            # Check expiry
-            cached_time = datetime.fromisoformat(cache_data['timestamp'])
-            if datetime.now() - cached_time > self.default_expiry:
-                print(f"[Cache] Expired cache for {agent_name} - {molecule}")
-                return None
-            
+        Stale entries (past their TTL but inside the agent's stale window) are
+        returned immediately while a single background refresh replaces them.
+        
+        Args:
+            agent_name: Name of the agent
+            molecule: Molecule name
+            loader: Zero-argument callable producing fresh data
+            **params: Additional parameters for cache key
+        
+        Returns:
+            Tuple of (data, status) where status is 'fresh', 'stale' or 'miss'
+        """
+        cache_key = self._get_cache_key(agent_name, molecule, **params)
+        data, freshness = self._lookup(cache_key, agent_name, molecule)
+        
+        if freshness == "fresh":
             print(f"[Cache] Hit for {agent_name} - {molecule}")
-            return cache_data['data']
+            return data, freshness
+        
+        if freshness == "stale":
+            print(f"[Cache] Serving stale {agent_name} - {molecule} while refreshing")
+            self._schedule_refresh(cache_key, agent_name, molecule, loader, params)
+            return data, freshness
+        
+        # Only one process fills a key; the rest wait and then read its result
+        with self.backend.fill_lock(cache_key):
+            data, freshness = self._lookup(cache_key, agent_name, molecule, record=False)
+            if freshness == "fresh":
+                print(f"[Cache] Filled by another worker: {agent_name} - {molecule}")
+                return data, freshness
             
-        except Exception as e:
-            print(f"[Cache] Error reading cache: {e}")
-            return None
+            data = loader()
+            self.set(agent_name, molecule, data, **params)
+        return data, "miss"
+    
+    def _schedule_refresh(self, cache_key, agent_name, molecule, loader, params):
+        """Refresh an entry in the background unless a refresh is already running"""
+        with self._refresh_lock:
+            if cache_key in self._refreshing:
+                return
+            self._refreshing.add(cache_key)
+        
+        def refresh():
+            try:
+                # Skip if another process is already refreshing this entry
+                with self.backend.fill_lock(cache_key, blocking=False) as acquired:
+                    if acquired:
+                        self.set(agent_name, molecule, loader(), **params)
+            except Exception as e:
+                print(f"[Cache] Background refresh failed for {agent_name} - {molecule}: {e}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(cache_key)
+        
+        self._refresh_executor.submit(refresh)
     
     def set(self, agent_name, molecule, data, **params):
         """
@@ -81,70 +347,146 @@ class CacheManager:
             **params: Additional parameters for cache key
         """
         cache_key = self._get_cache_key(agent_name, molecule, **params)
-        cache_path = self._get_cache_path(cache_key)
         
+        cached_time = datetime.now()
         cache_data = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': cached_time.isoformat(),
             'agent': agent_name,
             'molecule': molecule,
             'params': params,
             'data': data
         }
         
+        start = time.perf_counter()
         try:
-            with open(cache_path, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, indent=2)
+            blob, raw_size = encode_entry(cache_data)
+            created = cached_time.timestamp()
+            evicted = self.backend.write(cache_key, blob, agent_name, molecule, created,
+                                         created + self._hard_expiry(agent_name).total_seconds())
+            metrics.cache_set_seconds.observe(time.perf_counter() - start, agent=agent_name)
+            metrics.cache_bytes_written.inc(len(blob), agent=agent_name)
+            if evicted:
+                metrics.cache_evictions.inc(len(evicted))
+            self._forget(evicted)
+            # Write-through: keep the memory tier in step with the backend
+            self._remember(cache_key, cached_time, data, raw_size)
             print(f"[Cache] Stored for {agent_name} - {molecule}")
         except Exception as e:
+            self.memory.delete(cache_key)
             print(f"[Cache] Error writing cache: {e}")
     
+    def lock(self, agent_name, molecule, **params):
+        """
+        Lock one entry across every process sharing the backend
+        
+        For read-modify-write updates of an entry (see news_store), so
+        concurrent workers do not overwrite each other's changes.
+        
+        Returns:
+            Context manager yielding True if the lock is held
+        """
+        return self.backend.fill_lock(self._get_cache_key(agent_name, molecule, **params))
+    
+    def load_document(self, agent_name, molecule, **params):
+        """
+        Read state saved with save_document
+        
+        Returns:
+            The saved data, or None if nothing was saved
+        """
+        blob = self.backend.load_document(self._get_cache_key(agent_name, molecule, **params))
+        return decode_entry(blob)[0] if blob else None
+    
+    def save_document(self, agent_name, molecule, data, **params):
+        """
+        Persist state that must outlive the cache (see news_store)
+        
+        Unlike set(), documents bypass the memory tier, never expire, are
+        never evicted and survive clear_all. Hold lock() around a
+        read-modify-write.
+        """
+        blob, _ = encode_entry(data)
+        self.backend.save_document(self._get_cache_key(agent_name, molecule, **params), blob)
+    
+    def _forget(self, cache_keys):
+        """Drop entries removed from the backend from this process's memory tier"""
+        for cache_key in cache_keys:
+            self.memory.delete(cache_key)
+        self._forget_touches(cache_keys)
+    
     def clear_expired(self):
         """Remove all expired cache files"""
-        count = 0
-        for cache_file in self.cache_dir.glob("*.json"):
-            try:
-                with open(cache_file, 'r') as f:
-                    cache_data = json.load(f)
-                cached_time = datetime.fromisoformat(cache_data['timestamp'])
-                if datetime.now() - cached_time > self.default_expiry:
-                    cache_file.unlink()
-                    count += 1
-            except Exception:
-                pass
+        expired = self.backend.expired_keys(time.time())
+        self.backend.delete(expired)
+        self._forget(expired)
+        count = len(expired)
         print(f"[Cache] Cleared {count} expired files")
         return count
     
     def clear_all(self):
         """Clear all cache files"""
-        count = 0
-        for cache_file in self.cache_dir.glob("*.json"):
-            cache_file.unlink()
-            count += 1
+        self.memory.clear()
+        with self._touch_lock:
+            self._last_touched.clear()
+            self._pending_hits.clear()
+        count = self.backend.clear()
         print(f"[Cache] Cleared {count} files")
         return count
     
-    def get_cache_info(self):
-        """Get information about cached data"""
+    def record_request(self, molecule, query="", geography="Global"):
+        """Log an analysis request so warm-up can replay the most popular ones"""
+        try:
+            self.backend.record_request(molecule_key(molecule), normalize_name(query),
+                                        geography or "Global", time.time())
+        except Exception as e:
+            print(f"[Cache] Error recording request: {e}")
+    
+    def popular_requests(self, days=7, limit=20):
+        """
+        Most requested (molecule, query, geography, count) over the last `days` days
+        
+        Molecules and queries are returned in their normalized (cache key) form.
+        """
+        return self.backend.popular_requests(time.time() - days * 86400, limit)
+    
+    def get_cache_stats(self):
+        """Entry count, total bytes and expired count, answered from backend metadata"""
+        return self.backend.stats(time.time())
+    
+    def get_cache_info(self, limit=100):
+        """
+        Get information about cached data
+        
+        Args:
+            limit: Maximum number of (most recent) entries to list
+        """
         info = []
-        for cache_file in self.cache_dir.glob("*.json"):
-            try:
-                with open(cache_file, 'r') as f:
-                    cache_data = json.load(f)
-                cached_time = datetime.fromisoformat(cache_data['timestamp'])
-                age = datetime.now() - cached_time
-                info.append({
-                    'agent': cache_data.get('agent'),
-                    'molecule': cache_data.get('molecule'),
-                    'age_hours': age.total_seconds() / 3600,
-                    'expired': age > self.default_expiry
-                })
-            except Exception:
-                pass
+        now = time.time()
+        for agent, molecule, size, created, last_accessed, expires in self.backend.recent(limit):
+            age_seconds = now - created
+            info.append({
+                'agent': agent,
+                'molecule': molecule,
+                'size_bytes': size,
+                'age_hours': age_seconds / 3600,
+                'last_accessed_hours': (now - last_accessed) / 3600,
+                'stale': age_seconds > self.ttl_for(agent).total_seconds(),
+                'expired': expires is not None and expires < now
+            })
         return info
 
 
 # Global cache instance
 cache_manager = CacheManager(
-    cache_dir=os.path.join(os.path.dirname(__file__), "cache"),
-    default_expiry_hours=24  
+    default_expiry_hours=168,  # 7 days, for agents without a TTL policy
+    backend=backend_from_env(
+        cache_dir=os.path.join(os.path.dirname(__file__), "cache"),
+        max_disk_bytes=int(float(os.getenv("CACHE_MAX_DISK_MB", "1024")) * 1024 * 1024),
+        eviction_policy=os.getenv("CACHE_EVICTION_POLICY", "lru")
+    )
 )
+
+metrics.Gauge("moleculeinsight_cache_entries", "Entries in the cache backend",
+              lambda: cache_manager.get_cache_stats()["count"])
+metrics.Gauge("moleculeinsight_cache_size_bytes", "Encoded size of all entries in the cache backend",
+              lambda: cache_manager.get_cache_stats()["total_bytes"])
@@ -0,0 +1,86 @@
+"""
+Cancellation for MoleculeInsight
+Lets a request cancel the agent work it started (e.g. when the client disconnects)
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+
+class AnalysisCancelled(BaseException):
+    """
+    Raised inside agent threads when the request that started them was cancelled
+
+    Derives from BaseException (like asyncio.CancelledError) so the agents'
+    broad `except Exception` fallbacks don't turn it into a cached error report.
+    """
+
+
+class CancelToken:
+    """Thread-safe flag shared between a request and the agent threads it started"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason = None
+
+    def cancel(self, reason="cancelled"):
+        self.reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, seconds):
+        """Block for up to `seconds`; True if cancelled meanwhile"""
+        return self._event.wait(seconds)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise AnalysisCancelled(self.reason)
+
+
+_local = threading.local()
+
+
+@contextmanager
+def bind(token):
+    """Make `token` the current cancel token for the calling thread"""
+    previous = getattr(_local, "token", None)
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+def current_token():
+    """Cancel token bound to the calling thread, if any"""
+    return getattr(_local, "token", None)
+
+
+def sleep(seconds):
+    """
+    Sleep, waking early to abort if the current request is cancelled
+
+    Used for retry backoff so a cancelled agent does not sit out its delay.
+    """
+    token = current_token()
+    if token is None:
+        time.sleep(seconds)
+        return
+    token.wait(seconds)
+    token.raise_if_cancelled()
+
+
+def check_cancelled():
+    """
+    Abort the current agent if its request was cancelled
+
+    Called before every upstream call (see rate_limiter.limit), so cancelled
+    agents stop at their next HTTP/LLM request instead of running to completion.
+    """
+    token = current_token()
+    if token is not None:
+        token.raise_if_cancelled()
@@ -0,0 +1,93 @@
+"""
+CPU Pool for MoleculeInsight
+Runs CPU-heavy parsing of large JSON payloads in worker processes so I/O-bound agent threads are not starved of the GIL
+
+Used for response bodies that are decoded whole (see clinical_trials_agent
+without ijson). Rollups stay in-thread: they work on the compact records
+from records.py and count in C, so shipping the records to a worker would
+cost more than the rollup itself.
+"""
+
+import os
+import json
+import atexit
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Worker processes for CPU-bound stages (0 disables the pool and runs everything in-thread)
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+# Payloads below this size are cheaper to process in-thread than to ship to another process
+INLINE_THRESHOLD_BYTES = int(os.getenv("CPU_POOL_INLINE_BYTES", str(256 * 1024)))
+
+# How worker processes are started; the server is heavily threaded, so never fork it directly
+CPU_POOL_START_METHOD = os.getenv(
+    "CPU_POOL_START_METHOD",
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn",
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Get the shared process pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=CPU_POOL_WORKERS,
+                                            mp_context=multiprocessing.get_context(CPU_POOL_START_METHOD))
+    return _pool
+
+
+def shutdown():
+    """Stop the worker processes (called on server shutdown)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown)
+
+
+def encode_payload(data):
+    """Serialize data as compact UTF-8 JSON for the trip to a worker process"""
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _run_task(module_name, func_name, payload):
+    """Worker-side entry point: decode the payload and call the target function"""
+    func = getattr(importlib.import_module(module_name), func_name)
+    return func(json.loads(payload))
+
+
+def run_cpu_bound(func, data):
+    """
+    Run a CPU-heavy function on decoded JSON data, in a worker process when worthwhile
+
+    Args:
+        func: Module-level function taking the decoded data (must be importable
+              by module name in a worker, e.g. from data_processor)
+        data: Raw JSON bytes (e.g. an HTTP response body) or a JSON-serializable object
+
+    Returns:
+        The function's return value
+    """
+    is_raw = isinstance(data, (bytes, bytearray))
+    payload = bytes(data) if is_raw else encode_payload(data)
+
+    if CPU_POOL_WORKERS <= 0 or len(payload) < INLINE_THRESHOLD_BYTES:
+        return func(json.loads(payload) if is_raw else data)
+
+    try:
+        future = get_pool().submit(_run_task, func.__module__, func.__name__, payload)
+        return future.result()
+    except RuntimeError as e:
+        # Pool shut down or broken (e.g. during reload) - fall back to in-thread
+        print(f"[CPU Pool] Falling back to in-thread processing: {e}")
+        return func(json.loads(payload))
@@ -1,8 +1,339 @@
 """
 Data Processor for MoleculeInsight
 Pre-processes and summarizes API data to reduce LLM token usage
+
+Functions here take plain JSON data or the compact records built from it
+(see records.py). The parse_* functions live at module level so cpu_pool can
+run them in worker processes for large response bodies. Rollups are built from mergeable aggregates
+(see aggregates.py), so paginated sources can be summarized page by page.
 """
 
+from itertools import chain
+from operator import attrgetter, itemgetter
+
+try:
+    import ijson
+except ImportError:  # Optional: pages are decoded whole instead of streamed
+    ijson = None
+
+from aggregates import Aggregate, CountTable, TopK, DateRange
+from records import Trial, Patent, TradeRow
+
+# Patent titles kept as samples for the report
+SAMPLE_TITLES = 10
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def study_to_trial(study):
+    """
+    Convert one ClinicalTrials.gov API v2 study into a Trial record
+    """
+    protocol = study.get("protocolSection", {})
+    identification = protocol.get("identificationModule", {})
+    status = protocol.get("statusModule", {})
+    design = protocol.get("designModule", {})
+    sponsor = protocol.get("sponsorCollaboratorsModule", {})
+    locations = protocol.get("contactsLocationsModule", {})
+
+    # Safely extract phases
+    phases = design.get("phases", [])
+    phase_value = phases[0] if phases else "Unknown"
+
+    # Safely extract enrollment count
+    enrollment_info = design.get("enrollmentInfo", {})
+    enrollment_count = _to_int(enrollment_info.get("count", 0))
+
+    # Safely extract start date (None when the study has none, so it is not counted as a year)
+    start_date = status.get("startDateStruct", {}).get("date")
+
+    # Distinct countries in first-listed order
+    countries = dict.fromkeys(loc["country"] for loc in locations.get("locations", []) if "country" in loc)
+
+    return Trial(
+        nct_id=identification.get("nctId"),
+        phase=phase_value,
+        status=status.get("overallStatus", "Unknown"),
+        start_date=start_date,
+        sponsor=sponsor.get("leadSponsor", {}).get("name", "Unknown"),
+        enrollment=enrollment_count,
+        countries=countries,
+    )
+
+
+def patent_record(patent):
+    """
+    Convert one PatentsView patent into a Patent record
+    """
+    assignees = patent.get("assignees") or []
+    return Patent(
+        title=patent.get("patent_title"),
+        date=patent.get("patent_date"),
+        assignees=[a.get("assignee_organization", "Unknown") for a in assignees],
+        assignee_countries=[a.get("assignee_country", "Unknown") for a in assignees],
+        cpcs=[c.get("cpc_subsection_id", "Unknown") for c in patent.get("cpcs") or []],
+    )
+
+
+def trade_record(row):
+    """
+    Convert one UN Comtrade record into a TradeRow
+    """
+    return TradeRow(
+        year=row.get("yr"),
+        value=row.get("TradeValue") or 0,
+        flow=(row.get("rgDesc") or "").lower(),
+        reporter=row.get("rtTitle", "Unknown"),
+    )
+
+
+def parse_clinical_trials_response(data):
+    """
+    Convert a ClinicalTrials.gov API v2 response into Trial records
+    """
+    if "studies" not in data:
+        print(f"[Clinical Trials] ✗ Unexpected API response structure")
+        print(f"[Clinical Trials] Response keys: {list(data.keys())}")
+        return []
+
+    return [study_to_trial(study) for study in data["studies"]]
+
+
+def parse_clinical_trials_page(data):
+    """
+    Parse one page of a paginated ClinicalTrials.gov API v2 response
+
+    Returns:
+        Tuple of (Trial records, nextPageToken or None, totalCount or None)
+    """
+    return parse_clinical_trials_response(data), data.get("nextPageToken"), data.get("totalCount")
+
+
+def parse_clinical_trials_stream(stream):
+    """
+    Like parse_clinical_trials_page, but reads the page incrementally from a
+    file-like byte stream (e.g. a streamed HTTP body) with ijson, converting
+    each study as soon as it has been read instead of decoding the whole body first
+
+    Requires ijson; callers check `ijson is not None` and otherwise decode the
+    body and use parse_clinical_trials_page.
+    """
+    trials, next_token, total, builder = [], None, None, None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == "studies.item" and event == "end_map":
+                trials.append(study_to_trial(builder.value))
+                builder = None
+        elif prefix == "studies.item" and event == "start_map":
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+        elif prefix == "nextPageToken":
+            next_token = value
+        elif prefix == "totalCount":
+            total = int(value)
+    return trials, next_token, total
+
+
+_phase, _status, _sponsor = attrgetter("phase"), attrgetter("status"), attrgetter("sponsor")
+_start_date, _countries, _enrollment = attrgetter("start_date"), attrgetter("countries"), attrgetter("enrollment")
+_assignees, _assignee_countries, _cpcs = attrgetter("assignees"), attrgetter("assignee_countries"), attrgetter("cpcs")
+_date = attrgetter("date")
+# Year of an ISO date ("2021-03-15" -> "2021")
+_year_of = itemgetter(slice(0, 4))
+
+
+class TrialAggregate(Aggregate):
+    """
+    Phase, status, sponsor, start-year and country counts plus total enrollment
+
+    Add each page of trial records to one running aggregate with add_page()
+    (merge() is for combining aggregates from separate workers); result() can
+    be read at any point. Fields are
+    counted with Counter over attrgetter maps, so the per-record work runs in C.
+    """
+
+    __slots__ = ("total_trials", "phases", "statuses", "sponsors", "years",
+                 "countries", "start_dates", "enrollment_total")
+
+    def __init__(self):
+        self.total_trials = 0
+        self.phases = CountTable()
+        self.statuses = CountTable()
+        self.sponsors = TopK()
+        self.years = CountTable()
+        self.countries = TopK()
+        self.start_dates = DateRange()
+        self.enrollment_total = 0
+
+    def add_page(self, trials):
+        """
+        Args:
+            trials: Trial records from parse_clinical_trials_response
+        """
+        self.phases.add(map(_phase, trials))
+        self.statuses.add(map(_status, trials))
+        self.sponsors.add(map(_sponsor, trials))
+        dates = list(filter(None, map(_start_date, trials)))
+        self.years.add(map(_year_of, dates))
+        self.start_dates.add(dates)
+        self.countries.add(chain.from_iterable(map(_countries, trials)))
+        self.enrollment_total += sum(map(_enrollment, trials))
+        self.total_trials += len(trials)
+        return self
+
+    def result(self, top_sponsors=None, top_countries=None):
+        """
+        Args:
+            top_sponsors: Keep only the largest N sponsors (None for all)
+            top_countries: Keep only the largest N countries (None for all)
+        """
+        return {
+            "phase_count": self.phases.top(),
+            "status_count": self.statuses.top(),
+            "sponsor_count": self.sponsors.top(top_sponsors),
+            "year_count": self.years.to_dict(),
+            "country_count": self.countries.top(top_countries),
+            "enrollment_total": self.enrollment_total,
+            "total_trials": self.total_trials,
+            "start_date_range": self.start_dates.to_dict(),
+        }
+
+
+class PatentAggregate(Aggregate):
+    """Assignee, assignee-country, CPC subsection and grant-year counts, page by page"""
+
+    __slots__ = ("total_patents", "assignees", "countries", "cpcs", "years", "grant_dates", "titles")
+
+    def __init__(self):
+        self.total_patents = 0
+        self.assignees = TopK()
+        self.countries = CountTable()
+        self.cpcs = CountTable()
+        self.years = CountTable()
+        self.grant_dates = DateRange()
+        self.titles = []
+
+    def add_page(self, patents):
+        """
+        Args:
+            patents: Patent records from patent_record
+        """
+        self.assignees.add(chain.from_iterable(map(_assignees, patents)))
+        self.countries.add(chain.from_iterable(map(_assignee_countries, patents)))
+        self.cpcs.add(chain.from_iterable(map(_cpcs, patents)))
+        dates = list(filter(None, map(_date, patents)))
+        self.years.add(map(_year_of, dates))
+        self.grant_dates.add(dates)
+        if len(self.titles) < SAMPLE_TITLES:
+            self.titles.extend(p.title for p in patents if p.title)
+            del self.titles[SAMPLE_TITLES:]
+        self.total_patents += len(patents)
+        return self
+
+    def merge(self, other):
+        super().merge(other)
+        del self.titles[SAMPLE_TITLES:]
+        return self
+
+    def result(self, top=None):
+        """
+        Args:
+            top: Keep only the largest N of each breakdown (None for all)
+        """
+        return {
+            "total_patents": self.total_patents,
+            "assignee_count": self.assignees.top(top),
+            "country_count": self.countries.top(top),
+            "cpc_count": self.cpcs.top(top),
+            "year_count": self.years.to_dict(),
+            "titles": list(self.titles),
+            "grant_date_range": self.grant_dates.to_dict(),
+        }
+
+
+class TradeAggregate(Aggregate):
+    """Import/export value per year and per reporting country plus the grand total, page by page"""
+
+    __slots__ = ("total_records", "years", "yearly_imports", "yearly_exports",
+                 "importers", "exporters", "total_trade_value")
+
+    def __init__(self):
+        self.total_records = 0
+        self.years = CountTable()
+        self.yearly_imports = CountTable()
+        self.yearly_exports = CountTable()
+        self.importers = CountTable()
+        self.exporters = CountTable()
+        self.total_trade_value = 0.0
+
+    def add_page(self, trades):
+        """
+        Args:
+            trades: TradeRow records from trade_record
+        """
+        # Plain dicts in the loop, folded into the running tables once per page
+        years, yearly_imports, yearly_exports, importers, exporters = {}, {}, {}, {}, {}
+        total = 0.0
+        for d in trades:
+            year, value, flow = d.year, d.value, d.flow
+            years[year] = years.get(year, 0) + 1
+            if flow == "import":
+                yearly_imports[year] = yearly_imports.get(year, 0.0) + value
+                importers[d.reporter] = importers.get(d.reporter, 0.0) + value
+            elif flow == "export":
+                yearly_exports[year] = yearly_exports.get(year, 0.0) + value
+                exporters[d.reporter] = exporters.get(d.reporter, 0.0) + value
+            total += value
+        self.years.add_totals(years)
+        # Yearly sums in the order years first appeared, whatever the flow
+        self.yearly_imports.add_totals({year: yearly_imports[year] for year in years if year in yearly_imports})
+        self.yearly_exports.add_totals({year: yearly_exports[year] for year in years if year in yearly_exports})
+        self.importers.add_totals(importers)
+        self.exporters.add_totals(exporters)
+        self.total_trade_value += total
+        self.total_records += len(trades)
+        return self
+
+    def result(self, top=None):
+        """
+        Args:
+            top: Keep only the largest N importers/exporters (None for all)
+        """
+        imports, exports = self.yearly_imports.counts, self.yearly_exports.counts
+        return {
+            "yearly_trade": {
+                year: {"import": float(imports.get(year, 0.0)), "export": float(exports.get(year, 0.0))}
+                for year in self.years.counts
+            },
+            "yearly_imports": self.yearly_imports.to_dict(),
+            "yearly_exports": self.yearly_exports.to_dict(),
+            "top_importers": self.importers.top(top),
+            "top_exporters": self.exporters.top(top),
+            "total_trade_value": self.total_trade_value,
+        }
+
+
+def rollup_trials(trials, top_sponsors=None, top_countries=None):
+    """TrialAggregate result for a complete list of trials"""
+    return TrialAggregate().add_page(trials).result(top_sponsors, top_countries)
+
+
+def rollup_patents(patents, top=None):
+    """PatentAggregate result for a complete list of patents"""
+    return PatentAggregate().add_page(patents).result(top)
+
+
+def rollup_trade(trades, top=None):
+    """TradeAggregate result for a complete list of trade records"""
+    return TradeAggregate().add_page(trades).result(top)
+
+
 def summarize_clinical_trials(trials_data):
     """
     Process clinical trials data to extract only essential information
@@ -11,65 +342,26 @@ def summarize_clinical_trials(trials_data):
     if not trials_data:
         return {}
     
-    summary = {
-        "total_trials": len(trials_data),
-        "phase_distribution": {},
-        "status_distribution": {},
-        "top_sponsors": {},
-        "countries": {},
-        "yearly_trend": {},
-        "sample_trials": []
+    rollup = rollup_trials(trials_data, top_sponsors=10, top_countries=20)
+    return {
+        "total_trials": rollup["total_trials"],
+        "phase_distribution": rollup["phase_count"],
+        "status_distribution": rollup["status_count"],
+        "top_sponsors": rollup["sponsor_count"],
+        "countries": rollup["country_count"],
+        "yearly_trend": rollup["year_count"],
+        "start_date_range": rollup["start_date_range"],
+        # Keep 5 sample trials for context
+        "sample_trials": [
+            {
+                "Phase": t.phase,
+                "Status": t.status,
+                "Sponsor": t.sponsor,
+                "StartDate": t.start_date or "N/A"
+            }
+            for t in trials_data[:5]
+        ]
     }
-    
-    for trial in trials_data:
-        # Phase
-        phase = trial.get("Phase", ["Unknown"])[0]
-        summary["phase_distribution"][phase] = summary["phase_distribution"].get(phase, 0) + 1
-        
-        # Status
-        status = trial.get("OverallStatus", ["Unknown"])[0]
-        summary["status_distribution"][status] = summary["status_distribution"].get(status, 0) + 1
-        
-        # Sponsor
-        sponsor = trial.get("LeadSponsorName", ["Unknown"])[0]
-        summary["top_sponsors"][sponsor] = summary["top_sponsors"].get(sponsor, 0) + 1
-        
-        # Year
-        if "StartDate" in trial and trial["StartDate"]:
-            year = trial["StartDate"][0].split("-")[0]
-            summary["yearly_trend"][year] = summary["yearly_trend"].get(year, 0) + 1
-        
-        # Countries
-        if "LocationCountry" in trial:
-            for country in trial["LocationCountry"]:
-                summary["countries"][country] = summary["countries"].get(country, 0) + 1
-    
-    # Keep only top 10 sponsors
-    summary["top_sponsors"] = dict(sorted(
-        summary["top_sponsors"].items(), 
-        key=lambda x: x[1], 
-        reverse=True
-    )[:10])
-    
-    # Keep only top 20 countries
-    summary["countries"] = dict(sorted(
-        summary["countries"].items(), 
-        key=lambda x: x[1], 
-        reverse=True
-    )[:20])
-    
-    # Keep 5 sample trials for context
-    summary["sample_trials"] = [
-        {
-            "Phase": t.get("Phase", ["N/A"])[0],
-            "Status": t.get("OverallStatus", ["N/A"])[0],
-            "Sponsor": t.get("LeadSponsorName", ["N/A"])[0],
-            "StartDate": t.get("StartDate", ["N/A"])[0]
-        }
-        for t in trials_data[:5]
-    ]
-    
-    return summary
 
 
 def summarize_patents(patents_data):
@@ -79,60 +371,16 @@ def summarize_patents(patents_data):
     if not patents_data:
         return {}
     
-    summary = {
-        "total_patents": len(patents_data),
-        "assignees": {},
-        "countries": {},
-        "cpc_codes": {},
-        "yearly_trend": {},
-        "sample_titles": []
+    rollup = rollup_patents(patents_data, top=10)
+    return {
+        "total_patents": rollup["total_patents"],
+        "assignees": rollup["assignee_count"],
+        "countries": rollup["country_count"],
+        "cpc_codes": rollup["cpc_count"],
+        "yearly_trend": rollup["year_count"],
+        "grant_date_range": rollup["grant_date_range"],
+        "sample_titles": rollup["titles"]
     }
-    
-    for patent in patents_data:
-        # Year
-        if "patent_date" in patent:
-            year = patent["patent_date"].split("-")[0]
-            summary["yearly_trend"][year] = summary["yearly_trend"].get(year, 0) + 1
-        
-        # Assignees
-        if "assignees" in patent:
-            for assignee in patent["assignees"]:
-                org = assignee.get("assignee_organization", "Unknown")
-                summary["assignees"][org] = summary["assignees"].get(org, 0) + 1
-                
-                country = assignee.get("assignee_country", "Unknown")
-                summary["countries"][country] = summary["countries"].get(country, 0) + 1
-        
-        # CPC codes
-        if "cpcs" in patent:
-            for cpc in patent["cpcs"]:
-                code = cpc.get("cpc_subsection_id", "Unknown")
-                summary["cpc_codes"][code] = summary["cpc_codes"].get(code, 0) + 1
-        
-        # Sample titles
-        if "patent_title" in patent and len(summary["sample_titles"]) < 10:
-            summary["sample_titles"].append(patent["patent_title"])
-    
-    # Keep only top 10 for each category
-    summary["assignees"] = dict(sorted(
-        summary["assignees"].items(), 
-        key=lambda x: x[1], 
-        reverse=True
-    )[:10])
-    
-    summary["countries"] = dict(sorted(
-        summary["countries"].items(), 
-        key=lambda x: x[1], 
-        reverse=True
-    )[:10])
-    
-    summary["cpc_codes"] = dict(sorted(
-        summary["cpc_codes"].items(), 
-        key=lambda x: x[1], 
-        reverse=True
-    )[:10])
-    
-    return summary
 
 
 def summarize_trade_data(trade_data):
@@ -142,44 +390,15 @@ def summarize_trade_data(trade_data):
     if not trade_data:
         return {}
     
-    summary = {
+    rollup = rollup_trade(trade_data, top=10)
+    return {
         "total_records": len(trade_data),
-        "yearly_imports": {},
-        "yearly_exports": {},
-        "top_exporters": {},
-        "top_importers": {},
-        "total_value": 0
+        "yearly_imports": {str(year): value for year, value in rollup["yearly_imports"].items()},
+        "yearly_exports": {str(year): value for year, value in rollup["yearly_exports"].items()},
+        "top_exporters": rollup["top_exporters"],
+        "top_importers": rollup["top_importers"],
+        "total_value": rollup["total_trade_value"]
     }
-    
-    for record in trade_data:
-        year = record.get("yr")
-        value = record.get("TradeValue", 0)
-        flow = record.get("rgDesc", "").lower()
-        reporter = record.get("rtTitle", "Unknown")
-        
-        summary["total_value"] += value
-        
-        if flow == "import":
-            summary["yearly_imports"][str(year)] = summary["yearly_imports"].get(str(year), 0) + value
-            summary["top_importers"][reporter] = summary["top_importers"].get(reporter, 0) + value
-        elif flow == "export":
-            summary["yearly_exports"][str(year)] = summary["yearly_exports"].get(str(year), 0) + value
-            summary["top_exporters"][reporter] = summary["top_exporters"].get(reporter, 0) + value
-    
-    # Keep top 10
-    summary["top_exporters"] = dict(sorted(
-        summary["top_exporters"].items(), 
-        key=lambda x: x[1], 
-        reverse=True
-    )[:10])
-    
-    summary["top_importers"] = dict(sorted(
-        summary["top_importers"].items(), 
-        key=lambda x: x[1], 
-        reverse=True
-    )[:10])
-    
-    return summary
 
 
 def summarize_news_articles(articles):
@@ -0,0 +1,271 @@
+"""
+HTTP Client for MoleculeInsight
+Shared keep-alive connection pools, timeouts, retries and per-host latency metrics for every upstream API call
+"""
+
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from cancellation import sleep as cancellable_sleep
+from rate_limiter import get_limiter
+from replay import replay
+
+try:
+    import httpx
+except ImportError:  # Optional: only needed for HTTP_CLIENT_HTTP2
+    httpx = None
+
+# (connect, read) timeouts in seconds applied to every call unless overridden
+DEFAULT_TIMEOUT = (float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")), float(os.getenv("HTTP_READ_TIMEOUT", "30")))
+
+# Retries on RETRY_STATUSES and network errors, backing off exponentially from HTTP_BACKOFF seconds
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "1.0"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Keep-alive connections kept open per upstream host
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+# Multiplex calls to each host over one HTTP/2 connection (needs httpx[http2])
+HTTP2_ENABLED = os.getenv("HTTP_CLIENT_HTTP2", "").lower() in ("1", "true", "yes")
+
+
+class _ChunkStream:
+    """File-like read() over an iterator of byte chunks (for streaming parsers)"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class _Http2Response:
+    """The parts of requests.Response the agents use, over an httpx response"""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = str(response.url)
+
+    @property
+    def content(self):
+        return self._response.read()
+
+    @property
+    def raw(self):
+        return _ChunkStream(self._response.iter_bytes())
+
+    def json(self):
+        return self._response.json()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+    def close(self):
+        self._response.close()
+
+
+class HttpClient:
+    """
+    Per-host pooled sessions with uniform timeouts, retries and metrics
+
+    Every call can name the rate-limiter provider it is billed to; a slot is
+    held for each attempt, so retries also respect the provider's budget.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF,
+                 pool_size=HTTP_POOL_SIZE, http2=HTTP2_ENABLED):
+        """
+        Args:
+            timeout: Default (connect, read) timeout in seconds
+            retries: Default retries per call on RETRY_STATUSES and network errors
+            backoff: First retry delay in seconds, doubled for each further retry
+            pool_size: Keep-alive connections per host
+            http2: Use HTTP/2 through httpx when it is installed
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.http2 = http2 and httpx is not None
+        if http2 and httpx is None:
+            print("[HTTP] HTTP/2 requested but httpx is not installed; using HTTP/1.1")
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _session(self, host):
+        """The shared session for one host, created on first use"""
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    if self.http2:
+                        session = httpx.Client(http2=True, limits=httpx.Limits(
+                            max_connections=self.pool_size, max_keepalive_connections=self.pool_size))
+                    else:
+                        session = requests.Session()
+                        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                        session.mount("https://", adapter)
+                        session.mount("http://", adapter)
+                    self._sessions[host] = session
+        return session
+
+    def _send(self, session, method, url, timeout, stream, kwargs):
+        # In record/replay mode the exchange goes through fixtures (REPLAY_MODE)
+        return replay.http(method, url, kwargs,
+                           lambda: self._transport(session, method, url, timeout, stream, kwargs))
+
+    def _transport(self, session, method, url, timeout, stream, kwargs):
+        if not self.http2:
+            return session.request(method, url, timeout=timeout, stream=stream, **kwargs)
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        try:
+            request = session.build_request(method, url, timeout=httpx.Timeout(read, connect=connect), **kwargs)
+            response = session.send(request, stream=True)
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e)) from e
+        if not stream:
+            response.read()
+        return _Http2Response(response)
+
+    def _attempts(self, method, url, provider, api_key, cost, timeout, retries, stream, kwargs):
+        """
+        Send with retries, holding a provider slot from each attempt until the caller is done
+
+        Returns:
+            Tuple of (response, limiter or None); the caller releases the limiter
+        """
+        host = urlsplit(url).netloc
+        session = self._session(host)
+        timeout = timeout or self.timeout
+        retries = self.retries if retries is None else retries
+        limiter = get_limiter(provider, api_key) if provider else None
+
+        for attempt in range(retries + 1):
+            last_attempt = attempt == retries
+            if limiter:
+                limiter.acquire(cost)
+            start = time.perf_counter()
+            try:
+                response = self._send(session, method, url, timeout, stream, kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if limiter:
+                    limiter.release()
+                metrics.upstream_requests.inc(host=host, status="error")
+                if last_attempt:
+                    raise
+                reason, delay = type(e).__name__, None
+            except BaseException:
+                if limiter:
+                    limiter.release()
+                raise
+            else:
+                metrics.upstream_seconds.observe(time.perf_counter() - start, host=host)
+                metrics.upstream_requests.inc(host=host, status=str(response.status_code))
+                if response.status_code not in RETRY_STATUSES or last_attempt:
+                    return response, limiter
+                response.close()
+                if limiter:
+                    limiter.release()
+                reason, delay = f"HTTP {response.status_code}", _retry_after(response)
+
+            if delay is None:
+                # Exponential backoff with jitter so parallel callers don't retry in lockstep
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+            metrics.upstream_retries.inc(host=host)
+            print(f"[HTTP] {reason} from {host}; retry {attempt + 1}/{retries} in {delay:.1f}s")
+            cancellable_sleep(delay)
+
+    def request(self, method, url, provider=None, api_key=None, cost=1, timeout=None, retries=None, **kwargs):
+        """
+        Send a request and read the whole response
+
+        Args:
+            method: HTTP method
+            url: Absolute URL
+            provider: Rate-limiter provider to bill (see rate_limiter.PROVIDER_LIMITS)
+            api_key: API key the provider budget is scoped to, if any
+            cost: Rate-limiter tokens per attempt
+            timeout: (connect, read) timeout overriding the default
+            retries: Retry count overriding the default
+            **kwargs: Passed to requests (params, json, headers, ...)
+
+        Returns:
+            The response (final status after retries; check it with raise_for_status)
+
+        Raises:
+            requests.ConnectionError / requests.Timeout: When every attempt failed to connect or respond
+        """
+        response, limiter = self._attempts(method, url, provider, api_key, cost, timeout, retries, False, kwargs)
+        if limiter:
+            limiter.release()
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    @contextmanager
+    def stream(self, method, url, provider=None, api_key=None, cost=1, timeout=None, retries=None, **kwargs):
+        """
+        Like request(), but the body is read by the caller from `response.raw`
+
+        The provider slot and the connection are held until the with-block exits.
+
+        Example:
+            with http.stream("GET", url, provider="clinicaltrials", params=params) as res:
+                res.raise_for_status()
+                records = parse(res.raw)
+        """
+        response, limiter = self._attempts(method, url, provider, api_key, cost, timeout, retries, True, kwargs)
+        try:
+            if not self.http2:
+                response.raw.decode_content = True
+            yield response
+        finally:
+            response.close()
+            if limiter:
+                limiter.release()
+
+    def close(self):
+        """Close every pooled connection (called on server shutdown)"""
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+
+def _retry_after(response):
+    """Seconds from a numeric Retry-After header, if the server sent one"""
+    value = response.headers.get("Retry-After", "")
+    return float(value) if value.isdigit() else None
+
+
+# Global instance shared by every agent
+http = HttpClient()
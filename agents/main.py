@@ -1,52 +1,53 @@
-from fastapi import FastAPI, HTTPException
+import time
+
+# Recorded before heavy imports so the startup report covers the whole boot
+_process_start = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 import asyncio
+import json
 from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from dotenv import load_dotenv
 
-# Import agent modules
 import sys
 import os
-import importlib.util
+
+load_dotenv()
 
 # Add current directory to path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
 # Import cache manager
-from cache_manager import CacheManager
+from cache_manager import cache_manager
+from rate_limiter import recommended_executor_size
+from cancellation import AnalysisCancelled, CancelToken, bind as bind_cancel_token
+from agent_registry import AgentRegistry
+from molecule_names import canonical_molecule, molecule_key
+import cpu_pool
+from http_client import http
+import metrics
+import warmup
 
-# Import agents from Agent-workers directory (handle hyphen in folder name)
+# Agents live in Agent-workers (hyphenated, so they are loaded by file path).
+# The registry imports each worker on first use so startup is not paying for
+# langchain, chromadb and the Gemini clients of every agent.
 agents_dir = os.path.join(current_dir, "Agent-workers")
+agent_registry = AgentRegistry(agents_dir)
 
-# Helper function to load modules from hyphenated directory
-def load_agent_module(module_name, file_name):
-    file_path = os.path.join(agents_dir, file_name)
-    spec = importlib.util.spec_from_file_location(module_name, file_path)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
-    return module
-
-# Load agent modules
-clinical_agent = load_agent_module("clinical_trials_agent", "clinical_trials_agent.py")
-exim_agent = load_agent_module("exim_trade_agent", "exim_trade_agent.py")
-iqvia_agent = load_agent_module("iqvia_agent", "iqvia_agent.py")
-patent_agent = load_agent_module("patent_agent", "patent_agent.py")
-web_agent = load_agent_module("web_agent", "web_agent.py")
-internal_agent = load_agent_module("internal_knowledge_agent", "internal_knowledge_agent.py")
-innovation_agent = load_agent_module("innovation_strategy_agent", "innovation_strategy_agent.py")
-wikipedia_agent = load_agent_module("wikipedia_agent", "wikipedia_agent.py")
-
-# Extract functions
-run_clinical_trials_agent = clinical_agent.run_clinical_trials_agent
-run_exim_agent = exim_agent.run_exim_agent
-run_iqvia_agent = iqvia_agent.generate_final_report
-run_patent_agent = patent_agent.run_patent_agent
-run_web_intel_agent = web_agent.run_web_intel_agent
-run_internal_knowledge_agent = internal_agent.run_internal_knowledge_agent
-run_innovation_strategy_agent = innovation_agent.run_innovation_strategy_agent
-run_wikipedia_agent = wikipedia_agent.run_wikipedia_agent
+run_clinical_trials_agent = agent_registry.lazy("clinical_trials")
+run_exim_agent = agent_registry.lazy("exim")
+run_iqvia_agent = agent_registry.lazy("iqvia")
+run_patent_agent = agent_registry.lazy("patent")
+run_web_intel_agent = agent_registry.lazy("web_intel")
+run_internal_knowledge_agent = agent_registry.lazy("internal_knowledge")
+run_innovation_strategy_agent = agent_registry.lazy("innovation_strategy")
+run_wikipedia_agent = agent_registry.lazy("wikipedia")
 
 app = FastAPI(title="MoleculeInsight API", version="1.0.0")
 
@@ -64,6 +65,11 @@ class AnalysisRequest(BaseModel):
     molecule: Optional[str] = None
     geography: Optional[str] = "Global"
 
+class BatchAnalysisRequest(BaseModel):
+    molecules: List[str] = []
+    queries: List[str] = []
+    geography: Optional[str] = "Global"
+
 class AgentUpdate(BaseModel):
     agent: str
     status: str
@@ -76,48 +82,112 @@ class AnalysisResponse(BaseModel):
     results: dict
     updates: list
 
-# Thread pool for running agents concurrently
-executor = ThreadPoolExecutor(max_workers=6)
+# Thread pool for running agents concurrently.
+# Sized from the provider rate limits: agents queue inside the limiters, not the pool.
+executor = ThreadPoolExecutor(max_workers=recommended_executor_size())
 
-# Initialize cache manager
-cache_manager = CacheManager(
-    cache_dir=os.path.join(current_dir, "cache"),
-    default_expiry_hours=168  # 7 days
-)
+# How often a running analysis checks whether its client is still connected (seconds)
+DISCONNECT_POLL_SECONDS = 1.0
+
+# Molecules analyzed at once across all batch requests; each one still fans out
+# to every agent through the shared executor and provider limiters
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+batch_semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
 
-def safe_run_agent(agent_func, *args, **kwargs):
-    """Wrapper to safely run agent and handle errors"""
+def run_with_token(cancel_token, func, *args):
+    """Run func on an executor thread with the request's cancel token bound"""
+    if cancel_token is not None and cancel_token.cancelled:
+        return {"success": False, "error": "Analysis cancelled", "data": None}
     try:
-        result = agent_func(*args, **kwargs)
-        return {"success": True, "data": result}
-    except Exception as e:
-        return {"success": False, "error": str(e), "data": None}
+        with bind_cancel_token(cancel_token):
+            return func(*args)
+    except AnalysisCancelled:
+        return {"success": False, "error": "Analysis cancelled", "data": None}
 
-def safe_run_agent_with_cache(agent_name, agent_func, molecule, query, *args, **kwargs):
-    """Wrapper to run agent with caching support"""
+def safe_run_agent_with_cache(agent_name, agent_func, molecule, query, *args, cache_params=None, **kwargs):
+    """
+    Wrapper to run agent with caching support
+    
+    cache_params replaces the default cache key parameters (the query plus
+    the agent's arguments), e.g. when the arguments are whole agent reports.
+    """
     # Try to get from cache
     cache_key_params = {"query": query}
     if args:
         cache_key_params["args"] = str(args)
     if kwargs:
         cache_key_params["kwargs"] = str(kwargs)
+    if cache_params is not None:
+        cache_key_params = cache_params
     
-    cached_data = cache_manager.get(agent_name, molecule, **cache_key_params)
-    
-    if cached_data is not None:
-        print(f"[{agent_name}] Using cached response for {molecule}")
-        return {"success": True, "data": cached_data, "cached": True}
+    def run_agent():
+        print(f"[{agent_name}] Cache miss - running agent for {molecule}")
+        with metrics.agent_run_seconds.time(agent=agent_name):
+            return agent_func(*args, **kwargs)
     
-    # Cache miss - run the agent
-    print(f"[{agent_name}] Cache miss - running agent for {molecule}")
     try:
-        result = agent_func(*args, **kwargs)
-        # Store in cache
-        cache_manager.set(agent_name, molecule, result, **cache_key_params)
-        return {"success": True, "data": result, "cached": False}
+        # Fresh hits return immediately; stale hits return immediately and
+        # refresh in the background; misses run the agent and cache the result
+        # (even if the client has since left)
+        data, status = cache_manager.fetch(agent_name, molecule, run_agent, **cache_key_params)
+        if status != "miss":
+            print(f"[{agent_name}] Using {status} cached response for {molecule}")
+        return {"success": True, "data": data, "cached": status != "miss"}
     except Exception as e:
+        metrics.agent_errors.inc(agent=agent_name)
         return {"success": False, "error": str(e), "data": None, "cached": False}
 
+# Seconds from process start until the API was ready to serve
+startup_seconds = None
+
+# Scheduled cache warm-up (see warmup.py), when WARMUP_INTERVAL_MINUTES is set
+warmup_task = None
+
+@app.on_event("startup")
+async def report_startup():
+    """Print how long boot took and optionally warm agents up in the background"""
+    global startup_seconds
+    startup_seconds = time.perf_counter() - _process_start
+    print(f"[Startup] API ready in {startup_seconds:.2f}s (agents load on first use)")
+
+    if os.getenv("AGENT_WARMUP", "").lower() in ("1", "true", "yes"):
+        loop = asyncio.get_event_loop()
+        loop.run_in_executor(executor, agent_registry.warm_up)
+
+    # Re-fill the cache for popular molecules after deploys and periodically after that
+    interval = float(os.getenv("WARMUP_INTERVAL_MINUTES", "0"))
+    if interval > 0:
+        global warmup_task
+        warmup_task = asyncio.create_task(warmup.run_schedule(run_analysis, interval))
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    """Stop the cache warm-up schedule, the CPU worker processes and upstream connections with the server"""
+    if warmup_task is not None:
+        warmup_task.cancel()
+    cpu_pool.shutdown()
+    http.close()
+
+@app.get("/api/agents/status")
+async def get_agents_status():
+    """Report which agents are loaded and how long each import took"""
+    return {
+        "success": True,
+        "startup_seconds": round(startup_seconds, 3) if startup_seconds is not None else None,
+        "agents": agent_registry.report()
+    }
+
+@app.post("/api/agents/warmup")
+async def warm_up_agents():
+    """Import every agent and build its LLM client ahead of traffic"""
+    loop = asyncio.get_event_loop()
+    errors = await loop.run_in_executor(executor, agent_registry.warm_up)
+    return {
+        "success": not errors,
+        "errors": errors,
+        "agents": agent_registry.report()
+    }
+
 @app.get("/")
 async def root():
     return {"message": "MoleculeInsight API is running", "version": "1.0.0"}
@@ -126,16 +196,76 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Cache and agent metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+async def cancel_on_disconnect(http_request: Request, cancel_token: CancelToken):
+    """Poll the connection and cancel the token once the client has gone away"""
+    while not cancel_token.cancelled:
+        if await http_request.is_disconnected():
+            print("[Master Agent] Client disconnected - cancelling pending agents")
+            cancel_token.cancel("client disconnected")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
 @app.post("/api/analyze", response_model=AnalysisResponse)
-async def analyze_molecule(request: AnalysisRequest):
+async def analyze_molecule(request: AnalysisRequest, http_request: Request):
     """
     Main endpoint to analyze a molecule using all agents with caching support
     """
-    molecule = request.molecule or extract_molecule_from_query(request.query)
+    # "Lipitor", "atorvastatin " and "Atorvastatin" all run (and cache) as "Atorvastatin"
+    molecule = canonical_molecule(request.molecule or extract_molecule_from_query(request.query))
     
     if not molecule:
         raise HTTPException(status_code=400, detail="Please provide a molecule name")
     
+    # Logged on the executor: the file backend writes the manifest synchronously
+    loop = asyncio.get_event_loop()
+    loop.run_in_executor(executor, cache_manager.record_request, molecule, request.query, request.geography)
+    started = time.perf_counter()
+    cancel_token = CancelToken()
+    analysis = asyncio.ensure_future(run_analysis(molecule, request.query, request.geography, cancel_token))
+    watcher = asyncio.ensure_future(cancel_on_disconnect(http_request, cancel_token))
+
+    try:
+        await asyncio.wait({analysis, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+
+    if not analysis.done():
+        # Client went away: free executor slots held by agents that have not started
+        analysis.cancel()
+        raise HTTPException(status_code=499, detail="Client disconnected")
+
+    results, updates = analysis.result()
+    metrics.analysis_seconds.observe(time.perf_counter() - started)
+
+    return AnalysisResponse(
+        success=True,
+        molecule=molecule,
+        results=results,
+        updates=updates
+    )
+
+async def run_analysis(molecule: str, query: str, geography: Optional[str] = "Global",
+                       cancel_token: Optional[CancelToken] = None,
+                       agent_executor: Optional[ThreadPoolExecutor] = None):
+    """
+    Run every agent for one molecule and compile the dashboard results
+
+    Cancelling the coroutine, or the cancel_token, stops agents that have not
+    finished; agents that already finished have been cached.
+
+    Args:
+        agent_executor: Executor to run agents on (defaults to the shared one;
+                        warm-up passes its own background-priority pool)
+
+    Returns:
+        Tuple of (results dict, list of agent status updates)
+    """
+    agent_executor = agent_executor or executor
     updates = []
     
     # Step 1: Master Agent - Query Processing
@@ -157,14 +287,16 @@ async def analyze_molecule(request: AnalysisRequest):
         "data": None
     })
     iqvia_future = loop.run_in_executor(
-        executor, 
-        safe_run_agent_with_cache, 
+        agent_executor,
+        run_with_token,
+        cancel_token,
+        safe_run_agent_with_cache,
         "IQVIA",
         run_iqvia_agent, 
         molecule, 
-        request.query,
+        query,
         molecule,
-        request.query
+        query
     )
     
     # Clinical Trials Agent - with caching
@@ -175,14 +307,16 @@ async def analyze_molecule(request: AnalysisRequest):
         "data": None
     })
     clinical_future = loop.run_in_executor(
-        executor, 
+        agent_executor,
+        run_with_token,
+        cancel_token,
         safe_run_agent_with_cache,
         "ClinicalTrials",
         run_clinical_trials_agent, 
         molecule, 
-        request.query,
+        query,
         molecule,
-        request.query
+        query
     )
     
     # Patent Agent - with caching
@@ -193,14 +327,16 @@ async def analyze_molecule(request: AnalysisRequest):
         "data": None
     })
     patent_future = loop.run_in_executor(
-        executor,
+        agent_executor,
+        run_with_token,
+        cancel_token,
         safe_run_agent_with_cache,
         "Patent",
         run_patent_agent,
         molecule,
-        request.query,
+        query,
         molecule,
-        request.query
+        query
     )
     
     # EXIM Trade Agent - with caching
@@ -211,16 +347,18 @@ async def analyze_molecule(request: AnalysisRequest):
         "data": None
     })
     exim_future = loop.run_in_executor(
-        executor, 
+        agent_executor,
+        run_with_token,
+        cancel_token,
         safe_run_agent_with_cache,
         "EXIM",
         run_exim_agent, 
         molecule,
-        request.query,
+        query,
         molecule, 
         "300490", 
         [2020, 2021, 2022, 2023],
-        request.query
+        query
     )
     
     # Web Intelligence Agent - with caching
@@ -231,15 +369,17 @@ async def analyze_molecule(request: AnalysisRequest):
         "data": None
     })
     web_future = loop.run_in_executor(
-        executor,
+        agent_executor,
+        run_with_token,
+        cancel_token,
         safe_run_agent_with_cache,
         "WebIntelligence",
         run_web_intel_agent,
         molecule,
-        request.query,
+        query,
         molecule,
         20,
-        request.query
+        query
     )
 
     # Internal Knowledge Agent - with caching
@@ -250,14 +390,16 @@ async def analyze_molecule(request: AnalysisRequest):
         "data": None
     })
     internal_future = loop.run_in_executor(
-        executor, 
+        agent_executor,
+        run_with_token,
+        cancel_token,
         safe_run_agent_with_cache,
         "InternalKnowledge",
         run_internal_knowledge_agent,
         molecule,
-        request.query,
+        query,
         molecule,
-        request.query
+        query
     )
 
     # Wikipedia Agent - with caching
@@ -268,24 +410,37 @@ async def analyze_molecule(request: AnalysisRequest):
         "data": None
     })
     wikipedia_future = loop.run_in_executor(
-        executor,
+        agent_executor,
+        run_with_token,
+        cancel_token,
         safe_run_agent_with_cache,
         "Wikipedia",
         run_wikipedia_agent,
         molecule,
-        request.query,
+        query,
         molecule,
-        request.query
+        query
     )
     
-    # Wait for all agents to complete
-    iqvia_result = await iqvia_future
-    clinical_result = await clinical_future
-    patent_result = await patent_future
-    exim_result = await exim_future
-    web_result = await web_future
-    internal_result = await internal_future
-    wikipedia_result = await wikipedia_future
+    # Wait for all agents to complete. If this coroutine is cancelled (client
+    # gone), gather cancels every future so queued agents never start.
+    (
+        iqvia_result,
+        clinical_result,
+        patent_result,
+        exim_result,
+        web_result,
+        internal_result,
+        wikipedia_result
+    ) = await asyncio.gather(
+        iqvia_future,
+        clinical_future,
+        patent_future,
+        exim_future,
+        web_future,
+        internal_future,
+        wikipedia_future
+    )
 
     # Innovation Strategy Agent - with caching
     updates.append({
@@ -297,7 +452,7 @@ async def analyze_molecule(request: AnalysisRequest):
     
     # Create cache key for innovation agent based on all input data
     innovation_cache_params = {
-        "query": request.query,
+        "query": query,
         "has_iqvia": iqvia_result.get("success", False),
         "has_clinical": clinical_result.get("success", False),
         "has_patent": patent_result.get("success", False),
@@ -306,33 +461,27 @@ async def analyze_molecule(request: AnalysisRequest):
         "has_internal": internal_result.get("success", False)
     }
     
-    # Check cache for innovation strategy
-    cached_innovation = cache_manager.get("InnovationStrategy", molecule, **innovation_cache_params)
+    # Cache lookup and fill run on the executor, like the other agents
+    innovation_result = await loop.run_in_executor(
+        agent_executor,
+        run_with_token,
+        cancel_token,
+        partial(safe_run_agent_with_cache, cache_params=innovation_cache_params),
+        "InnovationStrategy",
+        partial(
+            run_innovation_strategy_agent,
+            molecule=molecule,
+            market_data=iqvia_result.get("data") if iqvia_result.get("success") else None,
+            clinical_data=clinical_result.get("data") if clinical_result.get("success") else None,
+            patent_data=patent_result.get("data") if patent_result.get("success") else None,
+            trade_data=exim_result.get("data") if exim_result.get("success") else None,
+            web_data=web_result.get("data") if web_result.get("success") else None,
+            internal_data=internal_result.get("data") if internal_result.get("success") else None
+        ),
+        molecule,
+        query
+    )
     
-    if cached_innovation is not None:
-        print(f"[InnovationStrategy] Using cached response for {molecule}")
-        innovation_result = {"success": True, "data": cached_innovation, "cached": True}
-    else:
-        print(f"[InnovationStrategy] Cache miss - running agent for {molecule}")
-        innovation_future = loop.run_in_executor(
-            executor,
-            lambda: safe_run_agent(
-                run_innovation_strategy_agent,
-                molecule=molecule,
-                market_data=iqvia_result.get("data") if iqvia_result.get("success") else None,
-                clinical_data=clinical_result.get("data") if clinical_result.get("success") else None,
-                patent_data=patent_result.get("data") if patent_result.get("success") else None,
-                trade_data=exim_result.get("data") if exim_result.get("success") else None,
-                web_data=web_result.get("data") if web_result.get("success") else None,
-                internal_data=internal_result.get("data") if internal_result.get("success") else None
-            )
-        )
-        innovation_result = await innovation_future
-        
-        # Store in cache if successful
-        if innovation_result.get("success"):
-            cache_manager.set("InnovationStrategy", molecule, innovation_result.get("data"), **innovation_cache_params)
-        
     updates.append({
         "agent": "Innovation Strategy Agent",
         "status": "completed" if innovation_result.get("success") else "error",
@@ -351,7 +500,7 @@ async def analyze_molecule(request: AnalysisRequest):
     # Compile results
     results = {
         "molecule": molecule,
-        "geography": request.geography,
+        "geography": geography,
         "iqvia": {
             "success": iqvia_result["success"],
             "report": iqvia_result["data"] if iqvia_result["success"] else None,
@@ -401,12 +550,78 @@ async def analyze_molecule(request: AnalysisRequest):
         "data": None
     })
 
-    return AnalysisResponse(
-        success=True,
-        molecule=molecule,
-        results=results,
-        updates=updates
-    )
+    return results, updates
+
+def dedupe_batch_items(batch: BatchAnalysisRequest):
+    """
+    Resolve batch inputs to unique (molecule, query) pairs
+
+    Returns:
+        Tuple of (list of unique items, list of inputs that could not be resolved).
+        Each unique item records the input positions it answers.
+    """
+    unique = {}
+    unresolved = []
+    inputs = [(m, "") for m in batch.molecules] + [(None, q) for q in batch.queries]
+
+    for position, (molecule, query) in enumerate(inputs):
+        molecule = canonical_molecule(molecule or extract_molecule_from_query(query))
+        if not molecule:
+            unresolved.append({"input": position, "query": query})
+            continue
+        key = (molecule_key(molecule), " ".join(query.split()).lower())
+        if key not in unique:
+            unique[key] = {"molecule": molecule, "query": query, "inputs": []}
+        unique[key]["inputs"].append(position)
+
+    return list(unique.values()), unresolved
+
+@app.post("/api/analyze/batch")
+async def analyze_batch(batch: BatchAnalysisRequest):
+    """
+    Analyze a portfolio of molecules, streaming one NDJSON line per molecule as it completes
+    """
+    items, unresolved = dedupe_batch_items(batch)
+
+    if not items:
+        raise HTTPException(status_code=400, detail="Please provide at least one molecule name")
+
+    loop = asyncio.get_event_loop()
+    for item in items:
+        loop.run_in_executor(executor, cache_manager.record_request, item["molecule"], item["query"], batch.geography)
+
+    cancel_token = CancelToken()
+
+    async def analyze_item(item):
+        async with batch_semaphore:
+            try:
+                results, _ = await run_analysis(item["molecule"], item["query"], batch.geography, cancel_token)
+                return {"type": "result", "success": True, **item, "results": results}
+            except Exception as e:
+                return {"type": "result", "success": False, **item, "error": str(e)}
+
+    async def stream():
+        for entry in unresolved:
+            yield json.dumps({"type": "error", "error": "Could not extract molecule", **entry}) + "\n"
+
+        tasks = [asyncio.create_task(analyze_item(item)) for item in items]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished) + "\n"
+        finally:
+            # Runs when the stream ends or the client disconnects mid-stream
+            cancel_token.cancel("batch stream closed")
+            for task in tasks:
+                task.cancel()
+
+        yield json.dumps({
+            "type": "summary",
+            "requested": len(batch.molecules) + len(batch.queries),
+            "unique": len(items),
+            "unresolved": len(unresolved)
+        }) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 def extract_molecule_from_query(query: str) -> str:
     """
@@ -467,13 +682,16 @@ def extract_molecule_from_query(query: str) -> str:
     return ""
 
 @app.get("/api/cache/info")
-async def get_cache_info():
+async def get_cache_info(limit: int = 100):
     """Get information about cached data"""
     try:
-        info = cache_manager.get_cache_info()
+        stats = cache_manager.get_cache_stats()
+        info = cache_manager.get_cache_info(limit=limit)
         return {
             "success": True,
-            "cache_count": len(info),
+            "cache_count": stats["count"],
+            "expired_count": stats["expired"],
+            "total_bytes": stats["total_bytes"],
             "cache_items": info
         }
     except Exception as e:
@@ -508,6 +726,6 @@ if __name__ == "__main__":
     print("Starting MoleculeInsight FastAPI Server...")
     print("API Documentation: http://localhost:8000/docs")
     print("Health Check: http://localhost:8000/health")
-    print(f"Cache Directory: {cache_manager.cache_dir}")
+    print(f"Cache Backend: {cache_manager.backend.describe()}")
     print(f"Cache Expiry: {cache_manager.default_expiry.days} days")
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
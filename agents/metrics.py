@@ -0,0 +1,191 @@
+"""
+Metrics for MoleculeInsight
+Process-wide counters, gauges and histograms rendered in the Prometheus text format (served at /metrics)
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+# Latency buckets (seconds) for cache operations and for whole agent runs
+CACHE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+AGENT_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Size buckets (estimated tokens) for LLM prompts
+PROMPT_BUCKETS = (250, 500, 1000, 1500, 2000, 3000, 5000, 10000)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    """Common naming, label handling and registration"""
+
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count per label set"""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(key)} {_format_value(v)}" for key, v in values]
+
+
+class Gauge(_Metric):
+    """Current value, read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, callback):
+        """
+        Args:
+            callback: Zero-argument function returning the current value
+        """
+        super().__init__(name, help_text)
+        self.callback = callback
+
+    def render(self):
+        try:
+            value = self.callback()
+        except Exception as e:
+            print(f"[Metrics] Could not read {self.name}: {e}")
+            return []
+        return self._header() + [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """Bucketed observations (e.g. latencies) per label set"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=CACHE_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}  # label key -> [per-bucket counts, sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self._lock:
+            values = sorted((key, ([*series[0]], series[1], series[2])) for key, series in self._values.items())
+        lines = self._header()
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Cache
+cache_lookups = Counter("moleculeinsight_cache_lookups_total",
+                        "Cache lookups by agent and result (fresh, stale or miss)", ("agent", "result"))
+cache_memory_hits = Counter("moleculeinsight_cache_memory_hits_total",
+                            "Lookups answered by the in-memory tier", ("agent",))
+cache_expired = Counter("moleculeinsight_cache_expired_total",
+                        "Lookups that found an entry past its TTL and stale window", ("agent",))
+cache_bytes_read = Counter("moleculeinsight_cache_read_bytes_total",
+                           "Encoded bytes read from the cache backend", ("agent",))
+cache_bytes_written = Counter("moleculeinsight_cache_written_bytes_total",
+                              "Encoded bytes written to the cache backend", ("agent",))
+cache_evictions = Counter("moleculeinsight_cache_evictions_total",
+                          "Entries evicted to stay within the disk quota")
+cache_get_seconds = Histogram("moleculeinsight_cache_get_seconds",
+                              "Cache lookup latency", ("agent",), CACHE_BUCKETS)
+cache_set_seconds = Histogram("moleculeinsight_cache_set_seconds",
+                              "Cache write latency (encode + backend write)", ("agent",), CACHE_BUCKETS)
+
+# Agents
+agent_run_seconds = Histogram("moleculeinsight_agent_run_seconds",
+                              "Agent run latency on cache misses", ("agent",), AGENT_BUCKETS)
+agent_errors = Counter("moleculeinsight_agent_errors_total",
+                       "Agent runs that raised an error", ("agent",))
+analysis_seconds = Histogram("moleculeinsight_analysis_seconds",
+                             "End-to-end /api/analyze latency", (), AGENT_BUCKETS)
+
+# Upstream APIs (see http_client)
+upstream_seconds = Histogram("moleculeinsight_upstream_request_seconds",
+                             "Upstream HTTP latency per host (until the body is read, or headers when streamed)",
+                             ("host",), UPSTREAM_BUCKETS)
+upstream_requests = Counter("moleculeinsight_upstream_requests_total",
+                            "Upstream HTTP attempts per host and status code (or error)", ("host", "status"))
+upstream_retries = Counter("moleculeinsight_upstream_retries_total",
+                           "Upstream HTTP attempts retried after a 429/5xx or network error", ("host",))
+
+# LLM prompts (see prompt_builder)
+prompt_tokens = Histogram("moleculeinsight_prompt_tokens",
+                          "Estimated input tokens per LLM prompt", ("agent",), PROMPT_BUCKETS)
@@ -0,0 +1,152 @@
+"""
+Molecule Names for MoleculeInsight
+Resolves user-entered molecule names (any case, spacing, brand or salt form) to one canonical name
+"""
+
+import os
+import re
+import json
+import threading
+import unicodedata
+
+KNOWLEDGE_BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "RAG", "KnowledgeBase")
+FDA_PRODUCTS_FILE = os.path.join(KNOWLEDGE_BASE_DIR, "FDAAPI.json")
+
+# Optional extra {"alias": "canonical name"} mappings, merged over the FDA index
+SYNONYMS_FILE = os.getenv("MOLECULE_SYNONYMS_FILE")
+
+# Salt, hydrate and solvate words dropped from the end of FDA generic names,
+# so "atorvastatin calcium trihydrate" and "atorvastatin" resolve together
+SALT_WORDS = {
+    "acetate", "besylate", "bitartrate", "bromide", "calcium", "chloride", "citrate",
+    "dihydrate", "disodium", "fumarate", "glycol", "hcl", "hemihydrate", "hydrate",
+    "hydrobromide", "hydrochloride", "magnesium", "maleate", "mesylate", "monohydrate",
+    "phosphate", "potassium", "propylene", "sesquihydrate", "sodium", "solvate",
+    "succinate", "sulfate", "tartrate", "trihydrate",
+}
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_name(name):
+    """Case- and whitespace-insensitive form of a name (also used for cache keys)"""
+    name = unicodedata.normalize("NFKC", name or "")
+    return _WHITESPACE.sub(" ", name).strip().casefold()
+
+
+def base_ingredient(generic_name):
+    """
+    Strip dosage-form qualifiers and salt/hydrate words from an FDA generic name
+
+    Args:
+        generic_name: e.g. "Atorvastatin Calcium Trihydrate" or "atorvastatin calcium, film coated"
+
+    Returns:
+        Normalized base name, e.g. "atorvastatin"
+    """
+    words = normalize_name(generic_name.split(",")[0]).split(" ")
+    while len(words) > 1 and words[-1] in SALT_WORDS:
+        words.pop()
+    return " ".join(words)
+
+
+class MoleculeIndex:
+    """Brand, generic and ingredient synonyms mapped to a canonical molecule name"""
+
+    def __init__(self):
+        self._canonical = {}  # normalized alias -> canonical display name
+        self._ambiguous = set()
+
+    def add(self, alias, canonical):
+        """Map an alias to a canonical name; aliases claimed by two molecules are dropped"""
+        key = normalize_name(alias)
+        if not key or key in self._ambiguous:
+            return
+        existing = self._canonical.get(key)
+        if existing is not None and normalize_name(existing) != normalize_name(canonical):
+            # e.g. a brand reused across different products - resolve neither way
+            del self._canonical[key]
+            self._ambiguous.add(key)
+            return
+        self._canonical[key] = canonical
+
+    def add_fda_products(self, path):
+        """
+        Index an openFDA drug/ndc response (as stored in the KnowledgeBase)
+
+        Every product's brand names, generic name and active ingredients map to
+        the base ingredient of its generic name.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            products = json.load(f).get("results", [])
+
+        for product in products:
+            openfda = product.get("openfda") or {}
+            generic = product.get("generic_name") or next(iter(openfda.get("generic_name", [])), None)
+            if not generic:
+                continue
+            canonical = base_ingredient(generic).title()
+
+            aliases = [generic, canonical, product.get("brand_name"), product.get("brand_name_base")]
+            aliases += [ingredient.get("name") for ingredient in product.get("active_ingredients", [])]
+            for field in ("brand_name", "generic_name", "substance_name"):
+                aliases += openfda.get(field, [])
+            for alias in aliases:
+                if alias:
+                    self.add(alias, canonical)
+                    self.add(alias.split(",")[0], canonical)
+
+    def add_synonyms(self, path):
+        """Merge an {"alias": "canonical name"} JSON file"""
+        with open(path, "r", encoding="utf-8") as f:
+            for alias, canonical in json.load(f).items():
+                self.add(alias, canonical)
+                self.add(canonical, canonical)
+
+    def resolve(self, name):
+        """
+        Canonical display name for a molecule
+
+        Known aliases resolve to their canonical name (e.g. "Lipitor" -> "Atorvastatin");
+        unknown names are returned with whitespace collapsed.
+        """
+        name = _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", name or "")).strip()
+        return self._canonical.get(normalize_name(name), name)
+
+    def __len__(self):
+        return len(self._canonical)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Get the shared molecule index, building it from the KnowledgeBase on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = MoleculeIndex()
+                try:
+                    index.add_fda_products(FDA_PRODUCTS_FILE)
+                except (OSError, ValueError) as e:
+                    print(f"[Molecules] Could not load FDA synonyms: {e}")
+                if SYNONYMS_FILE:
+                    try:
+                        index.add_synonyms(SYNONYMS_FILE)
+                    except (OSError, ValueError) as e:
+                        print(f"[Molecules] Could not load {SYNONYMS_FILE}: {e}")
+                print(f"[Molecules] Indexed {len(index)} molecule synonyms")
+                _index = index
+    return _index
+
+
+def canonical_molecule(name):
+    """Canonical display name for a molecule (what agents are run with)"""
+    return get_index().resolve(name)
+
+
+def molecule_key(name):
+    """Canonical, case-insensitive key for a molecule (what caches are keyed by)"""
+    return normalize_name(canonical_molecule(name))
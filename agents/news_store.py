@@ -0,0 +1,164 @@
+"""
+News Store for MoleculeInsight
+Per-molecule news articles kept up to date with delta fetches, deduplicated by URL or title
+
+Each molecule's store remembers the newest publishedAt it has seen, so a
+refresh only asks the news source for articles published since then. Fetched
+articles already stored under the same URL or the same title are dropped.
+The store also tracks which articles have been embedded into the RAG vector
+store, so only new ones are ingested.
+
+State is saved as a cache backend document (see CacheManager.save_document),
+so every worker process sees the same store, it is never expired or evicted
+along with cache entries, and updates hold the cross-process lock.
+"""
+
+import os
+import re
+import time
+import hashlib
+from urllib.parse import urlsplit
+
+from cache_manager import cache_manager
+
+STORE_NAME = "NewsStore"
+
+# Articles kept per molecule (newest first)
+NEWS_STORE_MAX_ARTICLES = int(os.getenv("NEWS_STORE_MAX_ARTICLES", "200"))
+
+# Minimum minutes between delta fetches for one molecule; calls in between read the store
+NEWS_REFRESH_MINUTES = float(os.getenv("NEWS_REFRESH_MINUTES", "15"))
+
+# Minimum minutes before retrying a molecule whose last delta fetch failed
+# (news source down or not configured)
+NEWS_RETRY_MINUTES = float(os.getenv("NEWS_RETRY_MINUTES", "5"))
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def url_key(url):
+    """Dedup key for a URL, ignoring scheme, "www.", query string, fragment and trailing slash"""
+    if not url:
+        return None
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower().removeprefix("www.")
+    return "url:" + _digest(host + parts.path.rstrip("/"))
+
+
+def title_key(title):
+    """Dedup key for a headline, ignoring case, punctuation and spacing"""
+    words = re.findall(r"\w+", (title or "").lower())
+    return "title:" + _digest(" ".join(words)) if words else None
+
+
+def article_keys(article):
+    """Every dedup key of an article (URL and title); two articles sharing any key are duplicates"""
+    return [key for key in (url_key(article.get("url")), title_key(article.get("title"))) if key]
+
+
+def article_id(article):
+    """Stable id for an article: its URL key, or its title key when it has no URL"""
+    keys = article_keys(article)
+    return keys[0] if keys else None
+
+
+class NewsStore:
+    """Incrementally updated, deduplicated news articles per molecule"""
+
+    def __init__(self, cache=cache_manager, max_articles=NEWS_STORE_MAX_ARTICLES,
+                 refresh_minutes=NEWS_REFRESH_MINUTES, retry_minutes=NEWS_RETRY_MINUTES):
+        """
+        Args:
+            cache: CacheManager holding the store state
+            max_articles: Articles kept per molecule
+            refresh_minutes: Minimum minutes between delta fetches for a molecule
+            retry_minutes: Minimum minutes between attempts after a failed fetch
+        """
+        self.cache = cache
+        self.max_articles = max_articles
+        self.refresh_seconds = refresh_minutes * 60
+        self.retry_seconds = retry_minutes * 60
+
+    def _load(self, molecule):
+        state = self.cache.load_document(STORE_NAME, molecule)
+        return state if state else {"latest": None, "checked_at": 0, "articles": [], "ingested": []}
+
+    def articles(self, molecule):
+        """Stored articles for a molecule, newest first"""
+        return self._load(molecule)["articles"]
+
+    def update(self, molecule, fetch, force=False):
+        """
+        Fetch articles published since the newest one stored and add the new ones
+
+        Args:
+            molecule: Molecule the articles are about
+            fetch: Callable taking the newest stored publishedAt (None for an
+                   empty store) and returning articles published at or after it
+            force: Fetch even if the molecule was checked within refresh_minutes,
+                   or its last fetch failed within retry_minutes
+
+        Returns:
+            Tuple of (new articles, all stored articles newest first)
+
+        Raises:
+            Whatever `fetch` raises; only the failure time is saved
+        """
+        with self.cache.lock(STORE_NAME, molecule):
+            state = self._load(molecule)
+            now = time.time()
+            if not force and (now - state["checked_at"] < self.refresh_seconds
+                              or now - state.get("failed_at", 0) < self.retry_seconds):
+                return [], state["articles"]
+
+            since = state["latest"]
+            try:
+                fetched = fetch(since)
+            except Exception:
+                state["failed_at"] = now
+                self.cache.save_document(STORE_NAME, molecule, state)
+                raise
+            seen = {key for article in state["articles"] for key in article_keys(article)}
+            new = []
+            for article in fetched:
+                keys = article_keys(article)
+                if keys and seen.isdisjoint(keys):
+                    seen.update(keys)
+                    new.append(article)
+
+            articles = sorted(new + state["articles"], key=lambda a: a.get("publishedAt") or "", reverse=True)
+            del articles[self.max_articles:]
+            kept_ids = {article_id(a) for a in articles}
+            published = [a["publishedAt"] for a in new if a.get("publishedAt")]
+            state.update(
+                latest=max(published + ([state["latest"]] if state["latest"] else []), default=None),
+                checked_at=time.time(),
+                articles=articles,
+                ingested=[i for i in state["ingested"] if i in kept_ids],
+                failed_at=0,
+            )
+            self.cache.save_document(STORE_NAME, molecule, state)
+
+        print(f"[News] {molecule}: {len(new)} new of {len(fetched)} fetched since {since or 'the start'}; "
+              f"{len(articles)} stored")
+        return new, articles
+
+    def pending_ingestion(self, molecule):
+        """Stored articles not yet embedded into the vector store, newest first"""
+        state = self._load(molecule)
+        ingested = set(state["ingested"])
+        return [a for a in state["articles"] if article_id(a) not in ingested]
+
+    def mark_ingested(self, molecule, articles):
+        """Record that these articles are in the vector store"""
+        ids = [article_id(a) for a in articles]
+        with self.cache.lock(STORE_NAME, molecule):
+            state = self._load(molecule)
+            state["ingested"] = list(dict.fromkeys(state["ingested"] + ids))
+            self.cache.save_document(STORE_NAME, molecule, state)
+
+
+# Global instance
+news_store = NewsStore()
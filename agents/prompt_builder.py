@@ -0,0 +1,209 @@
+"""
+Prompt Builder for MoleculeInsight
+Assembles LLM prompts that fit a per-agent token budget, keeping the most important facts
+
+A prompt is fixed text (role, instructions) plus data sections. Each section's
+facts are ranked (largest counts first, latest years first, leading lines of
+a report first) and the budget left after the fixed text is shared between
+sections by weight; a section that needs less than its share hands the rest
+to the others. Dropped facts are summarized in one line, so the model still
+sees how much data there was. Scalar sections (a single number such as a
+total) are always kept in full, like fixed text.
+"""
+
+import os
+import math
+
+import metrics
+from data_processor import estimate_token_reduction
+
+# Rough characters per token for English text and numbers (Gemini tokenizers average ~4)
+CHARS_PER_TOKEN = 4
+
+# Token budget per agent for the whole prompt, overridable with PROMPT_BUDGET_<AGENT>
+PROMPT_BUDGETS = {
+    "clinical_trials": 1200,
+    "patent": 1200,
+    "trade": 1000,
+    "innovation_strategy": 1600,
+}
+
+# Budget for agents not listed above
+DEFAULT_PROMPT_BUDGET = int(os.getenv("PROMPT_BUDGET_DEFAULT", "1500"))
+
+
+def estimate_tokens(text):
+    """Approximate token count of a string (no tokenizer round trip)"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def prompt_budget(agent):
+    """Token budget for an agent, with the PROMPT_BUDGET_<AGENT> environment override"""
+    env_value = os.getenv(f"PROMPT_BUDGET_{agent.upper()}")
+    if env_value:
+        return int(env_value)
+    return PROMPT_BUDGETS.get(agent, DEFAULT_PROMPT_BUDGET)
+
+
+def _format_value(value):
+    if isinstance(value, dict):
+        return ", ".join(f"{key} {_format_value(v)}" for key, v in value.items())
+    if isinstance(value, float):
+        return f"{value:,.0f}" if abs(value) >= 100 else f"{value:.4g}"
+    return str(value)
+
+
+def _clip(text, tokens):
+    """Cut text to about `tokens` tokens at a word boundary"""
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:max(0, limit - 1)].rsplit(" ", 1)[0]
+    return cut + "…" if cut else ""
+
+
+class _Section:
+    """One titled block of ranked facts"""
+
+    def __init__(self, title, facts, weight, chronological):
+        self.title = title
+        self.weight = weight
+        self.header = f"=== {title} ===" if title else ""
+        self.header_tokens = estimate_tokens(self.header) + 1
+        self.clip = None
+        # A single value: too small and too important to trim
+        self.scalar = not isinstance(facts, (dict, list, tuple, str))
+
+        if isinstance(facts, dict):
+            items = list(facts.items())
+            if chronological:
+                # Latest first when ranking; shown oldest to newest
+                items.sort(key=lambda item: str(item[0]), reverse=True)
+            self.lines = [f"{label}: {_format_value(value)}" for label, value in items]
+            self.display_order = (lambda kept: kept[::-1]) if chronological else None
+            self.noun = "entries"
+        elif isinstance(facts, (list, tuple)):
+            self.lines = [str(fact) for fact in facts]
+            self.display_order = None
+            self.noun = "items"
+        else:
+            self.lines = [line for line in str(_format_value(facts)).splitlines() if line.strip()]
+            self.display_order = None
+            self.noun = "lines"
+        self.costs = [estimate_tokens(line) + 1 for line in self.lines]
+        self.kept = len(self.lines)
+
+    @property
+    def full_tokens(self):
+        return self.header_tokens + sum(self.costs)
+
+    def fit(self, tokens):
+        """Keep the highest-ranked lines that fit in `tokens`, clipping the first one if needed"""
+        available = tokens - self.header_tokens
+        overflow_note = 8  # room for the "... N more" line
+        self.kept, used, self.clip = 0, 0, None
+        for cost in self.costs:
+            reserve = overflow_note if self.kept + 1 < len(self.costs) else 0
+            if used + cost + reserve > available:
+                break
+            used += cost
+            self.kept += 1
+        if self.kept == 0 and self.lines:
+            # Not even the top fact fits: show as much of it as the share allows
+            self.clip = max(0, available - overflow_note)
+            self.kept = 1 if self.clip else 0
+
+    def render(self):
+        kept = self.lines[:self.kept]
+        if self.clip is not None and kept:
+            kept = [_clip(kept[0], self.clip)]
+        if self.display_order:
+            kept = self.display_order(kept)
+        dropped = len(self.lines) - self.kept
+        if dropped:
+            kept.append(f"... and {dropped} more {self.noun} omitted")
+        return "\n".join(([self.header] if self.header else []) + kept)
+
+
+class PromptBuilder:
+    """
+    Builds one prompt within an agent's token budget
+
+    Example:
+        prompt = PromptBuilder("clinical_trials")
+        prompt.text(f"You are the Clinical Trials Intelligence Agent for {molecule}.")
+        prompt.section("TOP SPONSORS", data["sponsor_count"], weight=2)
+        prompt.section("YEARWISE TREND", data["year_count"], chronological=True)
+        prompt.text("Generate a structured report ...")
+        text = prompt.build()
+    """
+
+    def __init__(self, agent, budget=None):
+        """
+        Args:
+            agent: Agent name, used for the budget lookup, logs and metrics
+            budget: Token budget overriding prompt_budget(agent)
+        """
+        self.agent = agent
+        self.budget = budget or prompt_budget(agent)
+        self._parts = []
+
+    def text(self, text):
+        """Add fixed text that is always included in full"""
+        self._parts.append(text.strip("\n"))
+        return self
+
+    def section(self, title, facts, weight=1.0, chronological=False):
+        """
+        Add a data section whose facts are trimmed to fit the budget
+
+        Args:
+            title: Section heading (empty for none)
+            facts: Dict of label -> value (ranked by value, largest first, as
+                   the rollups return them), list of items (ranked as given),
+                   free text (ranked line by line) or a scalar (never trimmed)
+            weight: Relative share of the data budget
+            chronological: Dict keys are dates or years; rank latest first
+                           and show in time order
+        """
+        self._parts.append(_Section(title, facts, weight, chronological))
+        return self
+
+    def _allocate(self, sections, available):
+        """Share `available` tokens by weight, giving unused share to the sections that need it"""
+        pending = list(sections)
+        while pending:
+            total_weight = sum(s.weight for s in pending)
+            fits = [s for s in pending if s.full_tokens <= available * s.weight / total_weight]
+            if not fits:
+                for s in pending:
+                    s.fit(int(available * s.weight / total_weight))
+                return
+            for s in fits:
+                available -= s.full_tokens
+                pending.remove(s)
+
+    def _render(self):
+        return "\n\n".join(part if isinstance(part, str) else part.render() for part in self._parts)
+
+    def build(self):
+        """
+        Render the prompt, logging and recording its estimated size
+
+        Returns:
+            Prompt text
+        """
+        sections = [part for part in self._parts if isinstance(part, _Section)]
+        ranked = [s for s in sections if not s.scalar]
+        fixed_tokens = sum(estimate_tokens(part) + 2 for part in self._parts if isinstance(part, str))
+        fixed_tokens += sum(s.full_tokens + 2 for s in sections if s.scalar)
+        full_tokens = estimate_tokens(self._render())
+        self._allocate(ranked, max(0, self.budget - fixed_tokens - 2 * len(ranked)))
+
+        prompt = self._render()
+        tokens = estimate_tokens(prompt)
+        dropped = sum(len(s.lines) - s.kept for s in sections)
+        metrics.prompt_tokens.observe(tokens, agent=self.agent)
+        print(f"[Prompt] {self.agent}: ~{tokens} input tokens (budget {self.budget}, full data ~{full_tokens}, "
+              f"{dropped} facts dropped, {estimate_token_reduction(full_tokens, tokens)}% smaller)")
+        return prompt
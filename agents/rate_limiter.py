@@ -0,0 +1,299 @@
+"""
+Rate Limiter for MoleculeInsight
+Per-provider and per-API-key throttling of upstream calls (token bucket + max in-flight)
+
+Limiters live in process memory: every uvicorn worker and every warm-up CLI
+run has its own full budget, so a provider's effective limit is the
+configured one times the number of processes calling it. Size the
+RATE_LIMIT_* settings per process accordingly.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from cancellation import bind, check_cancelled, current_token
+
+# Default limits per upstream provider.
+# requests_per_minute feeds the token bucket, burst is the bucket capacity and
+# max_in_flight caps concurrent calls. Gemini limits apply per API key.
+PROVIDER_LIMITS = {
+    "gemini": {"requests_per_minute": 60, "burst": 5, "max_in_flight": 3},
+    "clinicaltrials": {"requests_per_minute": 300, "burst": 10, "max_in_flight": 4},
+    "comtrade": {"requests_per_minute": 60, "burst": 2, "max_in_flight": 2},
+    "patentsview": {"requests_per_minute": 45, "burst": 3, "max_in_flight": 2},
+    "newsapi": {"requests_per_minute": 60, "burst": 3, "max_in_flight": 2},
+    "wikipedia": {"requests_per_minute": 200, "burst": 10, "max_in_flight": 4},
+}
+
+# How long a caller may queue for a slot before giving up (seconds)
+DEFAULT_ACQUIRE_TIMEOUT = float(os.getenv("RATE_LIMIT_ACQUIRE_TIMEOUT", "300"))
+
+# Queued callers wake at least this often to notice a cancelled request (seconds)
+CANCEL_POLL_INTERVAL = 0.5
+
+# Fraction of each provider's rate and in-flight budget available to background
+# work (cache warm-up). Background calls also leave the bucket's burst to live traffic.
+BACKGROUND_SHARE = float(os.getenv("RATE_LIMIT_BACKGROUND_SHARE", "0.25"))
+
+_local = threading.local()
+
+
+class RateLimitTimeout(TimeoutError):
+    """Raised when a call waited longer than the acquire timeout for a slot"""
+
+
+def _provider_config(provider):
+    """Provider limits with RATE_LIMIT_<PROVIDER>_<SETTING> environment overrides"""
+    config = dict(PROVIDER_LIMITS.get(provider, {"requests_per_minute": 60, "burst": 5, "max_in_flight": 2}))
+    for setting in ("requests_per_minute", "burst", "max_in_flight"):
+        env_value = os.getenv(f"RATE_LIMIT_{provider.upper()}_{setting.upper()}")
+        if env_value:
+            config[setting] = float(env_value) if setting == "requests_per_minute" else int(env_value)
+    return config
+
+
+def mark_background_thread():
+    """
+    Treat every upstream call from the calling thread as background work
+
+    Used as a ThreadPoolExecutor initializer for warm-up workers, so their
+    calls are limited to BACKGROUND_SHARE and never starve live requests.
+    """
+    _local.background = True
+
+
+def is_background():
+    return getattr(_local, "background", False)
+
+
+def carry_context(func):
+    """
+    Wrap func to run on another thread with the calling thread's cancel token
+    and rate priority, e.g. when an agent fans its upstream calls out to a pool
+    """
+    token = current_token()
+    background = is_background()
+
+    def run(*args, **kwargs):
+        _local.background = background
+        with bind(token):
+            return func(*args, **kwargs)
+
+    return run
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at a fixed rate"""
+
+    def __init__(self, rate_per_second, capacity):
+        """
+        Args:
+            rate_per_second: Tokens added per second
+            capacity: Maximum tokens held (allowed burst)
+        """
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1, deadline=None, reserve=0):
+        """
+        Block until `tokens` are available and consume them
+
+        Args:
+            tokens: Number of tokens to consume
+            deadline: time.monotonic() value after which to give up
+            reserve: Tokens that must remain in the bucket afterwards
+                     (kept for live traffic when the caller is background work)
+
+        Returns:
+            True if the tokens were consumed, False if the deadline passed
+        """
+        tokens = min(tokens, self.capacity)
+        reserve = min(reserve, self.capacity - tokens)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens - reserve >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens + reserve - self._tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(min(wait, CANCEL_POLL_INTERVAL))
+            check_cancelled()
+
+
+class ProviderLimiter:
+    """Token bucket plus in-flight cap for one provider (and optionally one API key)"""
+
+    def __init__(self, name, requests_per_minute, burst, max_in_flight, background_share=BACKGROUND_SHARE):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        # Background work gets its own smaller bucket and slot cap on top of the shared ones
+        self.background_bucket = TokenBucket(requests_per_minute * background_share / 60.0,
+                                             max(1, int(burst * background_share)))
+        self._background_slots = threading.BoundedSemaphore(max(1, int(max_in_flight * background_share)))
+        self._background_reserve = burst * (1 - background_share)
+        # Total seconds callers spent queued in acquire() (see total_wait_seconds)
+        self.wait_seconds = 0.0
+        self._wait_lock = threading.Lock()
+
+    def _acquire_slot(self, slots, deadline):
+        while not slots.acquire(timeout=CANCEL_POLL_INTERVAL):
+            check_cancelled()
+            if deadline is not None and time.monotonic() > deadline:
+                raise RateLimitTimeout(f"Timed out waiting for a {self.name} slot")
+
+    def acquire(self, cost=1, timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        """
+        Wait for an in-flight slot, then for `cost` tokens
+
+        Background threads (see mark_background_thread) must also fit in the
+        background share and may not dip into the burst kept for live traffic.
+        They wait for their tokens before taking a shared slot, so a throttled
+        background call never holds a slot live requests could use.
+
+        Raises:
+            RateLimitTimeout: If no slot was free before the timeout
+            AnalysisCancelled: If the calling request was cancelled while queued
+        """
+        started = time.monotonic()
+        try:
+            self._acquire(cost, timeout)
+        finally:
+            with self._wait_lock:
+                self.wait_seconds += time.monotonic() - started
+
+    def _acquire(self, cost, timeout):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        background = is_background()
+        check_cancelled()
+        if not background:
+            self._acquire_slot(self._slots, deadline)
+            try:
+                if not self.bucket.acquire(cost, deadline):
+                    raise RateLimitTimeout(f"Timed out waiting for {self.name} rate limit")
+            except BaseException:
+                self._slots.release()
+                raise
+            return
+
+        self._acquire_slot(self._background_slots, deadline)
+        try:
+            if not self.background_bucket.acquire(cost, deadline):
+                raise RateLimitTimeout(f"Timed out waiting for {self.name} background rate limit")
+            if not self.bucket.acquire(cost, deadline, self._background_reserve):
+                raise RateLimitTimeout(f"Timed out waiting for {self.name} rate limit")
+            self._acquire_slot(self._slots, deadline)
+        except BaseException:
+            self._background_slots.release()
+            raise
+
+    def release(self):
+        self._slots.release()
+        if is_background():
+            self._background_slots.release()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _key_fingerprint(api_key):
+    """Short stable id for an API key so keys never appear in limiter names or logs"""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:8]
+
+
+def get_limiter(provider, api_key=None):
+    """
+    Get the shared limiter for a provider, scoped to an API key if given
+
+    Shared by the threads of this process only (see the module docstring).
+
+    Args:
+        provider: Provider name (see PROVIDER_LIMITS)
+        api_key: Optional API key; each key gets its own budget
+
+    Returns:
+        ProviderLimiter instance shared across threads
+    """
+    name = provider if not api_key else f"{provider}:{_key_fingerprint(api_key)}"
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = ProviderLimiter(name, **_provider_config(provider))
+            _limiters[name] = limiter
+        return limiter
+
+
+def total_wait_seconds():
+    """Seconds spent queued in every limiter of this process, summed over threads"""
+    with _limiters_lock:
+        return sum(limiter.wait_seconds for limiter in _limiters.values())
+
+
+def reset_limiters():
+    """
+    Drop every limiter, so the next calls start with full buckets and free slots
+
+    For benchmarks that must not carry one pass's backlog into the next; call
+    it only while no upstream call is in flight.
+    """
+    with _limiters_lock:
+        _limiters.clear()
+
+
+@contextmanager
+def limit(provider, api_key=None, cost=1):
+    """
+    Hold a provider slot for the duration of an upstream call
+
+    Args:
+        provider: Provider name (see PROVIDER_LIMITS)
+        api_key: Optional API key the call is billed to
+        cost: Tokens to consume (e.g. 2 for an embed + generate RAG call)
+
+    Example:
+        with limit("gemini", agent_key, cost=2):
+            response = rag_query(rag_q, api_key=agent_key)
+    """
+    limiter = get_limiter(provider, api_key)
+    limiter.acquire(cost)
+    try:
+        yield limiter
+    finally:
+        limiter.release()
+
+
+def _configured_gemini_keys():
+    """Number of distinct Gemini API keys configured for agents"""
+    keys = {value for name, value in os.environ.items() if "GEMINI_API_KEY" in name and value}
+    return max(len(keys), 1)
+
+
+def recommended_executor_size(min_workers=8, max_workers=32):
+    """
+    Derive the agent executor size from the provider limits
+
+    Agent threads block inside the limiters while queued, so the pool needs
+    enough workers to keep every provider's in-flight budget busy.
+    """
+    total = 0
+    for provider in PROVIDER_LIMITS:
+        slots = _provider_config(provider)["max_in_flight"]
+        if provider == "gemini":
+            slots *= _configured_gemini_keys()
+        total += slots
+    return max(min_workers, min(total, max_workers))
@@ -0,0 +1,108 @@
+"""
+Records for MoleculeInsight
+Compact record types for fetched trials, patents and trade rows
+
+Fetchers convert each API object into one of these as soon as it is parsed,
+and data_processor and the agents read the fields as attributes. A record
+has fixed __slots__ (no per-instance dict), plain scalar fields instead of
+single-item lists, and interned strings for low-cardinality labels
+(phases, statuses, sponsors, countries), so thousands of records share one
+copy of each label.
+"""
+
+import sys
+
+_intern = sys.intern
+
+
+def intern_label(value):
+    """Interned copy of a string label (other values are returned unchanged)"""
+    return _intern(value) if type(value) is str else value
+
+
+class Record:
+    """Base for the record types: equality, repr and dict export over __slots__"""
+
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def to_dict(self):
+        """JSON-ready copy (tuples become lists)"""
+        record = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            record[name] = list(value) if isinstance(value, tuple) else value
+        return record
+
+
+class Trial(Record):
+    """One ClinicalTrials.gov study (see data_processor.study_to_trial)"""
+
+    __slots__ = ("nct_id", "phase", "status", "start_date", "sponsor", "enrollment", "countries")
+
+    def __init__(self, nct_id=None, phase="Unknown", status="Unknown", start_date=None,
+                 sponsor="Unknown", enrollment=0, countries=()):
+        """
+        Args:
+            nct_id: NCT identifier
+            phase: First listed phase
+            status: Overall status
+            start_date: ISO start date, or None when the study has none
+            sponsor: Lead sponsor name
+            enrollment: Enrollment count
+            countries: Distinct location countries, in first-listed order
+        """
+        self.nct_id = nct_id
+        self.phase = intern_label(phase)
+        self.status = intern_label(status)
+        self.start_date = start_date
+        self.sponsor = intern_label(sponsor)
+        self.enrollment = enrollment
+        self.countries = tuple(intern_label(c) for c in countries)
+
+
+class Patent(Record):
+    """One PatentsView patent (see data_processor.patent_record)"""
+
+    __slots__ = ("title", "date", "assignees", "assignee_countries", "cpcs")
+
+    def __init__(self, title=None, date=None, assignees=(), assignee_countries=(), cpcs=()):
+        """
+        Args:
+            title: Patent title
+            date: ISO grant date, or None
+            assignees: Assignee organizations
+            assignee_countries: Country of each assignee (parallel to assignees)
+            cpcs: CPC subsection ids
+        """
+        self.title = title
+        self.date = date
+        self.assignees = tuple(intern_label(a) for a in assignees)
+        self.assignee_countries = tuple(intern_label(c) for c in assignee_countries)
+        self.cpcs = tuple(intern_label(c) for c in cpcs)
+
+
+class TradeRow(Record):
+    """One UN Comtrade record (see data_processor.trade_record)"""
+
+    __slots__ = ("year", "value", "flow", "reporter")
+
+    def __init__(self, year=None, value=0, flow="", reporter="Unknown"):
+        """
+        Args:
+            year: Reporting year
+            value: Trade value in USD
+            flow: Lower-case trade flow ("import", "export", "re-export", ...)
+            reporter: Reporting country
+        """
+        self.year = year
+        self.value = value
+        self.flow = intern_label(flow)
+        self.reporter = intern_label(reporter)
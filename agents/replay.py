@@ -0,0 +1,348 @@
+"""
+Record/Replay for MoleculeInsight
+Captures upstream HTTP and LLM exchanges to fixture files and plays them back offline
+
+Modes (REPLAY_MODE):
+    off         Every call goes upstream (default)
+    record      Calls go upstream and each exchange is saved under REPLAY_DIR
+    replay      Calls are answered from fixtures; a missing fixture fails the
+                call like an upstream error
+    synthesize  Like replay, but a missing fixture is answered from the sample
+                API responses in RAG/KnowledgeBase (and a placeholder for LLMs)
+
+Replayed calls wait for the latency recorded with the fixture (times
+REPLAY_LATENCY_SCALE), or for a fixed REPLAY_LATENCY_MS, so orchestration
+can be profiled deterministically without network or API keys.
+"""
+
+import os
+import io
+import json
+import time
+import hashlib
+import threading
+from collections import Counter
+from urllib.parse import urlsplit
+
+import requests
+
+from cancellation import sleep as cancellable_sleep
+
+MODES = ("off", "record", "replay", "synthesize")
+
+REPLAY_MODE = os.getenv("REPLAY_MODE", "off").lower()
+
+# Fixture tree: <dir>/http/<host>/<key>.json and <dir>/llm/<kind>/<key>.json
+# The default agents/fixtures is git-ignored: recordings hold real API responses
+REPLAY_DIR = os.getenv("REPLAY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+
+# Fixed delay per replayed call in milliseconds; unset means use the recorded latency
+REPLAY_LATENCY_MS = os.getenv("REPLAY_LATENCY_MS")
+
+# Multiplier on recorded latencies (0 replays as fast as possible)
+REPLAY_LATENCY_SCALE = float(os.getenv("REPLAY_LATENCY_SCALE", "1.0"))
+
+# Times each sample record is repeated in synthesized responses, to profile larger result sets
+REPLAY_SYNTH_REPEAT = int(os.getenv("REPLAY_SYNTH_REPEAT", "1"))
+
+# Query parameters left out of fixture keys and files (credentials)
+REDACTED_PARAMS = {"apiKey", "api_key", "key", "subscription-key"}
+
+# Response headers worth keeping in fixtures
+KEPT_HEADERS = ("Content-Type", "Retry-After")
+
+KNOWLEDGE_BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "RAG", "KnowledgeBase")
+
+
+class FixtureMissing(requests.RequestException):
+    """No fixture for a call in replay mode (fails the call without retries)"""
+
+
+class ReplayResponse:
+    """The parts of requests.Response the agents use, over a recorded body"""
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.content = content
+        self.raw = io.BytesIO(content)
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+    def close(self):
+        self.raw.close()
+
+
+class Replay:
+    """
+    Routes HTTP and LLM calls through fixtures according to the mode
+
+    Hooks:
+        http_client.HttpClient sends every request through http()
+        Agents wrap Gemini and RAG calls in llm()
+    """
+
+    def __init__(self, mode=REPLAY_MODE, fixtures_dir=REPLAY_DIR, latency_ms=REPLAY_LATENCY_MS,
+                 latency_scale=REPLAY_LATENCY_SCALE, synth_repeat=REPLAY_SYNTH_REPEAT):
+        """
+        Args:
+            mode: One of MODES
+            fixtures_dir: Root of the fixture tree
+            latency_ms: Fixed delay per replayed call, or None to use recorded latencies
+            latency_scale: Multiplier on recorded latencies
+            synth_repeat: Times each sample record is repeated in synthesized responses
+        """
+        self.mode = mode
+        self.fixtures_dir = fixtures_dir
+        self.latency_ms = float(latency_ms) if latency_ms else None
+        self.latency_scale = latency_scale
+        self.synth_repeat = synth_repeat
+        if mode not in MODES:
+            raise ValueError(f"REPLAY_MODE must be one of {', '.join(MODES)}, not {mode!r}")
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def configure(self, **settings):
+        """
+        Change settings at runtime, e.g. replay.configure(mode="synthesize", latency_ms=50)
+
+        Benchmarks use this to switch modes without re-importing the agents.
+        """
+        for name, value in settings.items():
+            if name not in ("mode", "fixtures_dir", "latency_ms", "latency_scale", "synth_repeat"):
+                raise TypeError(f"Unknown replay setting: {name}")
+            if name == "mode" and value not in MODES:
+                raise ValueError(f"REPLAY_MODE must be one of {', '.join(MODES)}, not {value!r}")
+            setattr(self, name, value)
+
+    def _count(self, source, name):
+        with self._lock:
+            self.counts[(source, name)] += 1
+
+    def _path(self, group, name, key):
+        return os.path.join(self.fixtures_dir, group, name.replace(":", "_"), f"{key}.json")
+
+    def _load(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save(self, path, fixture):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so a concurrent reader never sees a partial fixture
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(fixture, f, indent=1, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def _wait(self, recorded_seconds):
+        """Inject the configured latency for one replayed call"""
+        if self.latency_ms is not None:
+            seconds = self.latency_ms / 1000
+        else:
+            seconds = (recorded_seconds or 0) * self.latency_scale
+        if seconds > 0:
+            cancellable_sleep(seconds)
+
+    # ------------------------------------------------------------------
+    # HTTP
+
+    def http(self, method, url, kwargs, send):
+        """
+        Answer one HTTP request according to the mode
+
+        Args:
+            method: HTTP method
+            url: Absolute URL (without query string)
+            kwargs: requests keyword arguments (params, json, data, headers, ...)
+            send: Callable performing the real request
+
+        Returns:
+            The upstream response (mode off) or a ReplayResponse
+
+        Raises:
+            FixtureMissing: In replay mode when no fixture matches
+        """
+        if self.mode == "off":
+            return send()
+
+        request = _http_request(method, url, kwargs)
+        host = urlsplit(url).netloc
+        path = self._path("http", host, _key(request))
+
+        if self.mode == "record":
+            start = time.perf_counter()
+            response = send()
+            try:
+                content = response.content
+                fixture = {
+                    "request": request,
+                    "status": response.status_code,
+                    "headers": {h: response.headers[h] for h in KEPT_HEADERS if h in response.headers},
+                    "body": content.decode("utf-8", errors="replace"),
+                    "elapsed": round(time.perf_counter() - start, 4),
+                }
+            finally:
+                response.close()
+            self._save(path, fixture)
+            self._count("recorded", host)
+            return ReplayResponse(url, fixture["status"], fixture["headers"], content)
+
+        fixture = self._load(path)
+        if fixture is not None:
+            self._count("fixture", host)
+            self._wait(fixture.get("elapsed"))
+            return ReplayResponse(url, fixture["status"], fixture.get("headers", {}),
+                                  fixture["body"].encode("utf-8"))
+
+        body = self._synthesize_http(host, request) if self.mode == "synthesize" else None
+        if body is None:
+            raise FixtureMissing(f"No replay fixture for {method} {request['url']} ({path})")
+        self._count("synthesized", host)
+        self._wait(None)
+        return ReplayResponse(url, 200, {"Content-Type": "application/json"}, json.dumps(body).encode("utf-8"))
+
+    def _sample(self, file_name):
+        """One KnowledgeBase sample response, loaded once"""
+        sample = self._samples.get(file_name)
+        if sample is None:
+            with open(os.path.join(KNOWLEDGE_BASE_DIR, file_name), "r", encoding="utf-8") as f:
+                sample = json.load(f)
+            self._samples[file_name] = sample
+        return sample
+
+    def _synthesize_http(self, host, request):
+        """
+        Build an API response from the KnowledgeBase samples
+
+        The samples are real responses for one molecule, so every query gets
+        the same records; paging, page sizes and totals follow the request.
+
+        Returns:
+            JSON-ready body, or None for hosts with no sample
+        """
+        params = request.get("params", {})
+        if "clinicaltrials.gov" in host:
+            studies = self._sample("clinicaltrials.json")["studies"] * self.synth_repeat
+            statuses = params.get("filter.overallStatus")
+            if statuses:
+                wanted = set(statuses.split(","))
+                studies = [s for s in studies
+                           if s.get("protocolSection", {}).get("statusModule", {}).get("overallStatus") in wanted]
+            start = int(params.get("pageToken", 0))
+            end = start + int(params.get("pageSize", 10))
+            body = {"studies": studies[start:end]}
+            if end < len(studies):
+                body["nextPageToken"] = str(end)
+            if params.get("countTotal") == "true":
+                body["totalCount"] = len(studies)
+            return body
+        if "patentsview" in host:
+            patents = [_legacy_patent(p) for p in self._sample("PatentSearchResponse.json")["patents"]]
+            patents *= self.synth_repeat
+            options = (request.get("json") or {}).get("o", {})
+            per_page = int(options.get("per_page", 25))
+            start = (int(options.get("page", 1)) - 1) * per_page
+            page = patents[start:start + per_page]
+            return {"patents": page, "count": len(page), "total_patent_count": len(patents)}
+        if "newsapi.org" in host:
+            articles = self._sample("newsAPI.json")["articles"] * self.synth_repeat
+            return {"status": "ok", "totalResults": len(articles),
+                    "articles": articles[:int(params.get("pageSize", 100))]}
+        if "comtrade" in host:
+            # No trade sample in the KnowledgeBase; an empty dataset exercises the no-data path
+            return {"dataset": []}
+        return None
+
+    # ------------------------------------------------------------------
+    # LLM
+
+    def llm(self, kind, prompt, call):
+        """
+        Answer one LLM call according to the mode
+
+        Args:
+            kind: Call type; "rag" results are {"answer": ...} dicts, anything
+                  else (e.g. "gemini") is the response text
+            prompt: Full prompt text (the fixture key)
+            call: Callable making the real call and returning a JSON-ready result
+
+        Raises:
+            FixtureMissing: In replay mode when no fixture matches
+        """
+        if self.mode == "off":
+            return call()
+
+        path = self._path("llm", kind, _key({"kind": kind, "prompt": prompt}))
+
+        if self.mode == "record":
+            start = time.perf_counter()
+            result = call()
+            self._save(path, {"kind": kind, "prompt": prompt, "response": result,
+                              "elapsed": round(time.perf_counter() - start, 4)})
+            self._count("recorded", kind)
+            return result
+
+        fixture = self._load(path)
+        if fixture is not None:
+            self._count("fixture", kind)
+            self._wait(fixture.get("elapsed"))
+            return fixture["response"]
+
+        if self.mode != "synthesize":
+            raise FixtureMissing(f"No replay fixture for {kind} prompt ({path})")
+        self._count("synthesized", kind)
+        self._wait(None)
+        answer = f"## Synthesized {kind} response\n\nOffline placeholder for a {len(prompt)}-character prompt."
+        return {"answer": answer} if kind == "rag" else answer
+
+    def report(self):
+        """Calls served so far, as {source: {host or kind: count}}"""
+        with self._lock:
+            counts = dict(self.counts)
+        report = {}
+        for (source, name), count in sorted(counts.items()):
+            report.setdefault(source, {})[name] = count
+        return report
+
+
+def _http_request(method, url, kwargs):
+    """The identifying parts of a request, with credentials removed"""
+    params = {k: str(v) for k, v in (kwargs.get("params") or {}).items()
+              if v is not None and k not in REDACTED_PARAMS}
+    request = {"method": method.upper(), "url": url, "params": params}
+    if kwargs.get("json") is not None:
+        request["json"] = kwargs["json"]
+    elif kwargs.get("data") is not None:
+        request["data"] = str(kwargs["data"])
+    return request
+
+
+def _key(request):
+    """Stable fixture name for a request description"""
+    encoded = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:32]
+
+
+def _legacy_patent(patent):
+    """A PatentSearch API sample patent in the legacy PatentsView shape fetch_patent_page reads"""
+    patent = dict(patent)
+    patent["cpcs"] = [{"cpc_subsection_id": c.get("cpc_class_id")} for c in patent.get("cpc_current") or []]
+    return patent
+
+
+# Global instance shared by the HTTP client and the agents
+replay = Replay()
@@ -0,0 +1,273 @@
+"""
+File cache tests for MoleculeInsight
+Runs the FileCacheBackend (and CacheManager on it) in a temporary directory
+
+Usage:
+    python -m pytest agents/tests
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+agents_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, agents_dir)
+# Keep the global cache_manager off the on-disk cache
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+from cache_backends import FileCacheBackend, encode_entry
+from cache_manager import CacheManager
+from cancellation import AnalysisCancelled, CancelToken, bind
+
+TTL_POLICIES = {
+    "Fresh": {"ttl_hours": 24, "stale_hours": 0},
+    # Past its TTL as soon as it is written, but still servable for an hour
+    "Stale": {"ttl_hours": 0, "stale_hours": 1},
+}
+
+
+class FileCacheBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def backend(self, **kwargs):
+        backend = FileCacheBackend(self.cache_dir, **kwargs)
+        backend.initialize(lambda agent: 3600)
+        return backend
+
+    def write(self, backend, key, size, created=None, expires=None):
+        created = created or time.time()
+        return backend.write(key, b"x" * size, "Agent", key, created, expires or created + 3600)
+
+    def test_manifest_totals(self):
+        backend = self.backend()
+        self.write(backend, "a", 100)
+        self.write(backend, "b", 50)
+        self.write(backend, "a", 10)
+        self.assertEqual(backend.stats(time.time())["count"], 2)
+        self.assertEqual(backend.stats(time.time())["total_bytes"], 60)
+        backend.delete(["a"])
+        self.assertEqual(backend.manifest.totals(), (1, 50))
+        self.assertEqual(backend.clear(), 1)
+        self.assertEqual(backend.manifest.totals(), (0, 0))
+
+    def test_writes_are_atomic_and_replace_legacy_files(self):
+        backend = self.backend()
+        legacy = backend._get_legacy_cache_path("a")
+        legacy.write_bytes(b'{"legacy": true}')
+        self.write(backend, "a", 10)
+        self.assertEqual(backend.read("a"), b"x" * 10)
+        self.assertFalse(legacy.exists())
+        self.assertEqual([p.name for p in backend.cache_dir.iterdir() if p.suffix == ".tmp"], [])
+
+    def test_lru_eviction_keeps_recently_read_entries(self):
+        backend = self.backend(max_disk_bytes=250)
+        now = time.time()
+        self.write(backend, "old", 100, created=now - 30)
+        self.write(backend, "read", 100, created=now - 20)
+        backend.touch("old", now - 10)
+        evicted = self.write(backend, "new", 100, created=now)
+        self.assertEqual(evicted, ["read"])
+        self.assertIsNone(backend.read("read"))
+        self.assertLessEqual(backend.manifest.totals()[1], 250)
+
+    def test_lfu_eviction_keeps_frequently_read_entries(self):
+        backend = self.backend(max_disk_bytes=250, eviction_policy="lfu")
+        now = time.time()
+        self.write(backend, "popular", 100, created=now - 30)
+        self.write(backend, "rare", 100, created=now - 20)
+        backend.touch("popular", now - 25, hits=5)
+        backend.touch("rare", now - 5, hits=1)
+        self.assertEqual(self.write(backend, "new", 100, created=now), ["rare"])
+
+    def test_expired_entries_evicted_first(self):
+        backend = self.backend(max_disk_bytes=250)
+        now = time.time()
+        self.write(backend, "expired", 100, created=now - 30, expires=now - 1)
+        self.write(backend, "live", 100, created=now - 60)
+        self.assertEqual(self.write(backend, "new", 100, created=now), ["expired"])
+
+    def test_manifest_rebuilt_from_existing_files(self):
+        backend = self.backend()
+        blob, _ = encode_entry({"timestamp": "2026-01-01T00:00:00", "agent": "Agent",
+                                "molecule": "aspirin", "data": 1})
+        backend._get_cache_path("a").write_bytes(blob)
+        backend.manifest._conn.close()
+        os.remove(os.path.join(self.cache_dir, "manifest.sqlite3"))
+        self.assertEqual(self.backend().stats(time.time())["count"], 1)
+
+
+class FileCacheManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = CacheManager(cache_dir=self.cache_dir, ttl_policies=TTL_POLICIES)
+
+    def tearDown(self):
+        self.cache._refresh_executor.shutdown(wait=True)
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def wait_for_refresh(self):
+        deadline = time.monotonic() + 5
+        while self.cache._refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_stale_entry_served_then_refreshed_once(self):
+        self.cache.set("Stale", "aspirin", "old")
+        release = threading.Event()
+        calls = []
+
+        def loader():
+            calls.append(1)
+            release.wait(5)
+            return "new"
+
+        # Every stale read is answered at once; only one refresh runs
+        self.assertEqual(self.cache.fetch("Stale", "aspirin", loader), ("old", "stale"))
+        self.assertEqual(self.cache.fetch("Stale", "aspirin", loader), ("old", "stale"))
+        release.set()
+        self.wait_for_refresh()
+        self.assertEqual(len(calls), 1)
+        self.cache.memory.clear()
+        self.assertEqual(self.cache.fetch("Stale", "aspirin", loader), ("new", "stale"))
+
+    def test_failed_refresh_keeps_stale_entry(self):
+        self.cache.set("Stale", "aspirin", "old")
+
+        def loader():
+            raise RuntimeError("upstream down")
+
+        self.assertEqual(self.cache.fetch("Stale", "aspirin", loader), ("old", "stale"))
+        self.wait_for_refresh()
+        self.cache.memory.clear()
+        self.assertEqual(self.cache.fetch("Stale", "aspirin", loader), ("old", "stale"))
+
+    def test_concurrent_misses_fill_once(self):
+        calls, results = [], []
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.2)
+            return "report"
+
+        threads = [threading.Thread(target=lambda: results.append(self.cache.fetch("Fresh", "aspirin", loader)))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(status for _, status in results), ["fresh", "fresh", "miss"])
+
+    def test_memory_tier_max_age(self):
+        cache = CacheManager(cache_dir=self.cache_dir, ttl_policies=TTL_POLICIES, memory_max_age_seconds=0.05)
+        cache.set("Fresh", "aspirin", 1)
+        cache_key = cache._get_cache_key("Fresh", "aspirin")
+        self.assertIsNotNone(cache.memory.get(cache_key))
+        time.sleep(0.1)
+        self.assertIsNone(cache.memory.get(cache_key))
+        # Re-read from the backend and held again
+        self.assertEqual(cache.get("Fresh", "aspirin"), 1)
+        self.assertIsNotNone(cache.memory.get(cache_key))
+        cache._refresh_executor.shutdown(wait=True)
+
+
+class FileFillLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.backend = FileCacheBackend(self.cache_dir)
+        self.backend.initialize(lambda agent: 3600)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _hold(self, key, started, release):
+        """Hold `key`'s fill lock on another thread until `release` is set"""
+        def run():
+            with self.backend.fill_lock(key):
+                started.set()
+                release.wait(5)
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.assertTrue(started.wait(5))
+        return thread
+
+    def test_different_keys_fill_at_once(self):
+        started, release = threading.Event(), threading.Event()
+        holder = self._hold("key-a", started, release)
+        try:
+            began = time.monotonic()
+            with self.backend.fill_lock("key-b") as held:
+                self.assertTrue(held)
+            self.assertLess(time.monotonic() - began, 1)
+            # A refresh of an unrelated key is never skipped
+            with self.backend.fill_lock("key-c", blocking=False) as held:
+                self.assertTrue(held)
+        finally:
+            release.set()
+            holder.join()
+
+    def test_same_key_waits_for_holder(self):
+        started, release = threading.Event(), threading.Event()
+        holder = self._hold("key-a", started, release)
+        with self.backend.fill_lock("key-a", blocking=False) as held:
+            self.assertFalse(held)
+        threading.Timer(0.3, release.set).start()
+        began = time.monotonic()
+        with self.backend.fill_lock("key-a") as held:
+            self.assertTrue(held)
+            self.assertGreaterEqual(time.monotonic() - began, 0.2)
+        holder.join()
+
+    def test_nested_fill_on_same_thread(self):
+        with self.backend.fill_lock("key-a") as outer:
+            with self.backend.fill_lock("key-a") as inner:
+                self.assertTrue(outer and inner)
+
+    def test_cancelled_waiter_gives_up(self):
+        started, release = threading.Event(), threading.Event()
+        holder = self._hold("key-a", started, release)
+        token = CancelToken()
+        token.cancel("test")
+        try:
+            with bind(token):
+                with self.assertRaises(AnalysisCancelled):
+                    with self.backend.fill_lock("key-a"):
+                        pass
+        finally:
+            release.set()
+            holder.join()
+
+    def test_lock_files_removed_with_entries(self):
+        with self.backend.fill_lock("key-a"):
+            self.backend.write("key-a", b"data", "Agent", "aspirin", time.time(), time.time() + 60)
+        self.assertTrue(self.backend._lock_path("key-a").exists())
+        self.backend.delete(["key-a"])
+        self.assertFalse(self.backend._lock_path("key-a").exists())
+        self.assertEqual(self.backend._key_locks, {})
+
+    def test_lock_survives_delete_while_held(self):
+        with self.backend.fill_lock("key-a"):
+            self.backend.delete(["key-a"])
+            # Still held: another fill of the key cannot take it
+            with self.backend.fill_lock("key-a", blocking=False) as held:
+                self.assertTrue(held)  # nested on this thread
+            results = []
+            other = threading.Thread(
+                target=lambda: results.append(self.backend.fill_lock("key-a", blocking=False).__enter__()))
+            other.start()
+            other.join()
+            self.assertEqual(results, [False])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+News store tests for MoleculeInsight
+Delta fetches, deduplication and fetch-failure backoff on an in-process backend
+
+Usage:
+    python -m pytest agents/tests
+"""
+
+import os
+import sys
+import unittest
+
+agents_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, agents_dir)
+# Keep the global cache_manager off the on-disk cache
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+from cache_backends import RedisCacheBackend, InProcessRedis
+from cache_manager import CacheManager
+from news_store import NewsStore
+
+
+class NewsStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = CacheManager(backend=RedisCacheBackend(InProcessRedis()))
+        self.store = NewsStore(cache=self.cache, refresh_minutes=15, retry_minutes=5)
+        self.calls = []
+
+    def tearDown(self):
+        self.cache._refresh_executor.shutdown(wait=True)
+
+    def test_dedup_by_url_and_title(self):
+        first = [
+            {"url": "https://www.example.com/a/", "title": "Aspirin trial starts", "publishedAt": "2026-01-02"},
+            {"url": "https://example.com/b", "title": "New aspirin formulation", "publishedAt": "2026-01-01"},
+        ]
+        new, stored = self.store.update("aspirin", lambda since: first)
+        self.assertEqual(len(new), 2)
+
+        second = [
+            # Same URL (scheme, www., query string and trailing slash ignored)
+            {"url": "http://example.com/a?utm=x", "title": "Other headline", "publishedAt": "2026-01-03"},
+            # Same headline under another URL
+            {"url": "https://mirror.example/b", "title": "New Aspirin formulation!", "publishedAt": "2026-01-03"},
+            {"url": "https://example.com/c", "title": "Aspirin supply update", "publishedAt": "2026-01-04"},
+        ]
+        fetches = []
+        new, stored = self.store.update("Aspirin", lambda since: fetches.append(since) or second, force=True)
+        self.assertEqual(fetches, ["2026-01-02"])
+        self.assertEqual([a["url"] for a in new], ["https://example.com/c"])
+        self.assertEqual([a["publishedAt"] for a in stored], ["2026-01-04", "2026-01-02", "2026-01-01"])
+
+    def test_refresh_interval_and_ingestion_tracking(self):
+        articles = [{"url": f"https://example.com/{i}", "publishedAt": f"2026-01-0{i}"} for i in range(1, 4)]
+        self.store.update("aspirin", lambda since: articles)
+        self.assertEqual(self.store.update("aspirin", self.failing_fetch), ([], self.store.articles("aspirin")))
+        self.assertEqual(self.calls, [])
+
+        pending = self.store.pending_ingestion("aspirin")
+        self.assertEqual(len(pending), 3)
+        self.store.mark_ingested("aspirin", pending[:2])
+        self.assertEqual(self.store.pending_ingestion("aspirin"), pending[2:])
+
+    def failing_fetch(self, since):
+        self.calls.append(since)
+        raise RuntimeError("NewsAPI unavailable")
+
+    def test_failed_fetch_backs_off(self):
+        with self.assertRaises(RuntimeError):
+            self.store.update("aspirin", self.failing_fetch)
+        # Within the retry window the store is read instead of fetching again
+        self.assertEqual(self.store.update("aspirin", self.failing_fetch), ([], []))
+        self.assertEqual(len(self.calls), 1)
+        with self.assertRaises(RuntimeError):
+            self.store.update("aspirin", self.failing_fetch, force=True)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_retry_after_backoff(self):
+        store = NewsStore(cache=self.cache, refresh_minutes=15, retry_minutes=0)
+        with self.assertRaises(RuntimeError):
+            store.update("aspirin", self.failing_fetch)
+        new, _ = store.update("aspirin", lambda since: [{"url": "https://a.example/1", "title": "A"}])
+        self.assertEqual(len(new), 1)
+        self.assertEqual(self.cache.load_document("NewsStore", "aspirin")["failed_at"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+Prompt builder tests for MoleculeInsight
+Budget fitting, ranking and display order of prompt sections
+
+Usage:
+    python -m pytest agents/tests
+"""
+
+import os
+import sys
+import unittest
+
+agents_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, agents_dir)
+
+from prompt_builder import PromptBuilder, estimate_tokens
+
+
+def sponsors(n):
+    return {f"Sponsor {i}": 1000 - i for i in range(n)}
+
+
+class PromptBuilderTest(unittest.TestCase):
+
+    def test_small_prompt_is_kept_whole(self):
+        prompt = (PromptBuilder("test", budget=500)
+                  .text("You are the agent.")
+                  .section("TOP SPONSORS", sponsors(3))
+                  .build())
+        self.assertIn("Sponsor 2: 998", prompt)
+        self.assertNotIn("omitted", prompt)
+
+    def test_trims_to_budget_keeping_top_ranked(self):
+        prompt = (PromptBuilder("test", budget=120)
+                  .text("You are the agent.")
+                  .section("TOP SPONSORS", sponsors(200), weight=2)
+                  .section("COUNTRIES", {f"Country {i}": 500 - i for i in range(100)})
+                  .build())
+        self.assertLessEqual(estimate_tokens(prompt), 120)
+        self.assertIn("Sponsor 0: 1000", prompt)
+        self.assertIn("Country 0: 500", prompt)
+        self.assertRegex(prompt, r"\.\.\. and \d+ more entries omitted")
+        # The heavier section keeps more of its facts
+        self.assertGreater(prompt.count("Sponsor "), prompt.count("Country "))
+
+    def test_unused_share_goes_to_other_sections(self):
+        prompt = (PromptBuilder("test", budget=200)
+                  .section("PHASES", {"PHASE1": 3, "PHASE2": 1})
+                  .section("TOP SPONSORS", sponsors(200))
+                  .build())
+        self.assertIn("PHASE2: 1", prompt)
+        self.assertGreater(prompt.count("Sponsor "), 20)
+
+    def test_chronological_keeps_latest_in_time_order(self):
+        years = {str(year): year - 1990 for year in range(1990, 2026)}
+        prompt = (PromptBuilder("test", budget=40)
+                  .section("YEARWISE TREND", years, chronological=True)
+                  .build())
+        shown = [line.split(":")[0] for line in prompt.splitlines() if line[:2] in ("19", "20")]
+        self.assertEqual(shown[-1], "2025")
+        self.assertEqual(shown, sorted(shown))
+        self.assertNotIn("1990", shown)
+
+    def test_scalar_sections_always_kept(self):
+        prompt = (PromptBuilder("test", budget=30)
+                  .section("TOP SPONSORS", sponsors(200))
+                  .section("TOTAL TRIALS", 3500)
+                  .build())
+        self.assertIn("=== TOTAL TRIALS ===\n3500", prompt)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+"""
+Shared-cache tests for MoleculeInsight
+Runs CacheManager on a RedisCacheBackend backed by the InProcessRedis stand-in
+
+Usage:
+    python -m pytest agents/tests
+"""
+
+import os
+import sys
+import time
+import threading
+import unittest
+
+agents_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, agents_dir)
+# Keep the global cache_manager off the on-disk cache
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+from cache_backends import RedisCacheBackend, InProcessRedis
+from cache_manager import CacheManager
+
+TTL_POLICIES = {
+    "Fresh": {"ttl_hours": 24, "stale_hours": 0},
+    # Past its TTL as soon as it is written, but still servable for an hour
+    "Stale": {"ttl_hours": 0, "stale_hours": 1},
+}
+
+
+class RedisCacheManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = InProcessRedis()
+        self.backend = RedisCacheBackend(self.client, prefix="test:")
+        self.cache = CacheManager(backend=self.backend, ttl_policies=TTL_POLICIES)
+
+    def tearDown(self):
+        self.cache._refresh_executor.shutdown(wait=True)
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get("Fresh", "aspirin"))
+        self.cache.set("Fresh", "aspirin", {"trials": 3})
+        self.assertEqual(self.cache.get("Fresh", "aspirin"), {"trials": 3})
+        # Read back from the backend, not the memory tier
+        self.cache.memory.clear()
+        self.assertEqual(self.cache.get("Fresh", "Aspirin"), {"trials": 3})
+        self.assertIsNone(self.cache.get("Fresh", "aspirin", geography="EU"))
+
+    def test_fetch_fills_once(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return {"patents": 7}
+
+        self.assertEqual(self.cache.fetch("Fresh", "aspirin", loader), ({"patents": 7}, "miss"))
+        self.assertEqual(self.cache.fetch("Fresh", "aspirin", loader), ({"patents": 7}, "fresh"))
+        self.assertEqual(len(calls), 1)
+
+    def test_stale_entry_is_served_while_refreshing(self):
+        self.cache.set("Stale", "aspirin", "old")
+        refreshed = threading.Event()
+
+        def loader():
+            refreshed.set()
+            return "new"
+
+        self.assertEqual(self.cache.fetch("Stale", "aspirin", loader), ("old", "stale"))
+        self.assertTrue(refreshed.wait(5))
+        deadline = time.monotonic() + 5
+        while self.cache._refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.cache.memory.clear()
+        self.assertEqual(self.cache.fetch("Stale", "aspirin", loader)[0], "new")
+        # Stale entries are never returned by get()
+        self.assertIsNone(self.cache.get("Stale", "aspirin"))
+
+    def test_clear_all(self):
+        self.cache.set("Fresh", "aspirin", 1)
+        self.cache.set("Fresh", "ibuprofen", 2)
+        self.assertEqual(self.cache.clear_all(), 2)
+        self.assertIsNone(self.cache.get("Fresh", "aspirin"))
+        self.assertEqual(self.cache.get_cache_stats()["count"], 0)
+        self.assertEqual(self.cache.get_cache_stats()["total_bytes"], 0)
+
+    def test_clear_by_another_worker(self):
+        other = CacheManager(backend=RedisCacheBackend(self.client, prefix="test:"),
+                             ttl_policies=TTL_POLICIES, memory_max_age_seconds=0)
+        other.set("Fresh", "aspirin", 1)
+        self.assertEqual(self.cache.get("Fresh", "aspirin"), 1)
+        self.cache.clear_all()
+        # Past its memory max age, the other worker re-reads the shared backend
+        self.assertIsNone(other.get("Fresh", "aspirin"))
+        self.assertEqual(other._last_touched, {})
+        other._refresh_executor.shutdown(wait=True)
+
+    def test_memory_evictions_drop_access_bookkeeping(self):
+        small = CacheManager(backend=self.backend, ttl_policies=TTL_POLICIES, memory_max_entries=2)
+        for molecule in ("aspirin", "ibuprofen", "paracetamol"):
+            small.set("Fresh", molecule, molecule)
+            small.get("Fresh", molecule)
+        self.assertEqual(set(small._last_touched), set(small.memory._entries))
+        small._refresh_executor.shutdown(wait=True)
+
+    def test_documents_outlive_entries(self):
+        self.assertIsNone(self.cache.load_document("NewsStore", "aspirin"))
+        self.cache.save_document("NewsStore", "aspirin", {"articles": [1, 2]})
+        self.cache.clear_all()
+        self.assertEqual(self.cache.load_document("NewsStore", "Aspirin"), {"articles": [1, 2]})
+        self.assertEqual(self.cache.get_cache_stats()["count"], 0)
+
+    def test_lock_excludes_other_holders(self):
+        cache_key = self.cache._get_cache_key("Fresh", "aspirin")
+        with self.cache.lock("Fresh", "aspirin") as held:
+            self.assertTrue(held)
+            results = []
+            other = threading.Thread(
+                target=lambda: results.append(self.backend.fill_lock(cache_key, blocking=False).__enter__()))
+            other.start()
+            other.join()
+            self.assertEqual(results, [False])
+        with self.backend.fill_lock(cache_key, blocking=False) as held:
+            self.assertTrue(held)
+
+    def test_stats_running_totals(self):
+        self.cache.set("Fresh", "aspirin", "x" * 100)
+        self.cache.set("Fresh", "ibuprofen", "y")
+        stats = self.cache.get_cache_stats()
+        self.assertEqual(stats["count"], 2)
+        total = stats["total_bytes"]
+
+        self.cache.set("Fresh", "aspirin", "x")
+        stats = self.cache.get_cache_stats()
+        self.assertEqual(stats["count"], 2)
+        self.assertLess(stats["total_bytes"], total)
+
+        key = self.cache._get_cache_key("Fresh", "aspirin")
+        self.backend.delete([key])
+        self.backend.delete([key])
+        self.assertEqual(self.cache.get_cache_stats()["count"], 1)
+
+        # A store written before the totals existed is counted on start-up
+        self.client.delete("test:totals")
+        restarted = RedisCacheBackend(self.client, prefix="test:")
+        restarted.initialize(lambda agent: 3600)
+        self.assertEqual(restarted.stats(0), self.cache.get_cache_stats())
+
+    def test_prunes_entries_removed_by_server(self):
+        self.cache.set("Fresh", "aspirin", 1)
+        self.cache.set("Fresh", "ibuprofen", 2)
+        # Simulate maxmemory eviction of one entry string
+        evicted = self.cache._get_cache_key("Fresh", "aspirin")
+        self.client.delete(self.backend._entry_key(evicted))
+
+        self.backend._pruned_at = 0
+        self.cache.set("Fresh", "paracetamol", 3)
+        self.assertEqual(self.cache.get_cache_stats()["count"], 2)
+        self.assertIsNone(self.client.hget("test:meta", evicted))
+        self.assertIsNone(self.client.zscore("test:accessed", evicted))
+        self.assertIsNone(self.cache.get("Fresh", "aspirin"))
+        self.assertEqual(self.cache.get("Fresh", "ibuprofen"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
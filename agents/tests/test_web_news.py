@@ -0,0 +1,76 @@
+"""
+Web agent news tests for MoleculeInsight
+News refresh and retrieval when the news store is empty or NewsAPI is not configured
+
+Usage:
+    python -m pytest agents/tests
+"""
+
+import os
+import sys
+import unittest
+import importlib.util
+
+agents_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, agents_dir)
+sys.path.insert(0, os.path.join(agents_dir, "Agent-workers"))
+# Keep the global cache_manager off the on-disk cache
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+import web_agent
+from news_store import news_store
+
+RAG_AVAILABLE = all(importlib.util.find_spec(name) for name in ("chromadb", "google.generativeai"))
+
+
+class UnconfiguredNewsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.api_key = web_agent.NEWS_API_KEY
+        web_agent.NEWS_API_KEY = None
+
+    def tearDown(self):
+        web_agent.NEWS_API_KEY = self.api_key
+
+    def test_refresh_without_key_returns_empty_store(self):
+        self.assertEqual(web_agent.refresh_news("Unconfiguredmab", force=True), [])
+        self.assertEqual(news_store.articles("Unconfiguredmab"), [])
+        self.assertEqual(web_agent.ingest_new_articles("Unconfiguredmab"), 0)
+
+
+@unittest.skipUnless(RAG_AVAILABLE, "RAG dependencies (chromadb, google-generativeai) not installed")
+class NewsRetrievalTest(unittest.TestCase):
+
+    def setUp(self):
+        import chromadb
+        from app.utils import vectorstore
+        self.vectorstore = vectorstore
+        self.client = vectorstore._client
+        vectorstore._client = chromadb.EphemeralClient()
+        vectorstore.upsert_to_vectorstore(
+            documents=["Aspirin market snapshot", "Aspirin news snapshot"],
+            embeddings=[[1.0, 0.0], [0.9, 0.1]],
+            ids=["kb-1", "kb-2"],
+        )
+
+    def tearDown(self):
+        for name in web_agent.RAG_COLLECTIONS:
+            self.vectorstore._client.delete_collection(name)
+        self.vectorstore._client = self.client
+
+    def test_empty_news_collection_falls_back_to_knowledge_base(self):
+        self.assertIn(self.vectorstore.COLLECTION_NAME, web_agent.RAG_COLLECTIONS)
+        documents = self.vectorstore.query_collections([1.0, 0.0], web_agent.RAG_COLLECTIONS, n_results=5)
+        self.assertEqual(documents, ["Aspirin market snapshot", "Aspirin news snapshot"])
+
+    def test_news_and_knowledge_base_are_merged(self):
+        self.vectorstore.upsert_to_vectorstore(
+            documents=["Aspirin approved for new use"], embeddings=[[0.95, 0.05]], ids=["news-1-0"],
+            collection_name=self.vectorstore.NEWS_COLLECTION_NAME,
+        )
+        documents = self.vectorstore.query_collections([1.0, 0.0], web_agent.RAG_COLLECTIONS, n_results=2)
+        self.assertEqual(documents, ["Aspirin market snapshot", "Aspirin approved for new use"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+"""
+Cache Warm-up for MoleculeInsight
+Pre-populates agent cache entries for configured or popular molecules at background priority
+
+Usage:
+    python warmup.py                         # most requested over the last 7 days
+    python warmup.py Aspirin Metformin       # specific molecules
+    python warmup.py --top 50 --days 14 --concurrency 2
+    python warmup.py --dry-run               # list what would be warmed
+
+Background priority only orders calls within this process: the CLI gets its
+own rate limiter budget on top of the API workers' (see rate_limiter), so
+schedule it off-peak or lower WARMUP_CONCURRENCY on busy deployments.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+from cache_manager import cache_manager
+from molecule_names import canonical_molecule, molecule_key
+from rate_limiter import mark_background_thread
+
+# Comma-separated molecules always warmed, in addition to popular ones
+WARMUP_MOLECULES = [m.strip() for m in os.getenv("WARMUP_MOLECULES", "").split(",") if m.strip()]
+
+# How many of the most requested (molecule, query, geography) combinations to warm
+WARMUP_TOP = int(os.getenv("WARMUP_TOP", "20"))
+WARMUP_DAYS = int(os.getenv("WARMUP_DAYS", "7"))
+
+# Molecules analysed at once; each runs all agents, at background rate priority
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "1"))
+
+# Agent threads per molecule (seven agents, then the innovation agent)
+THREADS_PER_MOLECULE = 8
+
+
+def warmup_targets(molecules=None, top=WARMUP_TOP, days=WARMUP_DAYS):
+    """
+    Requests to replay, configured molecules first
+
+    Args:
+        molecules: Molecules to warm with an empty query (defaults to WARMUP_MOLECULES)
+        top: Number of popular requests to add from the request log (0 for none)
+        days: How far back the request log is read
+
+    Returns:
+        List of (molecule, query, geography) tuples, deduplicated
+    """
+    targets = [(canonical_molecule(m), "", "Global") for m in (molecules or WARMUP_MOLECULES)]
+    if top > 0:
+        for molecule, query, geography, _ in cache_manager.popular_requests(days=days, limit=top):
+            targets.append((canonical_molecule(molecule), query, geography))
+
+    unique = {}
+    for molecule, query, geography in targets:
+        unique.setdefault((molecule_key(molecule), query, geography), (molecule, query, geography))
+    return list(unique.values())
+
+
+async def warm_cache(run_analysis, targets, concurrency=WARMUP_CONCURRENCY):
+    """
+    Run the analysis for each target so every agent's cache entry is filled
+
+    Entries that are already fresh are cache hits and cost nothing. Agents run
+    on a private pool whose threads are marked as background work, so their
+    upstream calls only use the RATE_LIMIT_BACKGROUND_SHARE of each provider.
+
+    Args:
+        run_analysis: main.run_analysis
+        targets: (molecule, query, geography) tuples from warmup_targets
+        concurrency: Molecules analysed at once
+
+    Returns:
+        Summary dict with warmed/failed counts and elapsed seconds
+    """
+    start = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    pool = ThreadPoolExecutor(max_workers=concurrency * THREADS_PER_MOLECULE,
+                              thread_name_prefix="warmup", initializer=mark_background_thread)
+
+    async def warm(molecule, query, geography):
+        async with semaphore:
+            try:
+                results, _ = await run_analysis(molecule, query, geography, agent_executor=pool)
+                failed = [name for name, result in results.items()
+                          if isinstance(result, dict) and result.get("success") is False]
+                if failed:
+                    print(f"[Warmup] {molecule}: agents failed: {', '.join(failed)}")
+                else:
+                    print(f"[Warmup] {molecule}: warmed")
+                return not failed
+            except Exception as e:
+                print(f"[Warmup] {molecule}: {e}")
+                return False
+
+    try:
+        outcomes = await asyncio.gather(*(warm(*target) for target in targets))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    summary = {
+        "targets": len(targets),
+        "warmed": sum(outcomes),
+        "failed": len(outcomes) - sum(outcomes),
+        "seconds": round(time.perf_counter() - start, 1)
+    }
+    print(f"[Warmup] Done: {summary}")
+    return summary
+
+
+async def run_schedule(run_analysis, interval_minutes, initial_delay_seconds=30):
+    """
+    Warm the cache shortly after startup and then every `interval_minutes`
+
+    Started from the API's startup event when WARMUP_INTERVAL_MINUTES is set.
+    """
+    await asyncio.sleep(initial_delay_seconds)
+    while True:
+        try:
+            await warm_cache(run_analysis, warmup_targets())
+        except Exception as e:
+            print(f"[Warmup] Scheduled run failed: {e}")
+        await asyncio.sleep(interval_minutes * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("molecules", nargs="*", help="molecules to warm (default: WARMUP_MOLECULES)")
+    parser.add_argument("--top", type=int, default=None,
+                        help=f"popular requests to warm (default: {WARMUP_TOP}, or 0 when molecules are given)")
+    parser.add_argument("--days", type=int, default=WARMUP_DAYS, help="request history to rank by")
+    parser.add_argument("--concurrency", type=int, default=WARMUP_CONCURRENCY, help="molecules analysed at once")
+    parser.add_argument("--dry-run", action="store_true", help="list targets without running agents")
+    args = parser.parse_args()
+
+    top = args.top if args.top is not None else (0 if args.molecules else WARMUP_TOP)
+    targets = warmup_targets(args.molecules, top=top, days=args.days)
+    if not targets:
+        print("[Warmup] Nothing to warm: no molecules given and no recorded requests")
+        return
+    for molecule, query, geography in targets:
+        print(f"[Warmup] Target: {molecule} | query: {query or '-'} | {geography}")
+    if args.dry_run:
+        return
+
+    # Imported here so --dry-run does not load the API and its agents
+    from main import run_analysis
+    asyncio.run(warm_cache(run_analysis, targets, concurrency=args.concurrency))
+
+
+if __name__ == "__main__":
+    main()